@@ -0,0 +1,39 @@
+"""add token counts to history records
+
+Revision ID: 3f9a1c7e5b20
+Revises: 8e4f2b6a91c7
+Create Date: 2026-10-18 13:05:17.482913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a1c7e5b20'
+down_revision: Union[str, Sequence[str], None] = '8e4f2b6a91c7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user_messages', sa.Column('token_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('llm_responses', sa.Column('token_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill активной истории грубой оценкой (~4 символа на токен),
+    # новые записи получают оценку от TokenEstimator приложения
+    for table in ('user_messages', 'llm_responses'):
+        op.execute(f"""
+            UPDATE {table}
+            SET token_count = (content_length + 3) / 4
+            WHERE is_deleted = false
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('llm_responses', 'token_count')
+    op.drop_column('user_messages', 'token_count')
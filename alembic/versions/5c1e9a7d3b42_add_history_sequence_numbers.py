@@ -0,0 +1,64 @@
+"""add history sequence numbers for O(1) trimming
+
+Revision ID: 5c1e9a7d3b42
+Revises: bd7b2d0ee30e
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e9a7d3b42'
+down_revision: Union[str, Sequence[str], None] = 'bd7b2d0ee30e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversations', sa.Column('message_seq', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('conversations', sa.Column('response_seq', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('user_messages', sa.Column('seq', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('llm_responses', sa.Column('seq', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill: нумеруем существующие записи внутри диалога в хронологическом порядке
+    for table in ('user_messages', 'llm_responses'):
+        op.execute(f"""
+            UPDATE {table} AS t
+            SET seq = numbered.rn
+            FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY conversation_id ORDER BY timestamp, id
+                ) AS rn
+                FROM {table}
+            ) AS numbered
+            WHERE t.id = numbered.id
+        """)
+
+    # Head-счетчики диалогов = последний выданный номер
+    op.execute("""
+        UPDATE conversations AS c
+        SET message_seq = COALESCE(
+                (SELECT MAX(seq) FROM user_messages WHERE conversation_id = c.id), 0
+            ),
+            response_seq = COALESCE(
+                (SELECT MAX(seq) FROM llm_responses WHERE conversation_id = c.id), 0
+            )
+    """)
+
+    op.create_index('idx_user_messages_conversation_seq', 'user_messages', ['conversation_id', 'seq'], unique=False)
+    op.create_index('idx_llm_responses_conversation_seq', 'llm_responses', ['conversation_id', 'seq'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_llm_responses_conversation_seq', table_name='llm_responses')
+    op.drop_index('idx_user_messages_conversation_seq', table_name='user_messages')
+    op.drop_column('llm_responses', 'seq')
+    op.drop_column('user_messages', 'seq')
+    op.drop_column('conversations', 'response_seq')
+    op.drop_column('conversations', 'message_seq')
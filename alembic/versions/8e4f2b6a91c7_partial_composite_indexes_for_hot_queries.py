@@ -0,0 +1,72 @@
+"""partial composite indexes for hot queries
+
+Revision ID: 8e4f2b6a91c7
+Revises: 5c1e9a7d3b42
+Create Date: 2026-10-18 11:05:27.904113
+
+Индексы строятся CONCURRENTLY (без блокировки записи), поэтому миграция
+выполняется вне транзакции через autocommit_block.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e4f2b6a91c7'
+down_revision: Union[str, Sequence[str], None] = '5c1e9a7d3b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_conversations_user_created', 'conversations',
+            ['user_id', sa.text('created_at DESC')],
+            unique=False, postgresql_concurrently=True,
+        )
+        op.create_index(
+            'idx_user_messages_active_conversation_seq', 'user_messages',
+            ['conversation_id', sa.text('seq DESC')],
+            unique=False, postgresql_concurrently=True,
+            postgresql_where=sa.text('is_deleted = false'),
+        )
+        op.create_index(
+            'idx_llm_responses_active_conversation_seq', 'llm_responses',
+            ['conversation_id', sa.text('seq DESC')],
+            unique=False, postgresql_concurrently=True,
+            postgresql_where=sa.text('is_deleted = false'),
+        )
+        op.create_index(
+            'idx_user_messages_active_timestamp', 'user_messages',
+            ['timestamp'],
+            unique=False, postgresql_concurrently=True,
+            postgresql_where=sa.text('is_deleted = false'),
+        )
+
+        # Индексы, которые перекрываются новыми составными индексами
+        op.drop_index('idx_conversations_user_id', table_name='conversations', postgresql_concurrently=True)
+        op.drop_index('idx_user_messages_conversation_seq', table_name='user_messages', postgresql_concurrently=True)
+        op.drop_index('idx_llm_responses_conversation_seq', table_name='llm_responses', postgresql_concurrently=True)
+
+        # Индексы по boolean с низкой селективностью
+        op.drop_index('idx_user_messages_is_deleted', table_name='user_messages', postgresql_concurrently=True)
+        op.drop_index('idx_llm_responses_is_deleted', table_name='llm_responses', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('idx_llm_responses_is_deleted', 'llm_responses', ['is_deleted'], unique=False, postgresql_concurrently=True)
+        op.create_index('idx_user_messages_is_deleted', 'user_messages', ['is_deleted'], unique=False, postgresql_concurrently=True)
+        op.create_index('idx_llm_responses_conversation_seq', 'llm_responses', ['conversation_id', 'seq'], unique=False, postgresql_concurrently=True)
+        op.create_index('idx_user_messages_conversation_seq', 'user_messages', ['conversation_id', 'seq'], unique=False, postgresql_concurrently=True)
+        op.create_index('idx_conversations_user_id', 'conversations', ['user_id'], unique=False, postgresql_concurrently=True)
+
+        op.drop_index('idx_user_messages_active_timestamp', table_name='user_messages', postgresql_concurrently=True)
+        op.drop_index('idx_llm_responses_active_conversation_seq', table_name='llm_responses', postgresql_concurrently=True)
+        op.drop_index('idx_user_messages_active_conversation_seq', table_name='user_messages', postgresql_concurrently=True)
+        op.drop_index('idx_conversations_user_created', table_name='conversations', postgresql_concurrently=True)
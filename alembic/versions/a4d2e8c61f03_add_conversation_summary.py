@@ -0,0 +1,28 @@
+"""add conversation summary
+
+Revision ID: a4d2e8c61f03
+Revises: 3f9a1c7e5b20
+Create Date: 2026-10-18 14:21:09.615342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d2e8c61f03'
+down_revision: Union[str, Sequence[str], None] = '3f9a1c7e5b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversations', sa.Column('summary', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('conversations', 'summary')
@@ -0,0 +1,94 @@
+"""add turns table (message and reply in one row)
+
+Revision ID: c7b3f1e9d254
+Revises: a4d2e8c61f03
+Create Date: 2026-10-18 15:02:44.207518
+
+Backfill сопоставляет сообщению первый ответ, полученный после него и до
+следующего сообщения того же диалога. Сообщения, на которые ответа не было
+(ошибка LLM), становятся ходами с response = NULL.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7b3f1e9d254'
+down_revision: Union[str, Sequence[str], None] = 'a4d2e8c61f03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('conversations', sa.Column('turn_seq', sa.Integer(), server_default='0', nullable=False))
+    op.create_table(
+        'turns',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('conversation_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('user_text', sa.Text(), nullable=False),
+        sa.Column('user_content_length', sa.Integer(), nullable=False),
+        sa.Column('user_token_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('user_timestamp', sa.DateTime(), nullable=False),
+        sa.Column('response', sa.Text(), nullable=True),
+        sa.Column('response_content_length', sa.Integer(), nullable=True),
+        sa.Column('response_token_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('response_timestamp', sa.DateTime(), nullable=True),
+        sa.Column('model_used', sa.String(length=100), nullable=True),
+        sa.Column('is_deleted', sa.Boolean(), nullable=False),
+        sa.ForeignKeyConstraint(['conversation_id'], ['conversations.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+    op.execute("""
+        INSERT INTO turns (
+            conversation_id, user_id, seq,
+            user_text, user_content_length, user_token_count, user_timestamp,
+            response, response_content_length, response_token_count, response_timestamp,
+            model_used, is_deleted
+        )
+        SELECT
+            m.conversation_id, m.user_id,
+            ROW_NUMBER() OVER (PARTITION BY m.conversation_id ORDER BY m.timestamp, m.id),
+            m.text, m.content_length, m.token_count, m.timestamp,
+            r.content, r.content_length, COALESCE(r.token_count, 0), r.timestamp,
+            r.model_used, m.is_deleted
+        FROM (
+            SELECT um.*, LEAD(um.timestamp) OVER (
+                PARTITION BY um.conversation_id ORDER BY um.timestamp, um.id
+            ) AS next_timestamp
+            FROM user_messages AS um
+        ) AS m
+        LEFT JOIN LATERAL (
+            SELECT lr.content, lr.content_length, lr.token_count, lr.timestamp, lr.model_used
+            FROM llm_responses AS lr
+            WHERE lr.conversation_id = m.conversation_id
+              AND lr.timestamp >= m.timestamp
+              AND (m.next_timestamp IS NULL OR lr.timestamp < m.next_timestamp)
+            ORDER BY lr.timestamp, lr.id
+            LIMIT 1
+        ) AS r ON true
+    """)
+
+    op.execute("""
+        UPDATE conversations AS c
+        SET turn_seq = COALESCE((SELECT MAX(seq) FROM turns WHERE conversation_id = c.id), 0)
+    """)
+
+    op.create_index(
+        'idx_turns_active_conversation_seq', 'turns',
+        ['conversation_id', sa.text('seq DESC')],
+        unique=False,
+        postgresql_where=sa.text('is_deleted = false'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_turns_active_conversation_seq', table_name='turns')
+    op.drop_table('turns')
+    op.drop_column('conversations', 'turn_seq')
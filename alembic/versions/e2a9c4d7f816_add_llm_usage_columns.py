@@ -0,0 +1,50 @@
+"""add llm usage and latency columns
+
+Revision ID: e2a9c4d7f816
+Revises: c7b3f1e9d254
+Create Date: 2026-10-18 17:41:09.316254
+
+Колонки nullable без backfill: для ранее сохраненных ответов расход токенов
+и задержка неизвестны, метрики дашборда их пропускают.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2a9c4d7f816'
+down_revision: Union[str, Sequence[str], None] = 'c7b3f1e9d254'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+USAGE_COLUMNS = ('prompt_tokens', 'completion_tokens', 'latency_ms', 'first_token_ms')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ('llm_responses', 'turns'):
+        for column in USAGE_COLUMNS:
+            op.add_column(table, sa.Column(column, sa.Integer(), nullable=True))
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_llm_responses_timestamp_measured', 'llm_responses',
+            ['timestamp'],
+            unique=False, postgresql_concurrently=True,
+            postgresql_where=sa.text('latency_ms IS NOT NULL'),
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'idx_llm_responses_timestamp_measured', table_name='llm_responses',
+            postgresql_concurrently=True,
+        )
+
+    for table in ('turns', 'llm_responses'):
+        for column in reversed(USAGE_COLUMNS):
+            op.drop_column(table, column)
@@ -0,0 +1 @@
+"""Бенчмарки производительности (запускаются вручную, не входят в тесты)"""
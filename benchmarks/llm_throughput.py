@@ -0,0 +1,112 @@
+"""Бенчмарк пропускной способности LLMClient против fake LLM сервера
+
+Отправляет N уникальных запросов через LLMClient с общим пулом соединений
+и планировщиком (не более --concurrency одновременно) и выводит
+пропускную способность, перцентили задержки и количество ошибок.
+
+Перед нагрузкой выполняется пробный запрос и выводится согласованная версия
+HTTP. Fake LLM сервер (uvicorn) говорит только HTTP/1.1, а httpx включает
+HTTP/2 лишь через TLS (ALPN h2), поэтому --http2 требует HTTPS-сервера с
+HTTP/2 (например, fake сервера за прокси с TLS); иначе бенчмарк завершается
+ошибкой, а не измеряет молча HTTP/1.1.
+
+Запуск (в двух терминалах):
+    uv run python -m src.fake_llm_server --latency lognormal --latency-ms 300
+    uv run python -m benchmarks.llm_throughput --requests 1000 --concurrency 100
+
+HTTP/2 (за TLS-прокси с h2 перед fake сервером):
+    uv run python -m benchmarks.llm_throughput --http2 --max-connections 10 \\
+        --base-url https://localhost:8443/v1
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+import httpx
+
+from src.llm_client import LLMClient
+from src.llm_resilience import RetryPolicy
+from src.llm_scheduler import LLMScheduler
+from src.llm_transport import TransportSettings, create_http_client
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Перцентиль отсортированного списка (q в долях)"""
+    return values[min(int(q * len(values)), len(values) - 1)] if values else 0.0
+
+
+async def negotiated_http_version(http_client: httpx.AsyncClient, base_url: str) -> str:
+    """Версия HTTP, согласованная с сервером (пробный запрос к /models)"""
+    response = await http_client.get(f"{base_url.rstrip('/')}/models")
+    response.raise_for_status()
+    return response.http_version
+
+
+async def run(args: argparse.Namespace) -> None:
+    """Выполнить нагрузку и вывести результаты"""
+    http_client = create_http_client(
+        TransportSettings(max_connections=args.max_connections, http2=args.http2)
+    )
+    http_version = await negotiated_http_version(http_client, args.base_url)
+    print(f"Протокол: {http_version}")
+    if args.http2 and http_version != "HTTP/2":
+        await http_client.aclose()
+        sys.exit(
+            f"--http2: сервер согласовал {http_version}, а не HTTP/2 (нужен HTTPS-сервер с ALPN h2)"
+        )
+
+    client = LLMClient(
+        api_key="fake",
+        model="fake-llm",
+        max_tokens=args.max_tokens,
+        temperature=0.7,
+        single_flight=False,
+        scheduler=LLMScheduler(max_concurrency=args.concurrency, queue_timeout=0),
+        retry_policy=RetryPolicy(max_retries=args.retries),
+        base_url=args.base_url,
+        http_client=http_client,
+    )
+    latencies: list[float] = []
+    errors = 0
+
+    async def request(i: int) -> None:
+        nonlocal errors
+        started = time.monotonic()
+        try:
+            await client.get_response([{"role": "user", "content": f"Запрос {i}"}])
+        except Exception:
+            errors += 1
+            return
+        latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(*(request(i) for i in range(args.requests)))
+    elapsed = time.monotonic() - started
+    await client.close()
+
+    latencies.sort()
+    print(f"Запросов: {args.requests}, одновременно: {args.concurrency}, ошибок: {errors}")
+    print(f"Время: {elapsed:.2f}s, пропускная способность: {args.requests / elapsed:.1f} req/s")
+    print(
+        "Задержка (с учетом очереди): "
+        + ", ".join(f"p{int(q * 100)}={percentile(latencies, q):.3f}s" for q in (0.5, 0.95, 0.99))
+    )
+
+
+def main() -> None:
+    """Разбор аргументов и запуск бенчмарка"""
+    parser = argparse.ArgumentParser(description="Пропускная способность LLMClient")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8081/v1")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--max-connections", type=int, default=100)
+    parser.add_argument("--max-tokens", type=int, default=100)
+    parser.add_argument("--retries", type=int, default=0)
+    parser.add_argument("--http2", action="store_true")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
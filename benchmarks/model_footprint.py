@@ -0,0 +1,214 @@
+"""Бенчмарк моделей истории: память на контекст и время создания
+
+Сравниваются три представления записи истории:
+
+1. dict - прежние dataclass с __dict__ (определены здесь для сравнения);
+2. slots - текущие слотовые модели из src/models.py;
+3. frozen - слотовые frozen dataclass (вариант для сравнения).
+
+Для каждого представления создается N контекстов (по умолчанию 10 000)
+по max_history сообщений и ответов. Измеряются память на контекст
+(tracemalloc, без учета строк текста, общих для всех вариантов) и время
+создания; для slots дополнительно - время через from_row, как при
+загрузке истории из БД.
+
+Запуск:
+    uv run python -m benchmarks.model_footprint
+    uv run python -m benchmarks.model_footprint --contexts 50000 --history 20
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any
+
+from src.models import ConversationContext, LLMResponse, UserMessage
+
+
+@dataclass
+class DictUserMessage:
+    """Сообщение пользователя в прежнем представлении (с __dict__)"""
+
+    user_id: int
+    text: str
+    timestamp: datetime
+    content_length: int = field(init=False)
+    id: int | None = None
+    is_deleted: bool = False
+    token_count: int = 0
+
+    def __post_init__(self) -> None:
+        self.content_length = len(self.text)
+
+
+@dataclass
+class DictLLMResponse:
+    """Ответ LLM в прежнем представлении (с __dict__)"""
+
+    content: str
+    timestamp: datetime
+    model_used: str
+    content_length: int = field(init=False)
+    id: int | None = None
+    is_deleted: bool = False
+    token_count: int = 0
+
+    def __post_init__(self) -> None:
+        self.content_length = len(self.content)
+
+
+@dataclass
+class DictConversationContext:
+    """Контекст диалога в прежнем представлении (с __dict__)"""
+
+    user_id: int
+    messages: list[Any]
+    responses: list[Any]
+    system_prompt: str
+    summary: str | None = None
+
+
+@dataclass(slots=True, frozen=True)
+class FrozenUserMessage:
+    """Сообщение пользователя - слотовый frozen dataclass"""
+
+    user_id: int
+    text: str
+    timestamp: datetime
+    content_length: int = field(init=False)
+    id: int | None = None
+    is_deleted: bool = False
+    token_count: int = 0
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "content_length", len(self.text))
+
+
+@dataclass(slots=True, frozen=True)
+class FrozenLLMResponse:
+    """Ответ LLM - слотовый frozen dataclass"""
+
+    content: str
+    timestamp: datetime
+    model_used: str
+    content_length: int = field(init=False)
+    id: int | None = None
+    is_deleted: bool = False
+    token_count: int = 0
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "content_length", len(self.content))
+
+
+Rows = tuple[list[tuple[Any, ...]], list[tuple[Any, ...]]]
+Builder = Callable[[int, Rows], Any]
+
+
+def make_rows(history: int) -> Rows:
+    """Строки истории одного контекста в формате выборки из БД"""
+    now = datetime.now()
+    messages = [(i, 1, f"Сообщение {i}", now, 12, False, 6) for i in range(history)]
+    responses = [(i, f"Ответ {i}", now, "openai/gpt-4o", 8, False, 4) for i in range(history)]
+    return messages, responses
+
+
+def build_dict(user_id: int, rows: Rows) -> DictConversationContext:
+    """Контекст из прежних моделей (через конструктор)"""
+    return DictConversationContext(
+        user_id,
+        [DictUserMessage(r[1], r[2], r[3], id=r[0], token_count=r[6]) for r in rows[0]],
+        [DictLLMResponse(r[1], r[2], r[3], id=r[0], token_count=r[6]) for r in rows[1]],
+        "System",
+    )
+
+
+def build_slots(user_id: int, rows: Rows) -> ConversationContext:
+    """Контекст из текущих моделей (через конструктор)"""
+    return ConversationContext(
+        user_id,
+        [UserMessage(r[1], r[2], r[3], id=r[0], token_count=r[6]) for r in rows[0]],
+        [LLMResponse(r[1], r[2], r[3], id=r[0], token_count=r[6]) for r in rows[1]],
+        "System",
+    )
+
+
+def build_slots_from_row(user_id: int, rows: Rows) -> ConversationContext:
+    """Контекст из текущих моделей (через from_row, как при загрузке из БД)"""
+    return ConversationContext(
+        user_id,
+        [UserMessage.from_row(*r) for r in rows[0]],
+        [LLMResponse.from_row(*r) for r in rows[1]],
+        "System",
+    )
+
+
+def build_frozen(user_id: int, rows: Rows) -> ConversationContext:
+    """Контекст из frozen-моделей (через конструктор)"""
+    return ConversationContext(
+        user_id,
+        [FrozenUserMessage(r[1], r[2], r[3], id=r[0], token_count=r[6]) for r in rows[0]],  # type: ignore[misc]
+        [FrozenLLMResponse(r[1], r[2], r[3], id=r[0], token_count=r[6]) for r in rows[1]],  # type: ignore[misc]
+        "System",
+    )
+
+
+def measure(builder: Builder, contexts: int, rows: Rows) -> tuple[float, float]:
+    """
+    Создать contexts контекстов и измерить память и время
+
+    Returns:
+        (байт на контекст, секунд на все контексты)
+    """
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    resident = [builder(user_id, rows) for user_id in range(contexts)]
+    elapsed = time.perf_counter() - started
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del resident
+    return memory / contexts, elapsed
+
+
+def best_time(builder: Builder, contexts: int, rows: Rows, repeat: int) -> float:
+    """Лучшее время создания contexts контекстов из repeat попыток (без tracemalloc)"""
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        resident = [builder(user_id, rows) for user_id in range(contexts)]
+        best = min(best, time.perf_counter() - started)
+        del resident
+    return best
+
+
+def main() -> None:
+    """Запуск бенчмарка"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--contexts", type=int, default=10000, help="Количество контекстов")
+    parser.add_argument("--history", type=int, default=10, help="Записей каждого типа в контексте")
+    parser.add_argument("--repeat", type=int, default=5, help="Повторов замера времени")
+    args = parser.parse_args()
+
+    rows = make_rows(args.history)
+    variants: list[tuple[str, Builder]] = [
+        ("dict", build_dict),
+        ("slots", build_slots),
+        ("slots from_row", build_slots_from_row),
+        ("frozen", build_frozen),
+    ]
+
+    print(f"{args.contexts} контекстов × {args.history} сообщений и {args.history} ответов")
+    print(f"{'вариант':<16} {'байт/контекст':>14} {'время, мс':>10}")
+    for name, builder in variants:
+        per_context, _ = measure(builder, args.contexts, rows)
+        elapsed = best_time(builder, args.contexts, rows, args.repeat)
+        print(f"{name:<16} {per_context:>14.0f} {elapsed * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
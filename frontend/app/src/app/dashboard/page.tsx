@@ -78,6 +78,8 @@ export default function DashboardPage() {
           <>
             <MetricCards metrics={stats.metrics} />
 
+            {stats.llm_metrics.length > 0 && <MetricCards metrics={stats.llm_metrics} />}
+
             <ActivityChart data={stats.activity_chart} period={period} />
 
             <div className="grid gap-6 md:grid-cols-2">
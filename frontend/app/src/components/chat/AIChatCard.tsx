@@ -60,20 +60,35 @@ export default function AIChatCard({ className }: AIChatCardProps) {
     setError(null);
 
     try {
-      const response = await apiClient.sendChatMessage({
-        session_id: sessionId,
-        message: userMessage,
-        mode: mode,
-      });
-
-      setMessages((prev) => [
-        ...prev,
+      // The reply bubble appears with the first streamed fragment
+      let started = false;
+      const response = await apiClient.streamChatMessage(
         {
-          sender: "ai",
-          text: response.response,
-          sql_query: response.sql_query,
+          session_id: sessionId,
+          message: userMessage,
+          mode: mode,
         },
-      ]);
+        (delta) => {
+          if (!started) {
+            started = true;
+            setIsTyping(false);
+            setMessages((prev) => [...prev, { sender: "ai", text: delta }]);
+            return;
+          }
+          setMessages((prev) => {
+            const last = prev[prev.length - 1];
+            return [...prev.slice(0, -1), { ...last, text: last.text + delta }];
+          });
+        }
+      );
+
+      setMessages((prev) => {
+        if (!started) {
+          return [...prev, { sender: "ai", text: response.response, sql_query: response.sql_query }];
+        }
+        const last = prev[prev.length - 1];
+        return [...prev.slice(0, -1), { ...last, sql_query: response.sql_query }];
+      });
     } catch (err) {
       setError(
         err instanceof Error ? err.message : "Failed to send message"
@@ -47,6 +47,64 @@ export class ApiClient {
     return response.json();
   }
 
+  /**
+   * Send a chat message and receive the reply as Server-Sent Events.
+   * onDelta is called with each text fragment; resolves with the full reply.
+   */
+  async streamChatMessage(
+    request: ChatMessage,
+    onDelta: (delta: string) => void
+  ): Promise<ChatResponse> {
+    const response = await fetch(`${this.baseUrl}/api/chat/stream`, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify(request),
+    });
+
+    if (!response.ok || !response.body) {
+      throw new Error(`Chat API error: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let text = "";
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary = buffer.indexOf("\n\n");
+      while (boundary !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf("\n\n");
+
+        let event = "message";
+        let data = "";
+        for (const line of rawEvent.split("\n")) {
+          if (line.startsWith("event: ")) event = line.slice(7);
+          else if (line.startsWith("data: ")) data += line.slice(6);
+        }
+        const payload = JSON.parse(data);
+
+        if (event === "error") {
+          throw new Error(payload.detail);
+        }
+        if (event === "done") {
+          return { response: text, mode: payload.mode, sql_query: payload.sql_query ?? undefined };
+        }
+        text += payload.delta;
+        onDelta(payload.delta);
+      }
+    }
+
+    throw new Error("Chat stream ended unexpectedly");
+  }
+
   async clearChatHistory(sessionId: string): Promise<void> {
     const request: ChatClearRequest = { session_id: sessionId };
 
@@ -33,6 +33,7 @@ export interface DashboardStats {
   recent_conversations: ConversationItem[];
   top_users: TopUser[];
   period: Period;
+  llm_metrics: MetricCard[];
 }
 
 // Chat API types
@@ -1,18 +1,33 @@
 """FastAPI приложение для Statistics API и Chat API"""
 
+import asyncio
+import json
 import logging
+import math
 import os
+from collections.abc import AsyncIterator, Awaitable
+from contextlib import aclosing
 from dataclasses import asdict
+from typing import Any, TypeVar
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncEngine
 
+from ..cached_history_storage import CachedHistoryStorage
 from ..config import Config
 from ..conversation_manager import ConversationManager
 from ..database import create_engine
 from ..db_history_storage import DatabaseHistoryStorage
+from ..deadline import Deadline, DeadlineExceededError, deadline_scope
+from ..factory import create_database_history_storage, create_llm_client, create_model_router
 from ..llm_client import LLMClient
+from ..llm_resilience import LLMUnavailableError
+from ..llm_response_cache import LLMResponseCache
+from ..llm_scheduler import LLMScheduler
+from ..model_router import ModelRouter
 from .mock_stat_collector import MockStatCollector
 from .real_stat_collector import RealStatCollector
 from .stat_collector import StatCollector
@@ -20,6 +35,8 @@ from .text2sql_manager import Text2SQLManager
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 app = FastAPI(
     title="AIDD API",
     description="API для статистики диалогов и веб-чата с LLM-ассистентом",
@@ -42,6 +59,13 @@ collector: StatCollector | None = None
 normal_conversation_manager: ConversationManager | None = None
 admin_conversation_manager: ConversationManager | None = None
 text2sql_manager: Text2SQLManager | None = None
+db_engine: AsyncEngine | None = None
+llm_response_cache: LLMResponseCache | None = None
+llm_scheduler: LLMScheduler | None = None
+llm_client: LLMClient | None = None
+model_router: ModelRouter | None = None
+history_storages: list[DatabaseHistoryStorage | CachedHistoryStorage] = []
+turn_timeout: float = 0.0
 
 
 # Pydantic модели для Chat API
@@ -65,14 +89,17 @@ class ChatClearRequest(BaseModel):
 async def startup_event() -> None:
     """Инициализация при запуске приложения"""
     global collector, normal_conversation_manager, admin_conversation_manager, text2sql_manager
+    global db_engine, llm_client, llm_response_cache, llm_scheduler, model_router, turn_timeout
 
     logger.info("Инициализация AIDD API...")
 
     # Загружаем конфигурацию
     config = Config()
+    turn_timeout = config.turn_timeout
 
     # Создаем движок БД
     engine = create_engine(config.database_url)
+    db_engine = engine
 
     # Выбираем сборщик статистики (Mock или Real)
     use_mock = os.getenv("USE_MOCK_STATS", "false").lower() == "true"
@@ -81,18 +108,22 @@ async def startup_event() -> None:
         collector = MockStatCollector()
     else:
         logger.info("Используется RealStatCollector для статистики")
-        collector = RealStatCollector(engine)
-
-    # Инициализируем LLM клиент
-    llm_client = LLMClient(
-        api_key=config.openrouter_key,
-        model=config.default_model,
-        max_tokens=config.max_tokens,
-        temperature=config.temperature,
-    )
+        collector = RealStatCollector(engine, history_storage=config.history_storage)
+
+    # Инициализируем LLM клиент (кеш ответов и планировщик - для эндпоинтов статистики)
+    llm_client = create_llm_client(config)
+    llm_response_cache = llm_client.response_cache
+    llm_scheduler = llm_client.scheduler
 
-    # Инициализируем DatabaseHistoryStorage
-    history_storage = DatabaseHistoryStorage(engine, max_history=config.max_history_messages)
+    # Маршрутизация ходов по ступеням моделей (общая для normal и admin режимов)
+    model_router = create_model_router(config, llm_client)
+
+    # Инициализируем хранилище истории: чат API и дашборд читают историю из БД
+    if config.history_storage in ("memory", "log"):
+        logger.warning(
+            f"HISTORY_STORAGE={config.history_storage} не поддерживается API, используется messages"
+        )
+    history_storage = create_database_history_storage(engine, config)
 
     # Инициализируем Normal ConversationManager
     normal_conversation_manager = ConversationManager(
@@ -100,6 +131,15 @@ async def startup_event() -> None:
         system_prompt=config.system_prompt,
         storage=history_storage,
         max_history=config.max_history_messages,
+        background_persistence=config.background_persistence,
+        persist_max_retries=config.persist_max_retries,
+        persist_retry_delay=config.persist_retry_delay,
+        history_token_budget=config.history_token_budget,
+        summary_threshold=config.summary_threshold,
+        summary_keep_recent=config.summary_keep_recent,
+        prompt_cache_size=config.prompt_cache_size,
+        cache_first_turn="first_turn" in config.llm_cache_routes,
+        router=model_router,
     )
     logger.info("Normal ConversationManager инициализирован")
 
@@ -114,23 +154,58 @@ async def startup_event() -> None:
 
     # Инициализируем Text2SQLManager
     text2sql_manager = Text2SQLManager(
-        llm_client=llm_client, engine=engine, text2sql_prompt=text2sql_prompt
+        llm_client=llm_client,
+        engine=engine,
+        text2sql_prompt=text2sql_prompt,
+        cache_responses="text2sql" in config.llm_cache_routes,
+        single_flight=config.llm_single_flight,
+        router=model_router,
     )
     logger.info("Text2SQLManager инициализирован")
 
     # Инициализируем Admin ConversationManager с отдельным storage
-    admin_history_storage = DatabaseHistoryStorage(engine, max_history=config.max_history_messages)
+    admin_history_storage = create_database_history_storage(engine, config, context_cache=False)
     admin_conversation_manager = ConversationManager(
         llm_client=llm_client,
         system_prompt=text2sql_prompt,  # используем text2sql промпт как системный
         storage=admin_history_storage,
         max_history=config.max_history_messages,
+        background_persistence=config.background_persistence,
+        persist_max_retries=config.persist_max_retries,
+        persist_retry_delay=config.persist_retry_delay,
+        history_token_budget=config.history_token_budget,
+        summary_threshold=config.summary_threshold,
+        summary_keep_recent=config.summary_keep_recent,
+        prompt_cache_size=config.prompt_cache_size,
+        router=model_router,
+        mode="admin",
     )
     logger.info("Admin ConversationManager инициализирован")
 
+    history_storages.extend([history_storage, admin_history_storage])
+
     logger.info("AIDD API успешно инициализирован")
 
 
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    """Остановка приложения: сброс буферов записи и закрытие соединений с БД"""
+    for manager in (normal_conversation_manager, admin_conversation_manager):
+        if manager is not None:
+            await manager.close()
+
+    for storage in history_storages:
+        await storage.close()
+    history_storages.clear()
+
+    if llm_client is not None:
+        await llm_client.close()
+
+    if db_engine is not None:
+        await db_engine.dispose()
+        logger.info("Соединение с БД закрыто")
+
+
 @app.get("/")
 async def root() -> dict[str, str]:
     """Корневой эндпоинт API"""
@@ -151,6 +226,78 @@ async def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/api/llm/cache")
+async def llm_cache_stats() -> dict[str, float | bool]:
+    """
+    Статистика кеша ответов LLM
+
+    Returns:
+        Признак включения кеша и его метрики (размер, попадания, доля попаданий)
+    """
+    if llm_response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **llm_response_cache.stats()}
+
+
+@app.get("/api/llm/scheduler")
+async def llm_scheduler_stats() -> dict[str, float | bool]:
+    """
+    Метрики планировщика запросов к LLM
+
+    Returns:
+        Признак включения планировщика, активные запросы, глубина очереди
+        (всего и по приоритетам), таймауты ожидания и время ожидания слота
+    """
+    if llm_scheduler is None:
+        return {"enabled": False}
+    return {"enabled": True, **llm_scheduler.stats()}
+
+
+@app.get("/api/llm/models")
+async def llm_models_stats() -> dict[str, Any]:
+    """
+    Состояние моделей LLM
+
+    Returns:
+        Количество повторов и дублирующих (хеджированных) запросов, а также
+        задержки, доля ошибок и доступность основной и резервных моделей
+    """
+    if llm_client is None:
+        raise HTTPException(status_code=500, detail="LLM client not initialized")
+    return llm_client.stats()
+
+
+@app.get("/api/llm/router")
+async def llm_router_stats() -> dict[str, Any]:
+    """
+    Метрики маршрутизации моделей
+
+    Returns:
+        Признак включения маршрутизации, количество ходов по моделям и
+        пропуски ступеней с деградировавшей или медленной моделью
+    """
+    if model_router is None:
+        return {"enabled": False}
+    return {"enabled": True, **model_router.stats()}
+
+
+@app.get("/api/chat/turns")
+async def chat_turn_stats() -> dict[str, int]:
+    """
+    Метрики прерванных ходов чата
+
+    Returns:
+        Количество ходов, прерванных по сроку и отключением клиента, токены
+        ответов, сгенерированных впустую, и объединенные сообщения
+
+    Raises:
+        HTTPException 500: Если менеджер чата не инициализирован
+    """
+    if normal_conversation_manager is None:
+        raise HTTPException(status_code=500, detail="Chat managers not initialized")
+    return normal_conversation_manager.stats()
+
+
 @app.get("/api/stats")
 async def get_stats(
     period: str = Query(
@@ -186,42 +333,217 @@ async def get_stats(
 
 
 @app.post("/api/chat/message")
-async def send_message(request: ChatMessageRequest) -> ChatMessageResponse:
+async def send_message(request: ChatMessageRequest, http_request: Request) -> ChatMessageResponse:
     """
     Отправить сообщение в чат и получить ответ
 
+    Ход ограничен сроком TURN_TIMEOUT и прерывается, если клиент закрыл
+    соединение: ответ уже некому отдавать.
+
     Args:
         request: Запрос с сообщением пользователя
+        http_request: HTTP-запрос (для отслеживания отключения клиента)
 
     Returns:
         Ответ от LLM-ассистента
 
     Raises:
+        HTTPException 503: Если LLM временно недоступен (сброс нагрузки)
+        HTTPException 504: Если ответ не получен за TURN_TIMEOUT
+        HTTPException 499: Если клиент закрыл соединение
         HTTPException 500: При ошибке обработки сообщения
     """
     if text2sql_manager is None or normal_conversation_manager is None:
         raise HTTPException(status_code=500, detail="Chat managers not initialized")
 
+    deadline = turn_deadline()
     try:
+        shed_if_unavailable()
         # Конвертируем session_id в user_id (hash для уникальности)
         user_id = hash(request.session_id) % (10**9)
 
         if request.mode == "admin":
             # Admin режим: используем text2sql pipeline
             logger.info(f"Admin режим: обработка вопроса от session {request.session_id[:8]}...")
-            response, sql = await text2sql_manager.process_query(request.message)
+            response, sql = await cancel_on_disconnect(
+                http_request, admin_query(text2sql_manager, request.message, deadline)
+            )
             return ChatMessageResponse(response=response, mode="admin", sql_query=sql)
         else:
             # Normal режим: обычный LLM-ассистент
             logger.info(f"Normal режим: обработка сообщения от session {request.session_id[:8]}...")
-            response = await normal_conversation_manager.process_message(user_id, request.message)
-            return ChatMessageResponse(response=response, mode="normal")
-
+            reply = await cancel_on_disconnect(
+                http_request,
+                normal_conversation_manager.process_message(user_id, request.message, deadline),
+            )
+            # None - сообщение объединено с соседним ходом, ответ получит тот запрос
+            return ChatMessageResponse(response=reply or "", mode="normal")
+
+    except LLMUnavailableError as e:
+        raise busy_error(e) from e
+    except DeadlineExceededError as e:
+        logger.warning(f"Сообщение от session {request.session_id[:8]} не обработано: {e}")
+        raise HTTPException(status_code=504, detail="LLM response timed out") from e
+    except ClientDisconnectedError as e:
+        raise HTTPException(status_code=499, detail="Client closed request") from e
     except Exception as e:
         logger.error(f"Ошибка при обработке сообщения: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}") from e
 
 
+class ClientDisconnectedError(Exception):
+    """Клиент закрыл соединение до получения ответа"""
+
+
+def turn_deadline() -> Deadline | None:
+    """Срок хода чата по TURN_TIMEOUT (None - без ограничения)"""
+    return Deadline.after(turn_timeout) if turn_timeout > 0 else None
+
+
+async def admin_query(
+    manager: Text2SQLManager, question: str, deadline: Deadline | None
+) -> tuple[str, str]:
+    """Вопрос admin режима (text2sql), ограниченный сроком хода"""
+    async with deadline_scope(deadline, "text2sql"):
+        return await manager.process_query(question)
+
+
+async def cancel_on_disconnect(http_request: Request, work: Awaitable[T]) -> T:
+    """
+    Выполнить работу запроса, отменив ее при отключении клиента
+
+    Без этого обработчик доводит ход до конца (запрос к LLM, записи в БД),
+    даже если ответ уже некому отдавать.
+
+    Args:
+        http_request: HTTP-запрос клиента
+        work: Корутина обработки запроса
+
+    Returns:
+        Результат работы
+
+    Raises:
+        ClientDisconnectedError: Если клиент закрыл соединение раньше
+    """
+
+    async def disconnected() -> None:
+        # Тело запроса уже прочитано: следующее ASGI-сообщение - только отключение
+        while (await http_request.receive())["type"] != "http.disconnect":
+            pass
+
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if not task.done():
+            logger.info("Клиент закрыл соединение, обработка запроса отменена")
+            raise ClientDisconnectedError()
+        return task.result()
+    finally:
+        task.cancel()
+        watcher.cancel()
+
+
+def shed_if_unavailable() -> None:
+    """
+    Отклонить запрос до начала работы, если автомат защиты LLM разомкнут
+
+    Raises:
+        LLMUnavailableError: Если LLM временно недоступен
+    """
+    if llm_client is not None:
+        llm_client.ensure_available()
+
+
+def busy_error(error: LLMUnavailableError) -> HTTPException:
+    """Ответ 503 с Retry-After для запроса, отклоненного сбросом нагрузки"""
+    return HTTPException(
+        status_code=503,
+        detail="LLM is busy, try again later",
+        headers={"Retry-After": str(math.ceil(error.retry_after))},
+    )
+
+
+def sse_event(data: dict[str, Any], event: str | None = None) -> str:
+    """Событие Server-Sent Events с JSON-данными"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/chat/stream")
+async def stream_message(request: ChatMessageRequest) -> StreamingResponse:
+    """
+    Отправить сообщение в чат и получать ответ потоком (Server-Sent Events)
+
+    События: data {"delta": "..."} - фрагмент ответа; event done с
+    {"mode": ..., "sql_query": ...} - ответ завершен; event error с
+    {"detail": ...} - ошибка после начала потока. Admin режим не
+    поддерживает потоковую генерацию: ответ приходит одним фрагментом.
+    Отключение клиента закрывает поток и запрос к LLM; по истечении
+    TURN_TIMEOUT приходит event error.
+
+    Args:
+        request: Запрос с сообщением пользователя
+
+    Returns:
+        Поток событий text/event-stream
+
+    Raises:
+        HTTPException 503: Если LLM временно недоступен (сброс нагрузки)
+        HTTPException 500: Если менеджеры чата не инициализированы
+    """
+    if text2sql_manager is None or normal_conversation_manager is None:
+        raise HTTPException(status_code=500, detail="Chat managers not initialized")
+    try:
+        shed_if_unavailable()
+    except LLMUnavailableError as e:
+        raise busy_error(e) from e
+
+    sql_manager = text2sql_manager
+    conversation_manager = normal_conversation_manager
+    user_id = hash(request.session_id) % (10**9)
+    deadline = turn_deadline()
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            sql_query: str | None = None
+            if request.mode == "admin":
+                logger.info(f"Admin режим (поток): вопрос от session {request.session_id[:8]}...")
+                response, sql_query = await admin_query(sql_manager, request.message, deadline)
+                yield sse_event({"delta": response})
+            else:
+                logger.info(
+                    f"Normal режим (поток): сообщение от session {request.session_id[:8]}..."
+                )
+                # aclosing: отключение клиента на yield сразу закрывает ход,
+                # освобождая очередь пользователя и слот планировщика LLM
+                async with aclosing(
+                    conversation_manager.process_message_stream(user_id, request.message, deadline)
+                ) as deltas:
+                    async for delta in deltas:
+                        yield sse_event({"delta": delta})
+            yield sse_event({"mode": request.mode, "sql_query": sql_query}, event="done")
+        except LLMUnavailableError as e:
+            logger.warning(f"LLM недоступен, потоковый запрос отклонен: {e}")
+            yield sse_event(
+                {"detail": "LLM is busy, try again later", "retry_after": e.retry_after},
+                event="error",
+            )
+        except DeadlineExceededError as e:
+            logger.warning(f"Потоковый ответ не получен вовремя: {e}")
+            yield sse_event({"detail": "LLM response timed out"}, event="error")
+        except Exception as e:
+            logger.error(f"Ошибка при потоковой обработке сообщения: {e}")
+            yield sse_event({"detail": f"Error processing message: {str(e)}"}, event="error")
+
+    # X-Accel-Buffering отключает буферизацию ответа в nginx
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/api/chat/clear")
 async def clear_history(request: ChatClearRequest) -> dict[str, str]:
     """
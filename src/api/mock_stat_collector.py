@@ -54,6 +54,7 @@ class MockStatCollector(StatCollector):
         activity_chart = self._generate_activity_chart(period)
         recent_conversations = self._generate_recent_conversations()
         top_users = self._generate_top_users()
+        llm_metrics = self._generate_llm_metrics(period)
 
         return DashboardStats(
             metrics=metrics,
@@ -61,6 +62,7 @@ class MockStatCollector(StatCollector):
             recent_conversations=recent_conversations,
             top_users=top_users,
             period=period,
+            llm_metrics=llm_metrics,
         )
 
     def _generate_metrics(self, period: str) -> list[MetricCard]:
@@ -116,6 +118,46 @@ class MockStatCollector(StatCollector):
             ),
         ]
 
+    def _generate_llm_metrics(self, period: str) -> list[MetricCard]:
+        """Генерация карточек задержки и расхода токенов LLM"""
+        period_multipliers = {"day": 1, "week": 7, "month": 30}
+        calls = random.randint(2000, 4000) * period_multipliers[period]
+        ttft_p50 = random.randint(250, 450)
+
+        cards = []
+        for title, latency in (
+            ("LLM Latency p50", random.randint(900, 1400)),
+            ("LLM Latency p95", random.randint(2500, 4000)),
+            ("LLM Latency p99", random.randint(5000, 8000)),
+        ):
+            trend = random.uniform(-10, 10)
+            cards.append(
+                MetricCard(
+                    title=title,
+                    value=f"{latency:,} ms",
+                    trend=round(trend, 1),
+                    trend_label=self._get_trend_label(trend, period),
+                    description=f"Time to first token p50: {ttft_p50} ms, {calls:,} LLM calls",
+                )
+            )
+
+        prompt_tokens = calls * random.randint(600, 900)
+        completion_tokens = calls * random.randint(150, 250)
+        tokens_trend = random.uniform(-5, 20)
+        cards.append(
+            MetricCard(
+                title="Tokens Used",
+                value=f"{prompt_tokens + completion_tokens:,}",
+                trend=round(tokens_trend, 1),
+                trend_label=self._get_trend_label(tokens_trend, period),
+                description=(
+                    f"{prompt_tokens:,} prompt / {completion_tokens:,} completion tokens "
+                    f"this {period}"
+                ),
+            )
+        )
+        return cards
+
     def _get_trend_label(self, trend: float, period: str) -> str:
         """Генерация текстовой метки для тренда"""
         if trend > 10:
@@ -1,6 +1,6 @@
 """Модели данных для API статистики дашборда"""
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
 @dataclass
@@ -84,6 +84,7 @@ class DashboardStats:
         recent_conversations: Последние 10 диалогов
         top_users: Топ 5 пользователей по активности
         period: Выбранный период ('day', 'week', 'month')
+        llm_metrics: Карточки задержки и расхода токенов LLM (пусто - нет данных)
     """
 
     metrics: list[MetricCard]
@@ -91,6 +92,7 @@ class DashboardStats:
     recent_conversations: list[ConversationItem]
     top_users: list[TopUser]
     period: str
+    llm_metrics: list[MetricCard] = field(default_factory=list)
 
     def __post_init__(self) -> None:
         """Валидация данных после инициализации"""
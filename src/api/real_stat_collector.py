@@ -2,11 +2,12 @@
 
 import logging
 from datetime import datetime, timedelta
+from typing import Any
 
 from sqlalchemy import and_, func, select
 from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
 
-from ..database import conversations, user_messages
+from ..database import conversations, llm_responses, turns, user_messages
 from .models import (
     ConversationItem,
     DashboardStats,
@@ -24,17 +25,21 @@ class RealStatCollector(StatCollector):
     Реальный сборщик статистики из PostgreSQL базы данных
 
     Собирает статистику диалогов из таблиц conversations, user_messages, llm_responses.
+    Расход и задержка LLM читаются из таблицы модели хранения: llm_responses
+    или turns (HISTORY_STORAGE=turns).
     """
 
-    def __init__(self, engine: AsyncEngine) -> None:
+    def __init__(self, engine: AsyncEngine, history_storage: str = "messages") -> None:
         """
         Инициализация Real сборщика
 
         Args:
             engine: Асинхронный движок SQLAlchemy для подключения к БД
+            history_storage: Модель хранения истории (turns - ответы LLM в таблице turns)
         """
         self.engine = engine
-        logger.info("RealStatCollector инициализирован")
+        self.history_storage = history_storage
+        logger.info(f"RealStatCollector инициализирован (история: {history_storage})")
 
     async def get_stats(self, period: str) -> DashboardStats:
         """
@@ -65,6 +70,9 @@ class RealStatCollector(StatCollector):
             activity_chart = await self._generate_activity_chart(conn, period, period_start)
             recent_conversations = await self._generate_recent_conversations(conn)
             top_users = await self._generate_top_users(conn)
+            llm_metrics = await self._generate_llm_metrics(
+                conn, period, now, period_start, prev_period_start
+            )
 
         return DashboardStats(
             metrics=metrics,
@@ -72,6 +80,7 @@ class RealStatCollector(StatCollector):
             recent_conversations=recent_conversations,
             top_users=top_users,
             period=period,
+            llm_metrics=llm_metrics,
         )
 
     def _get_period_start(self, reference_time: datetime, period: str) -> datetime:
@@ -231,6 +240,128 @@ class RealStatCollector(StatCollector):
             ),
         ]
 
+    async def _generate_llm_metrics(
+        self,
+        conn: AsyncConnection,
+        period: str,
+        now: datetime,
+        period_start: datetime,
+        prev_period_start: datetime,
+    ) -> list[MetricCard]:
+        """
+        Карточки задержки LLM (p50/p95/p99) и расхода токенов за период
+
+        Учитываются только ответы, полученные вызовом API (latency_ms не NULL):
+        ответы из кеша и объединенные запросы не искажают перцентили.
+        """
+        current = await self._llm_usage(conn, period_start, now)
+        if current["responses"] == 0:
+            return []
+        prev = await self._llm_usage(conn, prev_period_start, period_start)
+
+        cards = []
+        for title, key in (
+            ("LLM Latency p50", "p50"),
+            ("LLM Latency p95", "p95"),
+            ("LLM Latency p99", "p99"),
+        ):
+            trend = self._relative_change(current[key], prev[key])
+            cards.append(
+                MetricCard(
+                    title=title,
+                    value=f"{current[key]:,.0f} ms",
+                    trend=round(trend, 1),
+                    trend_label=self._get_trend_label(trend, period),
+                    description=(
+                        f"Time to first token p50: {current['ttft_p50']:,.0f} ms, "
+                        f"{current['responses']:,} LLM calls"
+                    ),
+                )
+            )
+
+        tokens_trend = self._relative_change(current["tokens"], prev["tokens"])
+        cards.append(
+            MetricCard(
+                title="Tokens Used",
+                value=f"{current['tokens']:,}",
+                trend=round(tokens_trend, 1),
+                trend_label=self._get_trend_label(tokens_trend, period),
+                description=(
+                    f"{current['prompt_tokens']:,} prompt / "
+                    f"{current['completion_tokens']:,} completion tokens this {period}"
+                ),
+            )
+        )
+        return cards
+
+    async def _llm_usage(
+        self, conn: AsyncConnection, start: datetime, end: datetime
+    ) -> dict[str, Any]:
+        """
+        Перцентили задержки и сумма токенов ответов LLM в интервале [start, end)
+
+        В PostgreSQL перцентили считает percentile_cont; в других СУБД (SQLite)
+        его нет, и перцентили считаются по выбранным задержкам той же формулой.
+        """
+        if self.history_storage == "turns":
+            table, timestamp = turns, turns.c.response_timestamp
+        else:
+            table, timestamp = llm_responses, llm_responses.c.timestamp
+        latency, first_token = table.c.latency_ms, table.c.first_token_ms
+        period = and_(timestamp >= start, timestamp < end, latency.isnot(None))
+
+        result = await conn.execute(
+            select(
+                func.count(table.c.id),
+                func.coalesce(func.sum(table.c.prompt_tokens), 0),
+                func.coalesce(func.sum(table.c.completion_tokens), 0),
+            ).where(period)
+        )
+        responses, prompt_tokens, completion_tokens = result.one()
+
+        if conn.dialect.name == "postgresql":
+            result = await conn.execute(
+                select(
+                    func.percentile_cont(0.5).within_group(latency),
+                    func.percentile_cont(0.95).within_group(latency),
+                    func.percentile_cont(0.99).within_group(latency),
+                    func.percentile_cont(0.5).within_group(first_token),
+                ).where(period)
+            )
+            p50, p95, p99, ttft_p50 = result.one()
+        else:
+            rows = (await conn.execute(select(latency, first_token).where(period))).all()
+            latencies = sorted(row[0] for row in rows)
+            first_tokens = sorted(row[1] for row in rows if row[1] is not None)
+            p50, p95, p99 = (self._percentile_cont(latencies, q) for q in (0.5, 0.95, 0.99))
+            ttft_p50 = self._percentile_cont(first_tokens, 0.5)
+
+        return {
+            "responses": responses,
+            "p50": p50 or 0.0,
+            "p95": p95 or 0.0,
+            "p99": p99 or 0.0,
+            "ttft_p50": ttft_p50 or 0.0,
+            "prompt_tokens": int(prompt_tokens),
+            "completion_tokens": int(completion_tokens),
+            "tokens": int(prompt_tokens) + int(completion_tokens),
+        }
+
+    @staticmethod
+    def _percentile_cont(values: list[int], fraction: float) -> float | None:
+        """Перцентиль с линейной интерполяцией, как percentile_cont (values отсортированы)"""
+        if not values:
+            return None
+        position = (len(values) - 1) * fraction
+        lower = int(position)
+        upper = min(lower + 1, len(values) - 1)
+        return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+    @staticmethod
+    def _relative_change(current: float, prev: float) -> float:
+        """Изменение в процентах относительно предыдущего периода (0 - нет данных)"""
+        return ((current - prev) / prev) * 100 if prev else 0.0
+
     def _get_trend_label(self, trend: float, period: str) -> str:
         """Генерация текстовой метки для тренда"""
         if trend > 10:
@@ -6,6 +6,9 @@ import re
 from sqlalchemy.ext.asyncio import AsyncEngine
 
 from ..llm_client import LLMClient
+from ..llm_scheduler import Priority
+from ..model_router import ModelRouter
+from ..single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +24,15 @@ class Text2SQLManager:
     4. Результат → LLM форматирует ответ
     """
 
-    def __init__(self, llm_client: LLMClient, engine: AsyncEngine, text2sql_prompt: str):
+    def __init__(
+        self,
+        llm_client: LLMClient,
+        engine: AsyncEngine,
+        text2sql_prompt: str,
+        cache_responses: bool = False,
+        single_flight: bool = True,
+        router: ModelRouter | None = None,
+    ):
         """
         Инициализация Text2SQL менеджера
 
@@ -29,22 +40,41 @@ class Text2SQLManager:
             llm_client: Клиент для работы с LLM
             engine: Асинхронный движок SQLAlchemy
             text2sql_prompt: Системный промпт для генерации SQL
+            cache_responses: Кешировать ответы LLM (повторяющиеся аналитические вопросы)
+            single_flight: Выполнять одинаковые одновременные вопросы одним pipeline
+            router: Выбор модели и лимита ответа для запросов admin-режима
         """
         self.llm_client = llm_client
         self.engine = engine
         self.text2sql_prompt = text2sql_prompt
+        self.router = router
+        # None - решение о кеше остается за LLMClient (кеш только при temperature=0)
+        self._cache: bool | None = True if cache_responses else None
+        self.inflight: SingleFlight[tuple[str, str]] | None = (
+            SingleFlight() if single_flight else None
+        )
         logger.info("Text2SQLManager инициализирован")
 
     async def process_query(self, question: str) -> tuple[str, str]:
         """
         Обработать вопрос пользователя через text2sql pipeline
 
+        Одновременные вопросы, совпадающие с точностью до пробелов, выполняются
+        одним pipeline и получают общий результат.
+
         Args:
             question: Вопрос на естественном языке
 
         Returns:
             Tuple (ответ на естественном языке, SQL запрос)
         """
+        question = " ".join(question.split())
+        if self.inflight is None:
+            return await self._run_pipeline(question)
+        return await self.inflight.run(question, lambda: self._run_pipeline(question))
+
+    async def _run_pipeline(self, question: str) -> tuple[str, str]:
+        """Генерация, проверка и выполнение SQL, форматирование ответа"""
         try:
             # Шаг 1: Генерация SQL из вопроса
             sql_query = await self._generate_sql(question)
@@ -92,7 +122,7 @@ class Text2SQLManager:
             },
         ]
 
-        response = await self.llm_client.get_response(messages)
+        response = await self._ask(messages)
 
         # Извлекаем SQL из блока кода
         sql_query = self._extract_sql_from_response(response)
@@ -257,12 +287,23 @@ SQL запрос, который был выполнен:
             },
         ]
 
-        answer = await self.llm_client.get_response(messages)
+        answer = await self._ask(messages)
 
         logger.info(f"Сформирован ответ на вопрос: {question[:50]}...")
 
         return answer
 
+    async def _ask(self, messages: list[dict[str, str]]) -> str:
+        """Запрос к LLM с аналитическим приоритетом и маршрутом admin-режима"""
+        route = self.router.route(messages, "admin") if self.router is not None else None
+        return await self.llm_client.get_response(
+            messages,
+            cache=self._cache,
+            priority=Priority.ANALYTICS,
+            model=route.model if route else None,
+            max_tokens=route.max_tokens if route else None,
+        )
+
 
 # Нужно импортировать text для выполнения сырых SQL запросов
 from sqlalchemy import text  # noqa: E402
@@ -0,0 +1,127 @@
+"""Фоновое сохранение ответов LLM вне критического пути ответа"""
+
+import asyncio
+import logging
+from collections import deque
+from collections.abc import Awaitable, Callable
+
+from .models import LLMUsage
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundPersister:
+    """
+    Супервизор фоновых записей ответов с порядком внутри пользователя
+
+    Для каждого пользователя ведется своя очередь и один воркер, поэтому
+    ответы одного пользователя записываются строго в порядке поступления,
+    а разные пользователи не блокируют друг друга. Неудачная запись
+    повторяется с экспоненциальной задержкой.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[int, str, str, LLMUsage | None], Awaitable[object]],
+        max_retries: int = 3,
+        retry_delay: float = 0.5,
+    ) -> None:
+        """
+        Инициализация фоновой записи
+
+        Args:
+            write: Корутина записи ответа (user_id, content, model, usage)
+            max_retries: Количество повторов после первой неудачной попытки
+            retry_delay: Базовая задержка между повторами в секундах
+        """
+        self.write = write
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.persisted = 0
+        self.retries = 0
+        self.failed = 0
+
+        self._queues: dict[int, deque[tuple[str, str, LLMUsage | None]]] = {}
+        self._workers: dict[int, asyncio.Task[None]] = {}
+        self._closed = False
+
+    def __len__(self) -> int:
+        """Количество ответов, ожидающих записи"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def submit(self, user_id: int, content: str, model: str, usage: LLMUsage | None = None) -> None:
+        """
+        Поставить ответ в очередь пользователя и вернуть управление сразу
+
+        Args:
+            user_id: ID пользователя
+            content: Текст ответа
+            model: Использованная модель
+            usage: Расход токенов и задержка вызова LLM
+
+        Raises:
+            RuntimeError: Если запись уже остановлена
+        """
+        if self._closed:
+            raise RuntimeError("BackgroundPersister остановлен")
+
+        self._queues.setdefault(user_id, deque()).append((content, model, usage))
+        if user_id not in self._workers:
+            self._workers[user_id] = asyncio.create_task(self._drain(user_id))
+
+    async def wait_for(self, user_id: int) -> None:
+        """Дождаться записи всех ответов пользователя, поставленных ранее"""
+        worker = self._workers.get(user_id)
+        if worker is not None:
+            # shield: отмена ожидающего не должна прерывать запись
+            await asyncio.shield(worker)
+
+    async def close(self) -> None:
+        """Запретить новые записи и дождаться завершения всех очередей"""
+        self._closed = True
+        workers = list(self._workers.values())
+        if workers:
+            await asyncio.gather(*workers)
+
+        logger.info(
+            f"BackgroundPersister остановлен: записано {self.persisted}, "
+            f"повторов {self.retries}, потеряно {self.failed}"
+        )
+
+    async def _drain(self, user_id: int) -> None:
+        """Воркер пользователя: последовательная запись очереди"""
+        queue = self._queues[user_id]
+        try:
+            while queue:
+                await self._write_with_retry(user_id, *queue[0])
+                queue.popleft()
+        finally:
+            # Между опустевшей очередью и этим блоком нет await - submit() не теряется
+            self._queues.pop(user_id, None)
+            self._workers.pop(user_id, None)
+
+    async def _write_with_retry(
+        self, user_id: int, content: str, model: str, usage: LLMUsage | None
+    ) -> None:
+        """Записать ответ, повторяя при ошибках; после исчерпания попыток - залогировать"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.write(user_id, content, model, usage)
+                self.persisted += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    logger.error(
+                        f"Не удалось сохранить ответ для user {user_id} "
+                        f"после {attempt + 1} попыток: {e}"
+                    )
+                    return
+
+                self.retries += 1
+                delay = self.retry_delay * 2**attempt
+                logger.warning(
+                    f"Ошибка сохранения ответа для user {user_id} "
+                    f"(попытка {attempt + 1}), повтор через {delay}s: {e}"
+                )
+                await asyncio.sleep(delay)
@@ -0,0 +1,227 @@
+"""Кеширующая обертка над хранилищем истории в БД"""
+
+import logging
+import sys
+from collections import OrderedDict
+
+from .db_history_storage import DatabaseHistoryStorage, align_window
+from .deadline import Deadline
+from .history_storage import record_size
+from .models import Compaction, ConversationContext, LLMResponse, LLMUsage, UserMessage
+
+logger = logging.getLogger(__name__)
+
+
+class CachedHistoryStorage:
+    """
+    Read-through кеш контекстов диалогов с write-through обновлениями
+
+    Бот - единственный писатель истории, поэтому контекст активного пользователя
+    можно держать в памяти: чтения обслуживаются из кеша, а добавления и обрезка
+    применяются одновременно к кешу и к БД. Вытеснение - по LRU и бюджету памяти.
+    """
+
+    def __init__(
+        self,
+        storage: DatabaseHistoryStorage,
+        max_users: int = 10000,
+        memory_budget: int = 64 * 1024 * 1024,
+    ) -> None:
+        """
+        Инициализация кеша
+
+        Args:
+            storage: Хранилище истории в БД
+            max_users: Максимальное количество контекстов в кеше
+            memory_budget: Бюджет памяти кеша в байтах (оценка)
+        """
+        self.storage = storage
+        self.max_history = storage.max_history
+        self.token_estimator = storage.token_estimator
+        self.max_users = max_users
+        self.memory_budget = memory_budget
+        self.memory_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._contexts: OrderedDict[int, ConversationContext] = OrderedDict()
+        self._sizes: dict[int, int] = {}
+        logger.info(
+            f"CachedHistoryStorage инициализирован "
+            f"(max_users={max_users}, memory_budget={memory_budget} байт)"
+        )
+
+    async def get_or_create_context(self, user_id: int, system_prompt: str) -> ConversationContext:
+        """Получить или создать контекст (из кеша, при промахе - из БД)"""
+        cached = self._get_cached(user_id)
+        if cached is not None:
+            return cached
+
+        context = await self.storage.get_or_create_context(user_id, system_prompt)
+        self._put(context)
+        return self._copy(context)
+
+    async def add_message(
+        self, user_id: int, text: str, system_prompt: str, deadline: Deadline | None = None
+    ) -> None:
+        """Добавить сообщение пользователя в БД и в кешированный контекст"""
+        message = await self.storage.add_message(user_id, text, system_prompt, deadline)
+        self._append(user_id, message)
+
+    async def add_message_and_get_context(
+        self, user_id: int, text: str, system_prompt: str, deadline: Deadline | None = None
+    ) -> ConversationContext:
+        """
+        Добавить сообщение и вернуть контекст
+
+        Для закешированного пользователя выполняется только запись в БД,
+        контекст собирается из памяти без чтения истории.
+
+        Args:
+            user_id: ID пользователя
+            text: Текст сообщения
+            system_prompt: Системный промпт
+            deadline: Срок хода (None - без ограничения)
+
+        Returns:
+            Контекст диалога с добавленным сообщением
+
+        Raises:
+            DeadlineExceededError: Если срок хода истек
+        """
+        if user_id in self._contexts:
+            await self.add_message(user_id, text, system_prompt, deadline)
+            cached = self._get_cached(user_id)
+            if cached is not None:
+                return cached
+            # Контекст вытеснен во время записи - сообщение уже в БД, только читаем
+            context = await self.storage.get_or_create_context(user_id, system_prompt)
+        else:
+            self.misses += 1
+            context = await self.storage.add_message_and_get_context(
+                user_id, text, system_prompt, deadline
+            )
+
+        self._put(context)
+        return self._copy(context)
+
+    async def add_response(
+        self, user_id: int, content: str, model: str, usage: LLMUsage | None = None
+    ) -> None:
+        """Добавить ответ LLM в БД и в кешированный контекст (если ответ записан)"""
+        response = await self.storage.add_response(user_id, content, model, usage)
+        if response is not None:
+            self._append(user_id, response)
+
+    async def get_context(self, user_id: int) -> ConversationContext | None:
+        """Получить контекст пользователя (из кеша, при промахе - из БД)"""
+        cached = self._get_cached(user_id)
+        if cached is not None:
+            return cached
+
+        context = await self.storage.get_context(user_id)
+        if context is None:
+            return None
+
+        self._put(context)
+        return self._copy(context)
+
+    async def clear(self, user_id: int) -> None:
+        """Очистить историю пользователя в БД и удалить контекст из кеша"""
+        await self.storage.clear(user_id)
+        self.invalidate(user_id)
+
+    async def compact_history(self, user_id: int, compaction: Compaction) -> None:
+        """Сжать историю в БД и удалить контекст из кеша"""
+        await self.storage.compact_history(user_id, compaction)
+        self.invalidate(user_id)
+
+    async def close(self) -> None:
+        """Остановить нижележащее хранилище"""
+        await self.storage.close()
+
+    def invalidate(self, user_id: int) -> None:
+        """Удалить контекст пользователя из кеша"""
+        if user_id in self._contexts:
+            del self._contexts[user_id]
+            self.memory_used -= self._sizes.pop(user_id)
+
+    def stats(self) -> dict[str, float]:
+        """Статистика кеша: размер, память, попадания, промахи, вытеснения"""
+        total = self.hits + self.misses
+        return {
+            "users": len(self._contexts),
+            "memory_used": self.memory_used,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+    def _get_cached(self, user_id: int) -> ConversationContext | None:
+        """Получить копию контекста из кеша с обновлением LRU-порядка"""
+        context = self._contexts.get(user_id)
+        if context is None:
+            self.misses += 1
+            return None
+
+        self._contexts.move_to_end(user_id)
+        self.hits += 1
+        return self._copy(context)
+
+    def _put(self, context: ConversationContext) -> None:
+        """Поместить контекст в кеш и вытеснить лишнее"""
+        user_id = context.user_id
+        self.invalidate(user_id)
+        self._contexts[user_id] = self._copy(context)
+        self._update_size(user_id)
+        self._evict()
+
+    def _append(self, user_id: int, record: UserMessage | LLMResponse) -> None:
+        """Добавить запись в кешированный контекст, обрезать до max_history и выровнять"""
+        context = self._contexts.get(user_id)
+        if context is None:
+            return
+
+        if isinstance(record, UserMessage):
+            context.messages.append(record)
+            context.messages = context.messages[-self.max_history :]
+        else:
+            context.responses.append(record)
+            context.responses = context.responses[-self.max_history :]
+        align_window(context)
+
+        self._contexts.move_to_end(user_id)
+        self.memory_used -= self._sizes[user_id]
+        self._update_size(user_id)
+        self._evict()
+
+    def _update_size(self, user_id: int) -> None:
+        """Пересчитать оценку памяти контекста пользователя"""
+        context = self._contexts[user_id]
+        size = sys.getsizeof(context.system_prompt) + sys.getsizeof(context.summary)
+        size += sum(record_size(m) for m in context.messages)
+        size += sum(record_size(r) for r in context.responses)
+        self._sizes[user_id] = size
+        self.memory_used += size
+
+    def _evict(self) -> None:
+        """Вытеснить давно неиспользуемые контексты сверх лимитов"""
+        while self._contexts and (
+            len(self._contexts) > self.max_users or self.memory_used > self.memory_budget
+        ):
+            user_id, _ = self._contexts.popitem(last=False)
+            self.memory_used -= self._sizes.pop(user_id)
+            self.evictions += 1
+            logger.debug(f"Контекст user {user_id} вытеснен из кеша")
+
+    @staticmethod
+    def _copy(context: ConversationContext) -> ConversationContext:
+        """Поверхностная копия контекста (списки копируются, записи разделяются)"""
+        return ConversationContext(
+            user_id=context.user_id,
+            messages=list(context.messages),
+            responses=list(context.responses),
+            system_prompt=context.system_prompt,
+            summary=context.summary,
+        )
@@ -0,0 +1,93 @@
+"""Кеш активного диалога пользователя (user_id → conversation_id)"""
+
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationIdCache:
+    """
+    Ограниченный LRU/TTL кеш активного диалога пользователя
+
+    Хранит conversation_id, system_prompt и краткое содержание последнего
+    диалога пользователя, чтобы не выполнять поиск диалога в БД на каждую
+    операцию с историей.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600.0) -> None:
+        """
+        Инициализация кеша
+
+        Args:
+            max_size: Максимальное количество пользователей в кеше (0 - кеш отключен)
+            ttl: Время жизни записи в секундах
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, tuple[int, str, str | None, float]] = OrderedDict()
+        logger.info(f"ConversationIdCache инициализирован (max_size={max_size}, ttl={ttl}s)")
+
+    def get(self, user_id: int) -> tuple[int, str, str | None] | None:
+        """
+        Получить активный диалог пользователя из кеша
+
+        Args:
+            user_id: ID пользователя
+
+        Returns:
+            Кортеж (conversation_id, system_prompt, summary) или None при промахе
+        """
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        conversation_id, system_prompt, summary, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return conversation_id, system_prompt, summary
+
+    def put(
+        self, user_id: int, conversation_id: int, system_prompt: str, summary: str | None = None
+    ) -> None:
+        """Сохранить активный диалог пользователя"""
+        if self.max_size <= 0:
+            return
+
+        self._entries[user_id] = (
+            conversation_id,
+            system_prompt,
+            summary,
+            time.monotonic() + self.ttl,
+        )
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        """Удалить запись пользователя из кеша"""
+        self._entries.pop(user_id, None)
+
+    def stats(self) -> dict[str, float]:
+        """
+        Статистика кеша
+
+        Returns:
+            Словарь с размером кеша, попаданиями, промахами и долей попаданий
+        """
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
@@ -1,12 +1,22 @@
 """Управление контекстом диалога"""
 
+import asyncio
 import logging
+from collections.abc import AsyncGenerator
+from contextlib import aclosing
 
+from .background_persister import BackgroundPersister
+from .cached_history_storage import CachedHistoryStorage
 from .db_history_storage import DatabaseHistoryStorage
+from .deadline import Deadline, DeadlineExceededError, deadline_scope
 from .history_storage import HistoryStorage
+from .history_summarizer import HistorySummarizer
 from .llm_client import LLMClient
 from .message_formatter import MessageFormatter
+from .model_router import ModelRouter, Route
+from .models import ConversationContext, LLMUsage
 from .prompt_loader import PromptLoader
+from .user_mailbox import UserMailbox
 
 logger = logging.getLogger(__name__)
 
@@ -18,8 +28,20 @@ class ConversationManager:
         self,
         llm_client: LLMClient,
         system_prompt: str,
-        storage: HistoryStorage | DatabaseHistoryStorage | None = None,
+        storage: HistoryStorage | DatabaseHistoryStorage | CachedHistoryStorage | None = None,
         max_history: int = 10,
+        background_persistence: bool = False,
+        persist_max_retries: int = 3,
+        persist_retry_delay: float = 0.5,
+        coalesce_messages: bool = False,
+        coalesce_max_messages: int = 10,
+        history_token_budget: int = 0,
+        summary_threshold: int = 0,
+        summary_keep_recent: int = 4,
+        prompt_cache_size: int = 10000,
+        cache_first_turn: bool = False,
+        router: ModelRouter | None = None,
+        mode: str = "normal",
     ) -> None:
         """
         Инициализация менеджера диалога
@@ -27,60 +49,322 @@ class ConversationManager:
         Args:
             llm_client: Клиент для работы с LLM
             system_prompt: Системный промпт для LLM
-            storage: Хранилище истории (HistoryStorage или DatabaseHistoryStorage)
+            storage: Хранилище истории (HistoryStorage, DatabaseHistoryStorage
+                или CachedHistoryStorage)
             max_history: Максимальное количество сообщений в истории (если storage не передан)
+            background_persistence: Сохранять ответы в фоне, не задерживая ответ пользователю
+                (только для асинхронных хранилищ)
+            persist_max_retries: Количество повторов фоновой записи ответа
+            persist_retry_delay: Базовая задержка между повторами в секундах
+            coalesce_messages: Объединять сообщения, пришедшие во время хода, в один запрос
+            coalesce_max_messages: Максимальное количество объединяемых сообщений
+            history_token_budget: Бюджет токенов промпта с историей (0 - без ограничения)
+            summary_threshold: Количество ходов, при котором старые ходы сжимаются
+                в краткое содержание (0 - сжатие отключено)
+            summary_keep_recent: Количество последних ходов, не подлежащих сжатию
+            prompt_cache_size: Количество пользователей в кеше отформатированной
+                истории промпта (0 - кеш отключен)
+            cache_first_turn: Разрешить кеш ответов LLM для первого сообщения диалога
+                (пустая история - одинаковые вопросы получают одинаковый ответ)
+            router: Выбор модели и лимита ответа для каждого хода (None - модель клиента)
+            mode: Режим диалога для маршрутизации: normal или admin
         """
         self.llm_client = llm_client
         self.system_prompt = system_prompt
+        self.cache_first_turn = cache_first_turn
+        self.router = router
+        self.mode = mode
+        self.expired_turns = 0
+        self.abandoned_turns = 0
+        self.wasted_tokens = 0
         self.storage = storage if storage is not None else HistoryStorage(max_history)
-        self.formatter = MessageFormatter()
+        self.formatter = MessageFormatter(
+            token_budget=history_token_budget,
+            token_estimator=self.storage.token_estimator,
+            cache_size=prompt_cache_size,
+        )
         self.prompt_loader = PromptLoader(prompt_text=system_prompt)
+        self.mailbox = UserMailbox(coalesce=coalesce_messages, max_batch=coalesce_max_messages)
+        self.persister: BackgroundPersister | None = None
+        if background_persistence and not isinstance(self.storage, HistoryStorage):
+            self.persister = BackgroundPersister(
+                self.storage.add_response,
+                max_retries=persist_max_retries,
+                retry_delay=persist_retry_delay,
+            )
+
+        self.summarizer: HistorySummarizer | None = None
+        self._compactions: dict[int, asyncio.Task[None]] = {}
+        if summary_threshold > 0:
+            self.summarizer = HistorySummarizer(
+                llm_client, threshold=summary_threshold, keep_recent=summary_keep_recent
+            )
+            if summary_threshold > self.storage.max_history:
+                logger.warning(
+                    f"summary_threshold={summary_threshold} больше max_history="
+                    f"{self.storage.max_history}: сжатие истории не будет запускаться"
+                )
 
         storage_type = type(self.storage).__name__
         logger.info(f"ConversationManager инициализирован (storage={storage_type})")
 
-    async def process_message(self, user_id: int, text: str) -> str:
+    async def process_message(
+        self, user_id: int, text: str, deadline: Deadline | None = None
+    ) -> str | None:
         """
         Обработать сообщение пользователя и получить ответ
 
+        Ходы одного пользователя выполняются строго по очереди. При включенном
+        объединении сообщение может войти в ход более раннего вызова - тогда
+        возвращается None, а ответ получает вызов, выполнивший ход.
+        По истечении срока или при отмене вызова (клиент ушел) ход прерывается
+        вместе с ожиданием очереди, записью в БД и запросом к LLM.
+
         Args:
             user_id: ID пользователя
             text: Текст сообщения
+            deadline: Срок хода (None - без ограничения)
 
         Returns:
-            Ответ от LLM
+            Ответ от LLM (None, если сообщение объединено с другим)
+
+        Raises:
+            DeadlineExceededError: Если срок хода истек
+        """
+        try:
+            async with deadline_scope(deadline, "ход диалога"):
+                response = await self.mailbox.submit(
+                    user_id,
+                    text,
+                    lambda merged_text: self._process_turn(user_id, merged_text, deadline),
+                )
+        except (DeadlineExceededError, asyncio.CancelledError) as e:
+            self._count_abandoned(user_id, e)
+            raise
+        return response
+
+    async def process_message_stream(
+        self, user_id: int, text: str, deadline: Deadline | None = None
+    ) -> AsyncGenerator[str, None]:
         """
-        # Сохраняем сообщение пользователя
-        if isinstance(self.storage, DatabaseHistoryStorage):
-            await self.storage.add_message(user_id, text, self.system_prompt)
+        Обработать сообщение пользователя, отдавая ответ LLM по мере генерации
+
+        Ход выполняется в очереди пользователя без объединения сообщений.
+        Ответ сохраняется в историю после получения последнего фрагмента;
+        если поток прерван (ошибка LLM, отключение клиента или истек срок),
+        ответ не сохраняется, а запрос к LLM закрывается.
+
+        Args:
+            user_id: ID пользователя
+            text: Текст сообщения
+            deadline: Срок хода (None - без ограничения)
+
+        Yields:
+            Фрагменты ответа LLM
+
+        Raises:
+            DeadlineExceededError: Если срок хода истек
+        """
+        parts: list[str] = []
+        try:
+            async with self.mailbox.exclusive(user_id):
+                context, messages = await self._begin_turn(user_id, text, deadline)
+
+                usage = LLMUsage()
+                route = self._route(messages)
+                # aclosing: прерванный ход сразу закрывает запрос к LLM и освобождает слот
+                stream = self.llm_client.stream_response(
+                    messages,
+                    usage=usage,
+                    model=route.model if route else None,
+                    max_tokens=route.max_tokens if route else None,
+                    deadline=deadline,
+                )
+                async with aclosing(stream) as deltas:
+                    async for delta in deltas:
+                        parts.append(delta)
+                        yield delta
+
+                await self._finish_turn(context, "".join(parts), usage)
+        except (DeadlineExceededError, asyncio.CancelledError, GeneratorExit) as e:
+            # Сгенерированная часть ответа не будет сохранена - это потраченные впустую токены
+            self.wasted_tokens += self.storage.token_estimator.count("".join(parts))
+            self._count_abandoned(user_id, e)
+            raise
+
+    async def _process_turn(self, user_id: int, text: str, deadline: Deadline | None) -> str:
+        """Один ход диалога: сохранение сообщения, запрос к LLM, сохранение ответа"""
+        context, messages = await self._begin_turn(user_id, text, deadline)
+
+        # Получаем ответ от LLM (первый ход без истории может быть взят из кеша)
+        cache = True if self.cache_first_turn and self._is_first_turn(context) else None
+        usage = LLMUsage()
+        route = self._route(messages)
+        response = await self.llm_client.get_response(
+            messages,
+            cache=cache,
+            usage=usage,
+            model=route.model if route else None,
+            max_tokens=route.max_tokens if route else None,
+            deadline=deadline,
+        )
+
+        try:
+            await self._finish_turn(context, response, usage)
+        except (DeadlineExceededError, asyncio.CancelledError):
+            # Ответ получен, но ход прерван до его сохранения
+            self.wasted_tokens += usage.completion_tokens or 0
+            raise
+        return response
+
+    def _count_abandoned(self, user_id: int, error: BaseException) -> None:
+        """Учесть ход, прерванный по сроку или отменой вызова"""
+        if isinstance(error, DeadlineExceededError):
+            self.expired_turns += 1
+            logger.warning(f"Ход user {user_id} прерван: {error}")
         else:
-            self.storage.add_message(user_id, text, self.system_prompt)
+            self.abandoned_turns += 1
+            logger.info(f"Ход user {user_id} отменен: клиент больше не ждет ответ")
+
+    def stats(self) -> dict[str, int]:
+        """
+        Статистика прерванных ходов
 
-        # Получаем контекст и форматируем для LLM
-        if isinstance(self.storage, DatabaseHistoryStorage):
-            context = await self.storage.get_context(user_id)
+        Returns:
+            Словарь с количеством ходов, прерванных по сроку и отмененных
+            (клиент ушел), и токенов ответов, сгенерированных впустую
+        """
+        return {
+            "expired": self.expired_turns,
+            "abandoned": self.abandoned_turns,
+            "wasted_tokens": self.wasted_tokens,
+            "merged_messages": self.mailbox.merged_messages,
+        }
+
+    def _route(self, messages: list[dict[str, str]]) -> Route | None:
+        """Маршрут хода по промпту (None - маршрутизация отключена)"""
+        if self.router is None:
+            return None
+        return self.router.route(messages, self.mode)
+
+    @staticmethod
+    def _is_first_turn(context: ConversationContext) -> bool:
+        """Ход без истории: единственное сообщение, нет ответов и краткого содержания"""
+        return len(context.messages) == 1 and not context.responses and not context.summary
+
+    async def _begin_turn(
+        self, user_id: int, text: str, deadline: Deadline | None
+    ) -> tuple[ConversationContext, list[dict[str, str]]]:
+        """Начало хода: сохранение сообщения и сборка промпта для LLM"""
+        # Срок мог истечь в очереди пользователя - тогда сообщение не записывается
+        if deadline is not None:
+            deadline.check("очередь пользователя")
+        # Сброс нагрузки: при недоступном upstream ход не пишет в БД и не ждет таймаутов
+        self.llm_client.ensure_available()
+
+        # Предыдущий ответ должен попасть в историю до чтения контекста
+        if self.persister is not None:
+            await self.persister.wait_for(user_id)
+
+        # Сохраняем сообщение пользователя и получаем контекст одним ходом
+        if isinstance(self.storage, HistoryStorage):
+            context = self.storage.add_message_and_get_context(user_id, text, self.system_prompt)
         else:
-            context = self.storage.get_context(user_id)
+            context = await self.storage.add_message_and_get_context(
+                user_id, text, self.system_prompt, deadline
+            )
 
-        messages = self.formatter.format_for_llm(context, self.system_prompt)
+        return context, self.formatter.format_for_llm(context, self.system_prompt)
 
-        # Получаем ответ от LLM
-        response = await self.llm_client.get_response(messages)
+    async def _finish_turn(
+        self, context: ConversationContext, response: str, usage: LLMUsage
+    ) -> None:
+        """Завершение хода: сохранение ответа и запуск сжатия истории"""
+        user_id = context.user_id
+        # Модель, фактически выдавшая ответ (с учетом резервных)
+        model = usage.model or self.llm_client.model
 
-        # Сохраняем ответ
-        if isinstance(self.storage, DatabaseHistoryStorage):
-            await self.storage.add_response(user_id, response, self.llm_client.model)
+        # Сохраняем ответ (в фоновом режиме - без ожидания коммита)
+        if isinstance(self.storage, HistoryStorage):
+            self.storage.add_response(user_id, response, model, usage)
+        elif self.persister is not None:
+            self.persister.submit(user_id, response, model, usage)
         else:
-            self.storage.add_response(user_id, response, self.llm_client.model)
+            await self.storage.add_response(user_id, response, model, usage)
 
-        return response
+        if self.summarizer is not None and self.summarizer.should_compact(context):
+            self._schedule_compaction(self.summarizer, context)
+
+    def _schedule_compaction(
+        self, summarizer: HistorySummarizer, context: ConversationContext
+    ) -> None:
+        """Запустить фоновое сжатие истории пользователя (не более одного за раз)"""
+        user_id = context.user_id
+        if user_id in self._compactions:
+            return
+
+        # Снимок: контекст HistoryStorage продолжает изменяться следующими ходами
+        snapshot = ConversationContext(
+            user_id=user_id,
+            messages=list(context.messages),
+            responses=list(context.responses),
+            system_prompt=context.system_prompt,
+            summary=context.summary,
+        )
+        task = asyncio.create_task(self._compact(summarizer, snapshot))
+        self._compactions[user_id] = task
+
+        def forget(done: asyncio.Task[None]) -> None:
+            if self._compactions.get(user_id) is done:
+                del self._compactions[user_id]
+
+        task.add_done_callback(forget)
+
+    async def _compact(self, summarizer: HistorySummarizer, snapshot: ConversationContext) -> None:
+        """Пересказать старые ходы вне очереди пользователя и применить результат в ней"""
+        user_id = snapshot.user_id
+        try:
+            compaction = await summarizer.summarize(snapshot)
+            if compaction is None:
+                return
+
+            async with self.mailbox.exclusive(user_id):
+                if self.persister is not None:
+                    await self.persister.wait_for(user_id)
+
+                if isinstance(self.storage, HistoryStorage):
+                    self.storage.compact_history(user_id, compaction)
+                else:
+                    await self.storage.compact_history(user_id, compaction)
+        except Exception as e:
+            logger.error(f"Ошибка сжатия истории user {user_id}: {e}")
 
     async def clear_history(self, user_id: int) -> None:
         """Очистить историю диалога пользователя"""
-        if isinstance(self.storage, DatabaseHistoryStorage):
-            await self.storage.clear(user_id)
-        else:
-            self.storage.clear(user_id)
+        # Незавершенное сжатие относится к очищаемой истории
+        compaction = self._compactions.pop(user_id, None)
+        if compaction is not None:
+            compaction.cancel()
+
+        async with self.mailbox.exclusive(user_id):
+            if self.persister is not None:
+                await self.persister.wait_for(user_id)
+
+            if isinstance(self.storage, HistoryStorage):
+                self.storage.clear(user_id)
+            else:
+                await self.storage.clear(user_id)
+            self.formatter.invalidate(user_id)
+
+    async def close(self) -> None:
+        """Дождаться фоновой записи ответов (вызывать до закрытия хранилища)"""
+        # Сжатие необязательно: прерываем, оно повторится на следующем ходе
+        for task in list(self._compactions.values()):
+            task.cancel()
+        await asyncio.gather(*self._compactions.values(), return_exceptions=True)
+
+        if self.persister is not None:
+            await self.persister.close()
 
     def get_role_description(self) -> str:
         """
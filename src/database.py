@@ -15,6 +15,7 @@ from sqlalchemy import (
     String,
     Table,
     Text,
+    false,
 )
 from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
@@ -32,8 +33,13 @@ conversations = Table(
     Column("system_prompt", Text, nullable=False),
     Column("created_at", DateTime, nullable=False, default=datetime.now),
     Column("updated_at", DateTime, nullable=False, default=datetime.now, onupdate=datetime.now),
-    # Индекс для быстрого поиска по user_id
-    Index("idx_conversations_user_id", "user_id"),
+    # Счетчики последовательности (head) сообщений и ответов для O(1) обрезки истории
+    Column("message_seq", Integer, nullable=False, default=0, server_default="0"),
+    Column("response_seq", Integer, nullable=False, default=0, server_default="0"),
+    # Краткое содержание сжатых старых ходов диалога
+    Column("summary", Text, nullable=True),
+    # Head-счетчик ходов (модель хранения turns)
+    Column("turn_seq", Integer, nullable=False, default=0, server_default="0"),
 )
 
 # Таблица user_messages - сообщения пользователей
@@ -52,10 +58,13 @@ user_messages = Table(
     Column("content_length", Integer, nullable=False),
     Column("timestamp", DateTime, nullable=False, default=datetime.now),
     Column("is_deleted", Boolean, nullable=False, default=False),
+    # Порядковый номер сообщения внутри диалога
+    Column("seq", Integer, nullable=False, default=0, server_default="0"),
+    # Оценка количества токенов (для окна истории по бюджету токенов)
+    Column("token_count", Integer, nullable=False, default=0, server_default="0"),
     # Индексы для оптимизации запросов
     Index("idx_user_messages_conversation_id", "conversation_id"),
     Index("idx_user_messages_user_id", "user_id"),
-    Index("idx_user_messages_is_deleted", "is_deleted"),
 )
 
 # Таблица llm_responses - ответы LLM
@@ -74,9 +83,102 @@ llm_responses = Table(
     Column("model_used", String(100), nullable=False),
     Column("timestamp", DateTime, nullable=False, default=datetime.now),
     Column("is_deleted", Boolean, nullable=False, default=False),
+    # Порядковый номер ответа внутри диалога
+    Column("seq", Integer, nullable=False, default=0, server_default="0"),
+    # Оценка количества токенов (для окна истории по бюджету токенов)
+    Column("token_count", Integer, nullable=False, default=0, server_default="0"),
+    # Расход токенов и задержка вызова LLM (NULL - ответ без вызова API: кеш, объединение)
+    Column("prompt_tokens", Integer, nullable=True),
+    Column("completion_tokens", Integer, nullable=True),
+    Column("latency_ms", Integer, nullable=True),
+    Column("first_token_ms", Integer, nullable=True),
     # Индексы для оптимизации запросов
     Index("idx_llm_responses_conversation_id", "conversation_id"),
-    Index("idx_llm_responses_is_deleted", "is_deleted"),
+)
+
+# Таблица turns - ход диалога: сообщение пользователя и ответ LLM в одной строке
+# (альтернативная модель хранения, HISTORY_STORAGE=turns)
+turns = Table(
+    "turns",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column(
+        "conversation_id",
+        Integer,
+        ForeignKey("conversations.id", ondelete="CASCADE"),
+        nullable=False,
+    ),
+    Column("user_id", BigInteger, nullable=False),
+    # Порядковый номер хода внутри диалога
+    Column("seq", Integer, nullable=False),
+    Column("user_text", Text, nullable=False),
+    Column("user_content_length", Integer, nullable=False),
+    Column("user_token_count", Integer, nullable=False, default=0, server_default="0"),
+    Column("user_timestamp", DateTime, nullable=False, default=datetime.now),
+    # Ответ LLM (NULL, пока ответ не получен или если запрос к LLM не удался)
+    Column("response", Text, nullable=True),
+    Column("response_content_length", Integer, nullable=True),
+    Column("response_token_count", Integer, nullable=False, default=0, server_default="0"),
+    Column("response_timestamp", DateTime, nullable=True),
+    Column("model_used", String(100), nullable=True),
+    Column("prompt_tokens", Integer, nullable=True),
+    Column("completion_tokens", Integer, nullable=True),
+    Column("latency_ms", Integer, nullable=True),
+    Column("first_token_ms", Integer, nullable=True),
+    Column("is_deleted", Boolean, nullable=False, default=False),
+)
+
+# Составные индексы под горячие запросы.
+# Частичные индексы (WHERE NOT is_deleted) содержат только активную историю,
+# поэтому загрузка окна и обрезка читают несколько строк индекса вместо
+# всех записей диалога, а удаленные записи не раздувают индекс.
+
+# Поиск активного диалога: WHERE user_id = ? ORDER BY created_at DESC LIMIT 1
+Index(
+    "idx_conversations_user_created",
+    conversations.c.user_id,
+    conversations.c.created_at.desc(),
+)
+
+# Загрузка окна истории и обрезка: WHERE conversation_id = ? AND NOT is_deleted ORDER BY seq DESC
+Index(
+    "idx_user_messages_active_conversation_seq",
+    user_messages.c.conversation_id,
+    user_messages.c.seq.desc(),
+    postgresql_where=user_messages.c.is_deleted == false(),
+    sqlite_where=user_messages.c.is_deleted == false(),
+)
+Index(
+    "idx_llm_responses_active_conversation_seq",
+    llm_responses.c.conversation_id,
+    llm_responses.c.seq.desc(),
+    postgresql_where=llm_responses.c.is_deleted == false(),
+    sqlite_where=llm_responses.c.is_deleted == false(),
+)
+
+# Загрузка окна ходов: WHERE conversation_id = ? AND NOT is_deleted ORDER BY seq DESC
+Index(
+    "idx_turns_active_conversation_seq",
+    turns.c.conversation_id,
+    turns.c.seq.desc(),
+    postgresql_where=turns.c.is_deleted == false(),
+    sqlite_where=turns.c.is_deleted == false(),
+)
+
+# Статистика дашборда: WHERE timestamp >= ? AND NOT is_deleted
+Index(
+    "idx_user_messages_active_timestamp",
+    user_messages.c.timestamp,
+    postgresql_where=user_messages.c.is_deleted == false(),
+    sqlite_where=user_messages.c.is_deleted == false(),
+)
+
+# Метрики LLM на дашборде: WHERE timestamp >= ? AND latency_ms IS NOT NULL
+Index(
+    "idx_llm_responses_timestamp_measured",
+    llm_responses.c.timestamp,
+    postgresql_where=llm_responses.c.latency_ms.isnot(None),
+    sqlite_where=llm_responses.c.latency_ms.isnot(None),
 )
 
 
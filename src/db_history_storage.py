@@ -1,31 +1,120 @@
 """Хранение истории диалогов в базе данных (Repository pattern)"""
 
 import logging
+from bisect import bisect_left, bisect_right
+from collections.abc import AsyncIterator, Sequence
+from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import Any
 
-from sqlalchemy import and_, insert, select, update
-from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy import Column, ColumnElement, Select, Table, and_, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
 
+from .conversation_id_cache import ConversationIdCache
 from .database import conversations, llm_responses, user_messages
-from .models import ConversationContext, LLMResponse, UserMessage
+from .deadline import Deadline, deadline_scope
+from .models import Compaction, ConversationContext, LLMResponse, LLMUsage, UserMessage
+from .token_estimator import TokenEstimator, default_estimator
+from .write_behind_buffer import PendingWrite, WriteBehindBuffer
 
 logger = logging.getLogger(__name__)
 
 
+def usage_columns(usage: LLMUsage | None) -> dict[str, int | None]:
+    """
+    Значения колонок расхода токенов и задержки ответа LLM
+
+    Args:
+        usage: Расход и задержка вызова LLM (None - неизвестны)
+
+    Returns:
+        Словарь prompt_tokens, completion_tokens, latency_ms, first_token_ms
+    """
+    if usage is None:
+        usage = LLMUsage()
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "latency_ms": usage.latency_ms,
+        "first_token_ms": usage.first_token_ms,
+    }
+
+
+def align_window(context: ConversationContext) -> None:
+    """
+    Выровнять окна сообщений и ответов по первому общему ходу
+
+    Окна таблиц обрезаются независимо (по max_history и бюджету токенов),
+    а MessageFormatter сопоставляет сообщения и ответы по индексу. Поэтому
+    отбрасываются ответы старше первого сообщения окна и сообщения раньше
+    того, на которое отвечает первый ответ окна.
+
+    Args:
+        context: Контекст с окнами в хронологическом порядке (изменяется на месте)
+    """
+    messages, responses = context.messages, context.responses
+    if not messages:
+        return
+
+    first = bisect_left([r.timestamp for r in responses], messages[0].timestamp)
+    if first:
+        context.responses = responses = responses[first:]
+    if not responses:
+        return
+
+    # Ответ относится к последнему сообщению, отправленному не позже него
+    start = bisect_right([m.timestamp for m in messages], responses[0].timestamp) - 1
+    if start > 0:
+        context.messages = messages[start:]
+
+
 class DatabaseHistoryStorage:
     """Хранилище истории диалогов в PostgreSQL с использованием Repository pattern"""
 
-    def __init__(self, engine: AsyncEngine, max_history: int = 10) -> None:
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        max_history: int = 10,
+        conversation_cache_size: int = 10000,
+        conversation_cache_ttl: float = 3600.0,
+        write_behind: bool = False,
+        write_batch_size: int = 100,
+        write_flush_interval: float = 0.05,
+        history_token_budget: int = 0,
+        token_estimator: TokenEstimator | None = None,
+    ) -> None:
         """
         Инициализация хранилища
 
         Args:
             engine: Асинхронный движок SQLAlchemy
             max_history: Максимальное количество сообщений в истории
+            conversation_cache_size: Размер кеша user_id → conversation_id (0 - отключен)
+            conversation_cache_ttl: Время жизни записи кеша в секундах
+            write_behind: Отложенная пакетная запись сообщений и ответов
+            write_batch_size: Размер пачки write-behind записи
+            write_flush_interval: Максимальная задержка write-behind записи в секундах
+            history_token_budget: Бюджет токенов окна истории (0 - только лимит max_history)
+            token_estimator: Оценщик токенов для новых записей
         """
         self.engine = engine
         self.max_history = max_history
-        logger.info(f"DatabaseHistoryStorage инициализирован (max_history={max_history})")
+        self.history_token_budget = history_token_budget
+        self.token_estimator = token_estimator or default_estimator
+        self.conversation_cache = ConversationIdCache(
+            max_size=conversation_cache_size, ttl=conversation_cache_ttl
+        )
+        self.write_behind: WriteBehindBuffer | None = None
+        if write_behind:
+            self.write_behind = WriteBehindBuffer(
+                self._write_batch,
+                batch_size=write_batch_size,
+                flush_interval=write_flush_interval,
+            )
+        logger.info(
+            f"DatabaseHistoryStorage инициализирован "
+            f"(max_history={max_history}, write_behind={write_behind})"
+        )
 
     async def get_or_create_context(self, user_id: int, system_prompt: str) -> ConversationContext:
         """
@@ -38,107 +127,20 @@ class DatabaseHistoryStorage:
         Returns:
             Контекст диалога пользователя
         """
-        async with self.engine.begin() as conn:
-            # Проверяем, есть ли активный диалог для пользователя
-            result = await conn.execute(
-                select(conversations.c.id, conversations.c.system_prompt)
-                .where(conversations.c.user_id == user_id)
-                .order_by(conversations.c.created_at.desc())
-                .limit(1)
-            )
-            row = result.first()
-
-            if row:
-                conversation_id = row[0]
-                logger.debug(f"Найден существующий контекст для user {user_id}")
-            else:
-                # Создаем новый диалог
-                result = await conn.execute(
-                    insert(conversations)
-                    .values(
-                        user_id=user_id,
-                        system_prompt=system_prompt,
-                        created_at=datetime.now(),
-                        updated_at=datetime.now(),
-                    )
-                    .returning(conversations.c.id)
-                )
-                conversation_id = result.scalar_one()
-                logger.debug(f"Создан новый контекст для user {user_id}")
-
-            # Загружаем сообщения (не удаленные, последние max_history)
-            messages_result = await conn.execute(
-                select(
-                    user_messages.c.id,
-                    user_messages.c.user_id,
-                    user_messages.c.text,
-                    user_messages.c.timestamp,
-                    user_messages.c.content_length,
-                    user_messages.c.is_deleted,
-                )
-                .where(
-                    and_(
-                        user_messages.c.conversation_id == conversation_id,
-                        user_messages.c.is_deleted == False,  # noqa: E712
-                    )
-                )
-                .order_by(user_messages.c.timestamp.desc())
-                .limit(self.max_history)
-            )
-            messages_rows = messages_result.all()
-
-            # Загружаем ответы (не удаленные, последние max_history)
-            responses_result = await conn.execute(
-                select(
-                    llm_responses.c.id,
-                    llm_responses.c.content,
-                    llm_responses.c.timestamp,
-                    llm_responses.c.model_used,
-                    llm_responses.c.content_length,
-                    llm_responses.c.is_deleted,
-                )
-                .where(
-                    and_(
-                        llm_responses.c.conversation_id == conversation_id,
-                        llm_responses.c.is_deleted == False,  # noqa: E712
-                    )
-                )
-                .order_by(llm_responses.c.timestamp.desc())
-                .limit(self.max_history)
-            )
-            responses_rows = responses_result.all()
-
-        # Преобразуем в модели (в обратном порядке для сохранения хронологии)
-        messages = [
-            UserMessage(
-                id=row[0],
-                user_id=row[1],
-                text=row[2],
-                timestamp=row[3],
-                is_deleted=row[5],
+        pending = self._pending_for(user_id)
+        async with self._transaction(user_id) as conn:
+            conversation_id, _, summary = await self._get_or_create_conversation(
+                conn, user_id, system_prompt
             )
-            for row in reversed(messages_rows)
-        ]
-
-        responses = [
-            LLMResponse(
-                id=row[0],
-                content=row[1],
-                timestamp=row[2],
-                model_used=row[3],
-                is_deleted=row[5],
+            context = await self._load_context(
+                conn, conversation_id, user_id, system_prompt, summary
             )
-            for row in reversed(responses_rows)
-        ]
 
-        return ConversationContext(
-            user_id=user_id,
-            messages=messages,
-            responses=responses,
-            system_prompt=system_prompt,
-        )
+        return self._apply_pending(context, pending)
 
-    async def add_message(self, user_id: int, text: str, system_prompt: str) -> None:
+    async def add_message(
+        self, user_id: int, text: str, system_prompt: str, deadline: Deadline | None = None
+    ) -> UserMessage:
         """
         Добавить сообщение пользователя
 
@@ -146,56 +148,80 @@ class DatabaseHistoryStorage:
             user_id: ID пользователя
             text: Текст сообщения
             system_prompt: Системный промпт
+            deadline: Срок хода: после него сообщение не записывается, а ожидание
+                соединения пула и транзакция отменяются (None - без ограничения)
+
+        Returns:
+            Записанное сообщение (при write-behind - поставленное в очередь,
+            id будет присвоен при сбросе буфера)
+
+        Raises:
+            DeadlineExceededError: Если срок хода истек
         """
-        async with self.engine.begin() as conn:
-            # Получаем или создаем conversation_id
-            result = await conn.execute(
-                select(conversations.c.id)
-                .where(conversations.c.user_id == user_id)
-                .order_by(conversations.c.created_at.desc())
-                .limit(1)
+        if deadline is not None:
+            deadline.check("запись сообщения")
+        if self.write_behind is not None:
+            message = UserMessage(
+                user_id=user_id,
+                text=text,
+                timestamp=datetime.now(),
+                token_count=self.token_estimator.count(text),
             )
-            row = result.first()
+            await self.write_behind.add(user_id, system_prompt, message)
+            logger.info(f"Сообщение от user {user_id} поставлено в очередь записи")
+            return message
 
-            if row:
-                conversation_id = row[0]
-                # Обновляем updated_at
-                await conn.execute(
-                    update(conversations)
-                    .where(conversations.c.id == conversation_id)
-                    .values(updated_at=datetime.now())
-                )
-            else:
-                # Создаем новый диалог
-                result = await conn.execute(
-                    insert(conversations)
-                    .values(
-                        user_id=user_id,
-                        system_prompt=system_prompt,
-                        created_at=datetime.now(),
-                        updated_at=datetime.now(),
-                    )
-                    .returning(conversations.c.id)
-                )
-                conversation_id = result.scalar_one()
+        async with deadline_scope(deadline, "запись сообщения"), self._transaction(user_id) as conn:
+            conversation_id, _, _ = await self._get_or_create_conversation(
+                conn, user_id, system_prompt
+            )
+            message = await self._insert_message(conn, conversation_id, user_id, text)
 
-            # Добавляем сообщение
-            content_length = len(text)
-            await conn.execute(
-                insert(user_messages).values(
-                    conversation_id=conversation_id,
-                    user_id=user_id,
-                    text=text,
-                    content_length=content_length,
-                    timestamp=datetime.now(),
-                    is_deleted=False,
-                )
+        logger.info(f"Добавлено сообщение от user {user_id} ({len(text)} символов)")
+        return message
+
+    async def add_message_and_get_context(
+        self, user_id: int, text: str, system_prompt: str, deadline: Deadline | None = None
+    ) -> ConversationContext:
+        """
+        Добавить сообщение пользователя и загрузить контекст за одну транзакцию
+
+        Объединяет add_message, обрезку истории и get_context для одного хода
+        диалога: поиск диалога выполняется один раз, все запросы идут через
+        одно соединение из пула.
+
+        Args:
+            user_id: ID пользователя
+            text: Текст сообщения
+            system_prompt: Системный промпт (используется при создании диалога)
+            deadline: Срок хода: после него сообщение не записывается, а ожидание
+                соединения пула и транзакция отменяются (None - без ограничения)
+
+        Returns:
+            Контекст диалога с добавленным сообщением
+
+        Raises:
+            DeadlineExceededError: Если срок хода истек
+        """
+        if self.write_behind is not None:
+            await self.add_message(user_id, text, system_prompt, deadline)
+            return await self._load_with_pending(user_id, system_prompt)
+
+        async with deadline_scope(deadline, "запись сообщения"), self._transaction(user_id) as conn:
+            conversation_id, stored_prompt, summary = await self._get_or_create_conversation(
+                conn, user_id, system_prompt
+            )
+            await self._insert_message(conn, conversation_id, user_id, text)
+            context = await self._load_context(
+                conn, conversation_id, user_id, stored_prompt, summary
             )
 
-        logger.info(f"Добавлено сообщение от user {user_id} ({content_length} символов)")
-        await self._trim_history(user_id)
+        logger.info(f"Добавлено сообщение от user {user_id} ({len(text)} символов)")
+        return context
 
-    async def add_response(self, user_id: int, content: str, model: str) -> None:
+    async def add_response(
+        self, user_id: int, content: str, model: str, usage: LLMUsage | None = None
+    ) -> LLMResponse | None:
         """
         Добавить ответ LLM
 
@@ -203,45 +229,55 @@ class DatabaseHistoryStorage:
             user_id: ID пользователя
             content: Содержимое ответа
             model: Модель LLM
+            usage: Расход токенов и задержка вызова LLM (None - неизвестны)
+
+        Returns:
+            Записанный ответ (при write-behind - поставленный в очередь)
+            или None, если у пользователя нет диалога
         """
-        async with self.engine.begin() as conn:
-            # Получаем conversation_id
-            result = await conn.execute(
-                select(conversations.c.id)
-                .where(conversations.c.user_id == user_id)
-                .order_by(conversations.c.created_at.desc())
-                .limit(1)
-            )
-            row = result.first()
+        response = LLMResponse(
+            content=content,
+            timestamp=datetime.now(),
+            model_used=model,
+            token_count=self.token_estimator.count(content),
+            usage=usage,
+        )
+        if self.write_behind is not None:
+            await self.write_behind.add(user_id, "", response)
+            logger.info(f"Ответ для user {user_id} поставлен в очередь записи")
+            return response
+
+        async with self._transaction(user_id) as conn:
+            row = await self._find_conversation(conn, user_id)
 
             if not row:
                 logger.warning(f"Попытка добавить ответ для несуществующего user {user_id}")
-                return
+                return None
 
             conversation_id = row[0]
 
-            # Обновляем updated_at
-            await conn.execute(
-                update(conversations)
-                .where(conversations.c.id == conversation_id)
-                .values(updated_at=datetime.now())
-            )
-
-            # Добавляем ответ
-            content_length = len(content)
-            await conn.execute(
-                insert(llm_responses).values(
+            # Добавляем ответ и обрезаем окно ответов
+            seq = await self._next_seq(conn, conversation_id, conversations.c.response_seq)
+            result = await conn.execute(
+                insert(llm_responses)
+                .values(
                     conversation_id=conversation_id,
                     content=content,
-                    content_length=content_length,
+                    content_length=response.content_length,
                     model_used=model,
-                    timestamp=datetime.now(),
+                    timestamp=response.timestamp,
                     is_deleted=False,
+                    seq=seq,
+                    token_count=response.token_count,
+                    **usage_columns(usage),
                 )
+                .returning(llm_responses.c.id)
             )
+            response.id = result.scalar_one()
+            await self._trim_window(conn, llm_responses, conversation_id, seq)
 
-        logger.info(f"Добавлен ответ для user {user_id} ({content_length} символов)")
-        await self._trim_history(user_id)
+        logger.info(f"Добавлен ответ для user {user_id} ({len(content)} символов)")
+        return response
 
     async def get_context(self, user_id: int) -> ConversationContext | None:
         """
@@ -253,23 +289,17 @@ class DatabaseHistoryStorage:
         Returns:
             Контекст диалога или None
         """
-        async with self.engine.begin() as conn:
-            # Проверяем, есть ли диалог
-            result = await conn.execute(
-                select(conversations.c.system_prompt)
-                .where(conversations.c.user_id == user_id)
-                .order_by(conversations.c.created_at.desc())
-                .limit(1)
-            )
-            row = result.first()
+        pending = self._pending_for(user_id)
+        if pending:
+            return await self._load_with_pending(user_id, pending[0][1])
+
+        async with self._transaction(user_id) as conn:
+            row = await self._find_conversation(conn, user_id)
 
             if not row:
                 return None
 
-            system_prompt = row[0]
-
-        # Используем get_or_create_context для загрузки полного контекста
-        return await self.get_or_create_context(user_id, system_prompt)
+            return await self._load_context(conn, row[0], user_id, row[1], row[2])
 
     async def clear(self, user_id: int) -> None:
         """
@@ -278,104 +308,604 @@ class DatabaseHistoryStorage:
         Args:
             user_id: ID пользователя
         """
-        async with self.engine.begin() as conn:
-            # Получаем conversation_id
-            result = await conn.execute(
-                select(conversations.c.id)
-                .where(conversations.c.user_id == user_id)
-                .order_by(conversations.c.created_at.desc())
-                .limit(1)
-            )
-            row = result.first()
+        # Несброшенные записи должны попасть в БД до soft delete
+        if self.write_behind is not None:
+            await self.write_behind.flush()
+
+        async with self._transaction(user_id) as conn:
+            row = await self._find_conversation(conn, user_id)
 
             if not row:
                 return
 
             conversation_id = row[0]
+            self.conversation_cache.invalidate(user_id)
+
+            await conn.execute(
+                update(conversations)
+                .where(conversations.c.id == conversation_id)
+                .values(summary=None)
+            )
 
             # Soft delete всех сообщений
             await conn.execute(
                 update(user_messages)
-                .where(user_messages.c.conversation_id == conversation_id)
+                .where(
+                    and_(
+                        user_messages.c.conversation_id == conversation_id,
+                        user_messages.c.is_deleted == False,  # noqa: E712
+                    )
+                )
                 .values(is_deleted=True)
             )
 
             # Soft delete всех ответов
             await conn.execute(
                 update(llm_responses)
-                .where(llm_responses.c.conversation_id == conversation_id)
+                .where(
+                    and_(
+                        llm_responses.c.conversation_id == conversation_id,
+                        llm_responses.c.is_deleted == False,  # noqa: E712
+                    )
+                )
                 .values(is_deleted=True)
             )
 
         logger.info(f"История для user {user_id} очищена (soft delete)")
 
-    async def _trim_history(self, user_id: int) -> None:
+    async def compact_history(self, user_id: int, compaction: Compaction) -> None:
         """
-        Ограничить историю до max_history (soft delete старых записей)
+        Заменить старые записи истории кратким содержанием
+
+        Краткое содержание сохраняется в диалоге, а сообщения и ответы до
+        последних сжатых (по id) помечаются удаленными - одной транзакцией.
 
         Args:
             user_id: ID пользователя
+            compaction: Краткое содержание и последние сжатые записи
         """
-        async with self.engine.begin() as conn:
-            # Получаем conversation_id
-            result = await conn.execute(
-                select(conversations.c.id)
-                .where(conversations.c.user_id == user_id)
-                .order_by(conversations.c.created_at.desc())
-                .limit(1)
-            )
-            row = result.first()
+        if self.write_behind is not None:
+            await self.write_behind.flush()
+
+        boundaries = (
+            (user_messages, compaction.last_message.id),
+            (llm_responses, compaction.last_response.id),
+        )
+        if any(last_id is None for _, last_id in boundaries):
+            logger.warning(f"Сжатие истории user {user_id} пропущено: записи не сохранены")
+            return
+
+        async with self._transaction(user_id) as conn:
+            row = await self._find_conversation(conn, user_id)
 
             if not row:
                 return
 
             conversation_id = row[0]
-
-            # Находим ID старых сообщений (оставляем последние max_history)
-            messages_result = await conn.execute(
-                select(user_messages.c.id)
-                .where(
-                    and_(
-                        user_messages.c.conversation_id == conversation_id,
-                        user_messages.c.is_deleted == False,  # noqa: E712
-                    )
-                )
-                .order_by(user_messages.c.timestamp.desc())
-                .offset(self.max_history)
+            await conn.execute(
+                update(conversations)
+                .where(conversations.c.id == conversation_id)
+                .values(summary=compaction.summary)
             )
-            old_message_ids = [row[0] for row in messages_result.all()]
-
-            if old_message_ids:
+            self.conversation_cache.put(user_id, conversation_id, row[1], compaction.summary)
+            for table, last_id in boundaries:
                 await conn.execute(
-                    update(user_messages)
-                    .where(user_messages.c.id.in_(old_message_ids))
+                    update(table)
+                    .where(
+                        and_(
+                            table.c.conversation_id == conversation_id,
+                            table.c.is_deleted == False,  # noqa: E712
+                            table.c.id <= last_id,
+                        )
+                    )
                     .values(is_deleted=True)
                 )
 
-            # Находим ID старых ответов
-            responses_result = await conn.execute(
-                select(llm_responses.c.id)
-                .where(
-                    and_(
-                        llm_responses.c.conversation_id == conversation_id,
-                        llm_responses.c.is_deleted == False,  # noqa: E712
-                    )
+        logger.info(f"История user {user_id} сжата: {compaction.turns} ходов")
+
+    async def flush(self) -> None:
+        """Сбросить буфер отложенной записи (если включен)"""
+        if self.write_behind is not None:
+            await self.write_behind.flush()
+
+    async def close(self) -> None:
+        """Остановить хранилище, дождавшись записи буфера write-behind"""
+        if self.write_behind is not None:
+            await self.write_behind.close()
+
+    async def _load_with_pending(self, user_id: int, system_prompt: str) -> ConversationContext:
+        """Загрузить контекст из БД и наложить несброшенные записи буфера"""
+        pending = self._pending_for(user_id)
+        async with self._transaction(user_id) as conn:
+            row = await self._find_conversation(conn, user_id)
+            if row:
+                context = await self._load_context(conn, row[0], user_id, row[1], row[2])
+            else:
+                context = ConversationContext(
+                    user_id=user_id, messages=[], responses=[], system_prompt=system_prompt
                 )
-                .order_by(llm_responses.c.timestamp.desc())
-                .offset(self.max_history)
+
+        return self._apply_pending(context, pending)
+
+    def _pending_for(self, user_id: int) -> list[PendingWrite]:
+        """Снимок несброшенных записей пользователя (пустой без write-behind)"""
+        if self.write_behind is None:
+            return []
+        return self.write_behind.pending_for(user_id)
+
+    def _apply_pending(
+        self, context: ConversationContext, pending_before: list[PendingWrite]
+    ) -> ConversationContext:
+        """
+        Наложить несброшенные записи write-behind буфера на контекст (read-your-writes)
+
+        Пачка могла закоммититься во время чтения из БД, поэтому объединяются
+        снимки буфера до и после чтения, а записи, уже загруженные из БД,
+        отбрасываются по (timestamp, текст).
+
+        Args:
+            context: Контекст, загруженный из БД
+            pending_before: Снимок буфера, сделанный до чтения из БД
+
+        Returns:
+            Контекст с несброшенными записями, обрезанный до max_history
+        """
+        seen = {id(item) for item in pending_before}
+        pending = pending_before + [
+            item for item in self._pending_for(context.user_id) if id(item) not in seen
+        ]
+        if not pending:
+            return context
+
+        loaded = {(m.timestamp, m.text) for m in context.messages}
+        loaded.update((r.timestamp, r.content) for r in context.responses)
+
+        for _, _, record in pending:
+            if isinstance(record, UserMessage):
+                if (record.timestamp, record.text) not in loaded:
+                    context.messages.append(record)
+            elif (record.timestamp, record.content) not in loaded:
+                context.responses.append(record)
+
+        context.messages = context.messages[-self.max_history :]
+        context.responses = context.responses[-self.max_history :]
+        align_window(context)
+        return context
+
+    async def _write_batch(self, batch: list[PendingWrite]) -> None:
+        """
+        Записать пачку write-behind буфера одной транзакцией
+
+        Для каждого диалога счетчики seq резервируются одним UPDATE на пачку,
+        строки вставляются многострочными INSERT, затем окно обрезается
+        диапазоном seq.
+
+        Args:
+            batch: Записи буфера в порядке добавления
+        """
+        by_user: dict[int, list[PendingWrite]] = {}
+        for item in batch:
+            by_user.setdefault(item[0], []).append(item)
+
+        message_rows: list[dict[str, object]] = []
+        response_rows: list[dict[str, object]] = []
+        written_messages: list[UserMessage] = []
+        written_responses: list[LLMResponse] = []
+        trims: list[tuple[Table, int, int, int]] = []
+
+        async with self._transaction(*by_user) as conn:
+            for user_id, items in by_user.items():
+                messages = [r for _, _, r in items if isinstance(r, UserMessage)]
+                responses = [r for _, _, r in items if isinstance(r, LLMResponse)]
+
+                if messages:
+                    system_prompt = next(p for _, p, r in items if isinstance(r, UserMessage))
+                    conversation_id, _, _ = await self._get_or_create_conversation(
+                        conn, user_id, system_prompt
+                    )
+                else:
+                    row = await self._find_conversation(conn, user_id)
+                    if not row:
+                        logger.warning(f"Попытка добавить ответ для несуществующего user {user_id}")
+                        continue
+                    conversation_id = row[0]
+
+                if messages:
+                    head = await self._next_seq(
+                        conn, conversation_id, conversations.c.message_seq, len(messages)
+                    )
+                    first_seq = head - len(messages) + 1
+                    message_rows.extend(
+                        {
+                            "conversation_id": conversation_id,
+                            "user_id": user_id,
+                            "text": m.text,
+                            "content_length": m.content_length,
+                            "timestamp": m.timestamp,
+                            "is_deleted": False,
+                            "seq": first_seq + i,
+                            "token_count": m.token_count,
+                        }
+                        for i, m in enumerate(messages)
+                    )
+                    written_messages.extend(messages)
+                    trims.append((user_messages, conversation_id, head, len(messages)))
+
+                if responses:
+                    head = await self._next_seq(
+                        conn, conversation_id, conversations.c.response_seq, len(responses)
+                    )
+                    first_seq = head - len(responses) + 1
+                    response_rows.extend(
+                        {
+                            "conversation_id": conversation_id,
+                            "content": r.content,
+                            "content_length": r.content_length,
+                            "model_used": r.model_used,
+                            "timestamp": r.timestamp,
+                            "is_deleted": False,
+                            "seq": first_seq + i,
+                            "token_count": r.token_count,
+                            **usage_columns(r.usage),
+                        }
+                        for i, r in enumerate(responses)
+                    )
+                    written_responses.extend(responses)
+                    trims.append((llm_responses, conversation_id, head, len(responses)))
+
+            await self._insert_records(conn, user_messages, message_rows, written_messages)
+            await self._insert_records(conn, llm_responses, response_rows, written_responses)
+
+            for table, conversation_id, head, count in trims:
+                await self._trim_window(conn, table, conversation_id, head, count)
+
+        logger.info(
+            f"Write-behind: записано {len(message_rows)} сообщений и "
+            f"{len(response_rows)} ответов ({len(by_user)} пользователей)"
+        )
+
+    @staticmethod
+    async def _insert_records(
+        conn: AsyncConnection,
+        table: Table,
+        rows: list[dict[str, object]],
+        records: Sequence[UserMessage | LLMResponse],
+    ) -> None:
+        """
+        Вставить строки многострочным INSERT и присвоить id записям буфера
+
+        id возвращаются в порядке строк; записи буфера разделяют контексты,
+        выданные до сброса (read-your-writes), поэтому id появляется и в них.
+
+        Args:
+            conn: Открытое соединение (транзакция)
+            table: Таблица user_messages или llm_responses
+            rows: Значения колонок вставляемых строк
+            records: Записи буфера в порядке строк
+        """
+        if not rows:
+            return
+
+        result = await conn.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+        )
+        for record, record_id in zip(records, result.scalars(), strict=True):
+            record.id = record_id
+
+    @asynccontextmanager
+    async def _transaction(self, *user_ids: int) -> AsyncIterator[AsyncConnection]:
+        """
+        Открыть транзакцию для операций с историей пользователей
+
+        При ошибке записи пользователей удаляются из кеша диалогов, чтобы
+        не закешировать conversation_id из откатившейся транзакции.
+
+        Args:
+            user_ids: ID пользователей, затронутых транзакцией
+
+        Yields:
+            Соединение с открытой транзакцией
+        """
+        try:
+            async with self.engine.begin() as conn:
+                yield conn
+        except BaseException:
+            for user_id in user_ids:
+                self.conversation_cache.invalidate(user_id)
+            raise
+
+    async def _find_conversation(
+        self, conn: AsyncConnection, user_id: int
+    ) -> tuple[int, str, str | None] | None:
+        """
+        Найти последний диалог пользователя (сначала в кеше, затем в БД)
+
+        Краткое содержание читается тем же запросом и кешируется вместе
+        с диалогом, поэтому загрузка контекста не делает отдельного SELECT.
+
+        Args:
+            conn: Открытое соединение (транзакция)
+            user_id: ID пользователя
+
+        Returns:
+            Кортеж (conversation_id, system_prompt, summary) или None
+        """
+        cached = self.conversation_cache.get(user_id)
+        if cached:
+            return cached
+
+        result = await conn.execute(
+            select(conversations.c.id, conversations.c.system_prompt, conversations.c.summary)
+            .where(conversations.c.user_id == user_id)
+            .order_by(conversations.c.created_at.desc())
+            .limit(1)
+        )
+        row = result.first()
+        if not row:
+            return None
+
+        self.conversation_cache.put(user_id, row[0], row[1], row[2])
+        return row[0], row[1], row[2]
+
+    async def _get_or_create_conversation(
+        self, conn: AsyncConnection, user_id: int, system_prompt: str
+    ) -> tuple[int, str, str | None]:
+        """
+        Найти диалог пользователя или создать новый
+
+        Args:
+            conn: Открытое соединение (транзакция)
+            user_id: ID пользователя
+            system_prompt: Системный промпт для нового диалога
+
+        Returns:
+            Кортеж (conversation_id, system_prompt диалога, summary)
+        """
+        row = await self._find_conversation(conn, user_id)
+
+        if row:
+            logger.debug(f"Найден существующий контекст для user {user_id}")
+            return row
+
+        result = await conn.execute(
+            insert(conversations)
+            .values(
+                user_id=user_id,
+                system_prompt=system_prompt,
+                created_at=datetime.now(),
+                updated_at=datetime.now(),
+            )
+            .returning(conversations.c.id)
+        )
+        conversation_id = result.scalar_one()
+        self.conversation_cache.put(user_id, conversation_id, system_prompt)
+        logger.debug(f"Создан новый контекст для user {user_id}")
+        return conversation_id, system_prompt, None
+
+    async def _insert_message(
+        self, conn: AsyncConnection, conversation_id: int, user_id: int, text: str
+    ) -> UserMessage:
+        """Вставить сообщение пользователя в диалог и обрезать окно сообщений"""
+        message = UserMessage(
+            user_id=user_id,
+            text=text,
+            timestamp=datetime.now(),
+            token_count=self.token_estimator.count(text),
+        )
+        seq = await self._next_seq(conn, conversation_id, conversations.c.message_seq)
+        result = await conn.execute(
+            insert(user_messages)
+            .values(
+                conversation_id=conversation_id,
+                user_id=user_id,
+                text=text,
+                content_length=message.content_length,
+                timestamp=message.timestamp,
+                is_deleted=False,
+                seq=seq,
+                token_count=message.token_count,
             )
-            old_response_ids = [row[0] for row in responses_result.all()]
+            .returning(user_messages.c.id)
+        )
+        message.id = result.scalar_one()
+        await self._trim_window(conn, user_messages, conversation_id, seq)
+        return message
+
+    async def _next_seq(
+        self,
+        conn: AsyncConnection,
+        conversation_id: int,
+        seq_column: Column[int],
+        count: int = 1,
+    ) -> int:
+        """
+        Увеличить head-счетчик диалога (вместе с updated_at)
 
-            if old_response_ids:
-                await conn.execute(
-                    update(llm_responses)
-                    .where(llm_responses.c.id.in_(old_response_ids))
-                    .values(is_deleted=True)
+        Args:
+            conn: Открытое соединение (транзакция)
+            conversation_id: ID диалога
+            seq_column: Счетчик диалога (message_seq или response_seq)
+            count: Количество резервируемых номеров
+
+        Returns:
+            Порядковый номер последней новой записи (новый head)
+        """
+        result = await conn.execute(
+            update(conversations)
+            .where(conversations.c.id == conversation_id)
+            .values({seq_column: seq_column + count, conversations.c.updated_at: datetime.now()})
+            .returning(seq_column)
+        )
+        return int(result.scalar_one())
+
+    async def _load_context(
+        self,
+        conn: AsyncConnection,
+        conversation_id: int,
+        user_id: int,
+        system_prompt: str,
+        summary: str | None,
+    ) -> ConversationContext:
+        """
+        Загрузить контекст диалога (не удаленные, последние max_history записей,
+        а при заданном бюджете - только записи, которые могут в него поместиться)
+
+        Args:
+            conn: Открытое соединение (транзакция)
+            conversation_id: ID диалога
+            user_id: ID пользователя
+            system_prompt: Системный промпт контекста
+            summary: Краткое содержание сжатых ходов диалога
+
+        Returns:
+            Контекст диалога
+        """
+        messages_result = await conn.execute(
+            self._window_query(
+                user_messages,
+                conversation_id,
+                conversations.c.message_seq,
+                user_messages.c.id,
+                user_messages.c.user_id,
+                user_messages.c.text,
+                user_messages.c.timestamp,
+                user_messages.c.content_length,
+                user_messages.c.is_deleted,
+                user_messages.c.token_count,
+            )
+        )
+        messages_rows = messages_result.all()
+
+        responses_result = await conn.execute(
+            self._window_query(
+                llm_responses,
+                conversation_id,
+                conversations.c.response_seq,
+                llm_responses.c.id,
+                llm_responses.c.content,
+                llm_responses.c.timestamp,
+                llm_responses.c.model_used,
+                llm_responses.c.content_length,
+                llm_responses.c.is_deleted,
+                llm_responses.c.token_count,
+            )
+        )
+        responses_rows = responses_result.all()
+
+        # Преобразуем в модели (в обратном порядке для сохранения хронологии)
+        # Колонки выбраны в порядке аргументов from_row (content_length уже в строке)
+        messages = [UserMessage.from_row(*row) for row in reversed(messages_rows)]
+        responses = [LLMResponse.from_row(*row) for row in reversed(responses_rows)]
+
+        context = ConversationContext(
+            user_id=user_id,
+            messages=messages,
+            responses=responses,
+            system_prompt=system_prompt,
+            summary=summary,
+        )
+        align_window(context)
+        return context
+
+    def _window_query(
+        self,
+        table: Table,
+        conversation_id: int,
+        seq_column: Column[int],
+        *columns: Column[Any],
+        tokens: ColumnElement[int] | None = None,
+    ) -> Select[Any]:
+        """
+        Запрос окна истории: активные записи, новые первыми, не более max_history
+
+        С бюджетом токенов накопительная сумма token_count (окно от новых к старым)
+        отсекает записи, которые заведомо не поместятся в бюджет: возвращается
+        префикс, заканчивающийся первой записью, превысившей бюджет. Точный
+        совместный отбор сообщений и ответов выполняет MessageFormatter.
+
+        Args:
+            table: Таблица истории (user_messages, llm_responses или turns)
+            conversation_id: ID диалога
+            seq_column: Head-счетчик диалога для этой таблицы
+            columns: Выбираемые колонки
+            tokens: Выражение токенов записи (по умолчанию колонка token_count)
+
+        Returns:
+            SELECT с колонками в переданном порядке
+        """
+        query = (
+            select(*columns)
+            .where(
+                and_(
+                    table.c.conversation_id == conversation_id,
+                    table.c.is_deleted == False,  # noqa: E712
+                    table.c.seq > self._window_start(conversation_id, seq_column),
                 )
+            )
+            .order_by(table.c.seq.desc())
+            .limit(self.max_history)
+        )
+        if self.history_token_budget <= 0:
+            return query
+
+        if tokens is None:
+            tokens = table.c.token_count
+        running_tokens = func.sum(tokens).over(order_by=table.c.seq.desc())
+        window = query.add_columns(
+            table.c.seq.label("window_seq"),
+            (running_tokens - tokens).label("tokens_before"),
+        ).subquery()
+        return (
+            select(*(window.c[column.name] for column in columns))
+            .where(window.c.tokens_before < self.history_token_budget)
+            .order_by(window.c.window_seq.desc())
+        )
+
+    def _window_start(self, conversation_id: int, seq_column: Column[int]) -> ColumnElement[int]:
+        """Нижняя граница окна истории: head - max_history (скалярный подзапрос)"""
+        head = select(seq_column).where(conversations.c.id == conversation_id).scalar_subquery()
+        return head - self.max_history
+
+    async def _trim_window(
+        self,
+        conn: AsyncConnection,
+        table: Table,
+        conversation_id: int,
+        head: int,
+        count: int = 1,
+    ) -> None:
+        """
+        Пометить удаленными записи, выпавшие из окна max_history (soft delete)
 
-            if old_message_ids or old_response_ids:
-                logger.debug(
-                    f"История user {user_id} обрезана: "
-                    f"{len(old_message_ids)} сообщений, "
-                    f"{len(old_response_ids)} ответов помечены как удаленные"
+        Благодаря порядковым номерам после добавления count записей из окна
+        выпадают ровно записи с seq в (head - count - max_history, head - max_history],
+        поэтому обрезка выполняет постоянный объем работы независимо от длины истории.
+
+        Args:
+            conn: Открытое соединение (транзакция)
+            table: Таблица user_messages или llm_responses
+            conversation_id: ID диалога
+            head: Порядковый номер последней добавленной записи
+            count: Количество добавленных записей
+        """
+        cutoff = head - self.max_history
+        if cutoff <= 0:
+            return
+
+        result = await conn.execute(
+            update(table)
+            .where(
+                and_(
+                    table.c.conversation_id == conversation_id,
+                    table.c.seq > cutoff - count,
+                    table.c.seq <= cutoff,
+                    table.c.is_deleted == False,  # noqa: E712
                 )
+            )
+            .values(is_deleted=True)
+        )
+
+        if result.rowcount:
+            logger.debug(
+                f"Диалог {conversation_id}: {result.rowcount} записей {table.name} обрезано"
+            )
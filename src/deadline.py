@@ -0,0 +1,132 @@
+"""Срок выполнения хода диалога и отмена работы после его истечения"""
+
+import asyncio
+import time
+from collections.abc import AsyncIterator
+from contextlib import AbstractAsyncContextManager, asynccontextmanager, nullcontext
+from dataclasses import dataclass
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+class DeadlineExceededError(TimeoutError):
+    """Срок хода истек: результат уже никому не нужен, работа прекращена"""
+
+    def __init__(self, stage: str) -> None:
+        """
+        Args:
+            stage: Этап хода, на котором истек срок
+        """
+        super().__init__(f"Срок хода истек: {stage}")
+        self.stage = stage
+
+
+@dataclass(slots=True, frozen=True)
+class Deadline:
+    """
+    Абсолютный срок хода диалога
+
+    Создается один раз при получении сообщения и передается через все слои
+    хода: слой не начинает работу после срока, а ожидания (очередь пользователя,
+    пул соединений БД, слот планировщика, вызов LLM) прерываются в момент
+    истечения.
+
+    Attributes:
+        expires_at: Момент истечения по time.monotonic()
+    """
+
+    expires_at: float
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        """Срок через seconds секунд от текущего момента"""
+        return cls(time.monotonic() + seconds)
+
+    @property
+    def expired(self) -> bool:
+        """Срок уже истек"""
+        return time.monotonic() >= self.expires_at
+
+    def remaining(self) -> float:
+        """Оставшееся время в секундах (0 - срок истек)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self, stage: str) -> None:
+        """
+        Не начинать этап хода после истечения срока
+
+        Args:
+            stage: Название этапа для сообщения об ошибке
+
+        Raises:
+            DeadlineExceededError: Если срок истек
+        """
+        if self.expired:
+            raise DeadlineExceededError(stage)
+
+    @asynccontextmanager
+    async def scope(self, stage: str) -> AsyncIterator[None]:
+        """
+        Отменить работу внутри блока в момент истечения срока
+
+        Блок не должен содержать yield асинхронного генератора: отмена
+        адресована задаче, а не генератору.
+
+        Args:
+            stage: Название этапа для сообщения об ошибке
+
+        Raises:
+            DeadlineExceededError: Если срок истек до или во время блока
+        """
+        self.check(stage)
+        timeout = asyncio.timeout(self.remaining())
+        try:
+            async with timeout:
+                yield
+        except TimeoutError as e:
+            # Вложенный этап уже сообщил о сроке; чужие таймауты пробрасываются как есть
+            if isinstance(e, DeadlineExceededError) or not timeout.expired():
+                raise
+            raise DeadlineExceededError(stage) from e
+
+
+def deadline_scope(deadline: Deadline | None, stage: str) -> AbstractAsyncContextManager[None]:
+    """Блок, ограниченный сроком хода (без срока - без ограничения)"""
+    if deadline is None:
+        return nullcontext()
+    return deadline.scope(stage)
+
+
+async def iterate_within(
+    deadline: Deadline | None, items: AsyncIterator[T], stage: str
+) -> AsyncIterator[T]:
+    """
+    Читать асинхронный поток, пока не истек срок хода
+
+    Срок ограничивает только ожидание очередного элемента: потребитель между
+    элементами не отменяется.
+
+    Args:
+        deadline: Срок хода (None - без ограничения)
+        items: Поток элементов
+        stage: Название этапа для сообщения об ошибке
+
+    Yields:
+        Элементы потока
+
+    Raises:
+        DeadlineExceededError: Если срок истек во время ожидания элемента
+    """
+    if deadline is None:
+        async for item in items:
+            yield item
+        return
+
+    while True:
+        async with deadline.scope(stage):
+            try:
+                item = await anext(items)
+            except StopAsyncIteration:
+                return
+        yield item
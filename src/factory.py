@@ -0,0 +1,177 @@
+"""Сборка компонентов приложения из конфигурации (общая для бота и API)"""
+
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .cached_history_storage import CachedHistoryStorage
+from .config import Config
+from .db_history_storage import DatabaseHistoryStorage
+from .history_log import HistoryLog
+from .history_storage import HistoryStorage
+from .llm_client import LLMClient
+from .llm_resilience import CircuitBreaker, RetryPolicy
+from .llm_response_cache import LLMResponseCache
+from .llm_scheduler import LLMScheduler
+from .llm_transport import TransportSettings, create_http_client
+from .model_router import ModelRouter, ModelTier
+from .turn_history_storage import TurnHistoryStorage
+
+logger = logging.getLogger(__name__)
+
+
+def create_history_storage(
+    engine: AsyncEngine, config: Config
+) -> HistoryStorage | DatabaseHistoryStorage | CachedHistoryStorage:
+    """Создать хранилище истории по модели хранения из конфигурации"""
+    if config.history_storage in ("memory", "log"):
+        log = None
+        if config.history_storage == "log":
+            log = HistoryLog(
+                config.history_log_dir,
+                segment_size=config.history_log_segment_mb * 1024 * 1024,
+                snapshot_every=config.history_log_snapshot_every,
+                fsync=config.history_log_fsync,
+            )
+        memory_storage = HistoryStorage(
+            max_history=config.max_history_messages,
+            max_users=config.history_max_users,
+            idle_ttl=config.history_idle_ttl,
+            memory_budget=config.history_memory_mb * 1024 * 1024,
+            log=log,
+        )
+        memory_storage.restore()
+        return memory_storage
+
+    return create_database_history_storage(engine, config)
+
+
+def create_database_history_storage(
+    engine: AsyncEngine, config: Config, context_cache: bool = True
+) -> DatabaseHistoryStorage | CachedHistoryStorage:
+    """
+    Создать хранилище истории в БД по модели хранения из конфигурации
+
+    Args:
+        engine: Async engine SQLAlchemy
+        config: Конфигурация приложения
+        context_cache: Обернуть хранилище кешем контекстов, если он включен в конфигурации
+
+    Returns:
+        Хранилище истории в БД (при включенном кеше - обернутое CachedHistoryStorage)
+    """
+    db_storage: DatabaseHistoryStorage
+    if config.history_storage == "turns":
+        if config.db_write_behind:
+            logger.warning("DB_WRITE_BEHIND не поддерживается HISTORY_STORAGE=turns")
+        db_storage = TurnHistoryStorage(
+            engine=engine,
+            max_history=config.max_history_messages,
+            conversation_cache_size=config.conversation_cache_size,
+            conversation_cache_ttl=config.conversation_cache_ttl,
+            history_token_budget=config.history_token_budget,
+        )
+    else:
+        db_storage = DatabaseHistoryStorage(
+            engine=engine,
+            max_history=config.max_history_messages,
+            conversation_cache_size=config.conversation_cache_size,
+            conversation_cache_ttl=config.conversation_cache_ttl,
+            write_behind=config.db_write_behind,
+            write_batch_size=config.db_write_batch_size,
+            write_flush_interval=config.db_write_flush_interval,
+            history_token_budget=config.history_token_budget,
+        )
+
+    if not (context_cache and config.context_cache_enabled):
+        return db_storage
+
+    logger.info("✅ Кеш контекстов диалогов включен")
+    return CachedHistoryStorage(
+        db_storage,
+        max_users=config.context_cache_max_users,
+        memory_budget=config.context_cache_memory_mb * 1024 * 1024,
+    )
+
+
+def create_llm_client(config: Config) -> LLMClient:
+    """Создать LLM клиент с кешем ответов, планировщиком, автоматом защиты и пулом соединений"""
+    response_cache = None
+    if config.llm_cache_enabled:
+        response_cache = LLMResponseCache(
+            max_entries=config.llm_cache_max_entries,
+            max_bytes=config.llm_cache_memory_mb * 1024 * 1024,
+            ttl=config.llm_cache_ttl,
+        )
+        logger.info("✅ Кеш ответов LLM включен")
+
+    scheduler = None
+    if config.llm_max_concurrency > 0:
+        scheduler = LLMScheduler(
+            max_concurrency=config.llm_max_concurrency,
+            queue_timeout=config.llm_queue_timeout,
+        )
+        logger.info("✅ Планировщик запросов к LLM включен")
+
+    breaker = None
+    if config.llm_breaker_failure_rate > 0:
+        breaker = CircuitBreaker(
+            failure_rate=config.llm_breaker_failure_rate,
+            min_requests=config.llm_breaker_min_requests,
+            window=config.llm_breaker_window,
+            open_timeout=config.llm_breaker_open_timeout,
+            max_open_timeout=config.llm_breaker_max_open_timeout,
+            slow_call_threshold=config.llm_breaker_slow_call,
+        )
+        logger.info("✅ Автомат защиты LLM включен")
+
+    return LLMClient(
+        api_key=config.openrouter_key,
+        model=config.default_model,
+        max_tokens=config.max_tokens,
+        temperature=config.temperature,
+        response_cache=response_cache,
+        single_flight=config.llm_single_flight,
+        scheduler=scheduler,
+        fallback_models=config.llm_fallback_models,
+        retry_policy=RetryPolicy(
+            max_retries=config.llm_max_retries,
+            base_delay=config.llm_retry_base_delay,
+            max_delay=config.llm_retry_max_delay,
+            hedge_percentile=config.llm_hedge_percentile,
+            hedge_min_samples=config.llm_hedge_min_samples,
+            request_timeout=config.llm_request_timeout or None,
+            failure_threshold=config.llm_model_failure_threshold,
+            cooldown=config.llm_model_cooldown,
+        ),
+        base_url=config.llm_base_url,
+        breaker=breaker,
+        http_client=create_http_client(
+            TransportSettings(
+                max_connections=config.llm_max_connections,
+                max_keepalive_connections=config.llm_max_keepalive_connections,
+                keepalive_expiry=config.llm_keepalive_expiry,
+                connect_timeout=config.llm_connect_timeout,
+                read_timeout=config.llm_read_timeout,
+                http2=config.llm_http2,
+            )
+        ),
+    )
+
+
+def create_model_router(config: Config, llm_client: LLMClient) -> ModelRouter | None:
+    """Создать маршрутизатор моделей из конфигурации (None - маршрутизация отключена)"""
+    if not config.llm_router_tiers:
+        return None
+    router = ModelRouter(
+        [ModelTier.parse(spec) for spec in config.llm_router_tiers],
+        llm_client.health,
+        max_tokens=config.max_tokens,
+        admin_min_tier=config.llm_router_admin_min_tier,
+        latency_slo=config.llm_router_latency_slo,
+        latency_min_samples=config.llm_hedge_min_samples,
+        response_ratio=config.llm_router_response_ratio,
+        min_response_tokens=config.llm_router_min_response_tokens,
+    )
+    logger.info("✅ Маршрутизация моделей включена")
+    return router
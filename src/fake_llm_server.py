@@ -0,0 +1,230 @@
+"""OpenAI-совместимый fake LLM сервер для нагрузочных тестов без внешнего API
+
+Эмулирует /v1/chat/completions (обычный и потоковый ответ) с настраиваемым
+распределением задержки до первого токена, скоростью генерации токенов и
+долей ошибок. Ответ - последовательность слов-токенов, длина ограничена
+max_tokens запроса.
+
+Запуск:
+    uv run python -m src.fake_llm_server --port 8081
+    uv run python -m src.fake_llm_server --latency lognormal --latency-ms 400 --jitter 0.6 \\
+        --tokens-per-second 40 --response-tokens 200 --error-rate 0.01
+
+Клиент: LLM_BASE_URL=http://localhost:8081/v1
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import random
+import time
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from typing import Any
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+LATENCY_DISTRIBUTIONS = ("constant", "uniform", "lognormal")
+
+
+@dataclass(slots=True)
+class FakeLLMSettings:
+    """
+    Параметры эмуляции LLM
+
+    Attributes:
+        latency: Распределение задержки до первого токена: constant, uniform или lognormal
+        latency_ms: Медианная задержка до первого токена в миллисекундах
+        jitter: Разброс задержки: для uniform - доля от latency_ms (±), для lognormal - sigma
+        tokens_per_second: Скорость генерации токенов (0 - мгновенно)
+        response_tokens: Длина ответа в токенах (не больше max_tokens запроса)
+        error_rate: Доля запросов, завершающихся ошибкой 503
+        seed: Начальное значение генератора случайных чисел (None - случайное)
+    """
+
+    latency: str = "constant"
+    latency_ms: float = 200.0
+    jitter: float = 0.5
+    tokens_per_second: float = 50.0
+    response_tokens: int = 100
+    error_rate: float = 0.0
+    seed: int | None = None
+
+    def sample_latency(self, rng: random.Random) -> float:
+        """
+        Задержка до первого токена по заданному распределению
+
+        Args:
+            rng: Генератор случайных чисел
+
+        Returns:
+            Задержка в секундах
+        """
+        median = self.latency_ms / 1000
+        if self.latency == "uniform":
+            return max(0.0, rng.uniform(median * (1 - self.jitter), median * (1 + self.jitter)))
+        if self.latency == "lognormal" and median > 0:
+            return rng.lognormvariate(math.log(median), self.jitter)
+        return median
+
+
+def create_app(settings: FakeLLMSettings) -> FastAPI:
+    """
+    Создать приложение fake LLM сервера
+
+    Args:
+        settings: Параметры эмуляции
+
+    Returns:
+        FastAPI приложение с эндпоинтами /v1/models и /v1/chat/completions
+    """
+    if settings.latency not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(
+            f"latency должно быть {', '.join(LATENCY_DISTRIBUTIONS)}, получено: {settings.latency!r}"
+        )
+
+    app = FastAPI(title="Fake LLM")
+    rng = random.Random(settings.seed)
+    ids = itertools.count(1)
+    token_delay = 1 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0.0
+
+    @app.get("/v1/models")
+    async def models() -> dict[str, Any]:
+        """Список моделей (любое имя модели принимается)"""
+        return {"object": "list", "data": [{"id": "fake-llm", "object": "model"}]}
+
+    @app.post("/v1/chat/completions", response_model=None)
+    async def chat_completions(request: Request) -> JSONResponse | StreamingResponse:
+        """Эмуляция chat completions"""
+        body = await request.json()
+        if rng.random() < settings.error_rate:
+            return JSONResponse(
+                status_code=503,
+                content={"error": {"message": "Fake LLM overloaded", "type": "server_error"}},
+            )
+
+        completion_id = f"chatcmpl-fake-{next(ids)}"
+        model = body.get("model", "fake-llm")
+        max_tokens = body.get("max_tokens") or settings.response_tokens
+        tokens = [f"token{i} " for i in range(min(settings.response_tokens, max_tokens))]
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+
+        await asyncio.sleep(settings.sample_latency(rng))
+
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+        }
+
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+            return StreamingResponse(
+                _stream_chunks(
+                    completion_id, model, tokens, token_delay, usage if include_usage else None
+                ),
+                media_type="text/event-stream",
+            )
+
+        await asyncio.sleep(token_delay * len(tokens))
+        return JSONResponse(
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(tokens)},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            }
+        )
+
+    return app
+
+
+async def _stream_chunks(
+    completion_id: str,
+    model: str,
+    tokens: list[str],
+    token_delay: float,
+    usage: dict[str, int] | None = None,
+) -> AsyncIterator[str]:
+    """
+    SSE поток чанков chat.completion.chunk с паузой token_delay между токенами
+
+    Если передан usage (stream_options.include_usage), перед [DONE] отправляется
+    чанк без choices с расходом токенов, как у OpenAI.
+    """
+    created = int(time.time())
+
+    def event(choices: list[dict[str, Any]], **extra: Any) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": choices,
+            **extra,
+        }
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    def chunk(delta: dict[str, str], finish_reason: str | None = None) -> str:
+        return event([{"index": 0, "delta": delta, "finish_reason": finish_reason}])
+
+    yield chunk({"role": "assistant"})
+    for i, token in enumerate(tokens):
+        if i and token_delay:
+            await asyncio.sleep(token_delay)
+        yield chunk({"content": token})
+    yield chunk({}, finish_reason="stop")
+    if usage is not None:
+        yield event([], usage=usage)
+    yield "data: [DONE]\n\n"
+
+
+def main() -> None:
+    """Запуск fake LLM сервера с параметрами из командной строки"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", choices=LATENCY_DISTRIBUTIONS, default="constant")
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--response-tokens", type=int, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    settings = FakeLLMSettings(
+        latency=args.latency,
+        latency_ms=args.latency_ms,
+        jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    logger.info(f"Fake LLM сервер: http://{args.host}:{args.port}/v1 ({settings})")
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
@@ -0,0 +1,224 @@
+"""Локальный append-only журнал истории диалогов со снимками"""
+
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import IO, Any
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+SNAPSHOT_NAME = "snapshot.log"
+
+
+class HistoryLog:
+    """
+    Сегментированный append-only журнал операций HistoryStorage
+
+    Каждая операция - одна строка JSON в текущем сегменте; сегмент
+    сменяется при достижении segment_size. Периодически пишется снимок
+    состояния (по строке на пользователя с префиксом времени активности),
+    после чего сегменты, покрытые снимком, удаляются. Снимок можно писать
+    в отдельном потоке: begin_snapshot() переключает сегмент в потоке
+    владельца журнала, а finish_snapshot() пишет файл снимка и удаляет
+    покрытые сегменты, не трогая текущий сегмент. При старте снимок и
+    сегменты читаются через mmap, а строки снимка неактивных пользователей
+    пропускаются без разбора JSON.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        segment_size: int = 16 * 1024 * 1024,
+        snapshot_every: int = 10000,
+        fsync: bool = False,
+    ) -> None:
+        """
+        Инициализация журнала
+
+        Args:
+            directory: Каталог журнала (создается при необходимости)
+            segment_size: Размер сегмента в байтах, после которого открывается новый
+            snapshot_every: Количество записей между снимками
+            fsync: Вызывать fsync после каждой записи (надежнее, но медленнее)
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.appended = 0
+        self.snapshots = 0
+
+        self._since_snapshot = 0
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_covered = 0
+        segments = self._segment_numbers()
+        # Новый сегмент при каждом старте: хвост прошлого мог быть оборван
+        self._segment = (segments[-1] + 1) if segments else 1
+        self._file: IO[bytes] = self._open_segment(self._segment)
+        logger.info(f"HistoryLog открыт: {self.directory} (сегмент {self._segment})")
+
+    def append(self, record: dict[str, Any]) -> None:
+        """Дописать операцию в текущий сегмент"""
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        self._file.write(line.encode("utf-8"))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+        self.appended += 1
+        self._since_snapshot += 1
+        if self._file.tell() >= self.segment_size:
+            self._roll()
+
+    def should_snapshot(self) -> bool:
+        """Накопилось ли достаточно записей для нового снимка"""
+        return self._since_snapshot >= self.snapshot_every
+
+    def write_snapshot(self, users: Iterable[tuple[float, dict[str, Any]]]) -> None:
+        """
+        Записать снимок состояния и удалить покрытые им сегменты
+
+        Args:
+            users: Пары (время последней активности, unix; состояние пользователя)
+        """
+        self.finish_snapshot(self.begin_snapshot(), users)
+
+    def begin_snapshot(self) -> int:
+        """
+        Начать снимок: следующие операции пишутся в новый сегмент
+
+        Returns:
+            Первый сегмент, не покрытый снимком (передается в finish_snapshot)
+        """
+        self._roll()
+        self._since_snapshot = 0
+        return self._segment
+
+    def finish_snapshot(
+        self, covered_until: int, users: Iterable[tuple[float, dict[str, Any]]]
+    ) -> None:
+        """
+        Записать файл снимка и удалить покрытые им сегменты (можно вне потока журнала)
+
+        Снимок, начатый раньше уже записанного, пропускается: иначе он затер
+        бы более новый снимок, чьи сегменты уже удалены.
+
+        Args:
+            covered_until: Результат begin_snapshot()
+            users: Пары (время последней активности, unix; состояние пользователя)
+        """
+        with self._snapshot_lock:
+            if covered_until <= self._snapshot_covered:
+                return
+
+            tmp_path = self.directory / f"{SNAPSHOT_NAME}.tmp"
+            with open(tmp_path, "wb") as f:
+                header = {"segment": covered_until, "created": time.time()}
+                f.write(json.dumps(header).encode("utf-8") + b"\n")
+                for last_active, state in users:
+                    payload = json.dumps(state, ensure_ascii=False, separators=(",", ":"))
+                    f.write(f"{last_active:.3f}\t{payload}\n".encode())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.directory / SNAPSHOT_NAME)
+
+            for number in self._segment_numbers():
+                if number < covered_until:
+                    self._segment_path(number).unlink(missing_ok=True)
+
+            self._snapshot_covered = covered_until
+            self.snapshots += 1
+
+        logger.info(f"HistoryLog: снимок записан, журнал продолжается с сегмента {covered_until}")
+
+    def read_snapshot(self, active_since: float = 0.0) -> Iterator[tuple[float, dict[str, Any]]]:
+        """
+        Прочитать состояния пользователей из снимка
+
+        Args:
+            active_since: Пропускать пользователей, неактивных с этого момента (unix)
+
+        Yields:
+            Пары (время последней активности, состояние пользователя)
+        """
+        path = self.directory / SNAPSHOT_NAME
+        for number, line in enumerate(self._mapped_lines(path)):
+            if number == 0:
+                continue  # заголовок
+
+            prefix, _, payload = line.partition(b"\t")
+            last_active = float(prefix)
+            if last_active < active_since:
+                continue
+            try:
+                yield last_active, json.loads(payload)
+            except json.JSONDecodeError:
+                logger.warning(f"HistoryLog: поврежденная строка снимка {number} пропущена")
+
+    def read_segments(self) -> Iterator[dict[str, Any]]:
+        """Прочитать операции из сегментов, не покрытых снимком, в порядке записи"""
+        first = self._snapshot_segment()
+        for number in self._segment_numbers():
+            if number < first or number == self._segment:
+                continue
+            for line in self._mapped_lines(self._segment_path(number)):
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная последняя запись после аварийной остановки
+                    logger.warning(f"HistoryLog: поврежденная запись в сегменте {number} пропущена")
+
+    def close(self) -> None:
+        """Закрыть текущий сегмент"""
+        self._file.close()
+        logger.info(f"HistoryLog закрыт: {self.appended} записей, {self.snapshots} снимков")
+
+    def _roll(self) -> None:
+        """Закрыть текущий сегмент и открыть следующий"""
+        self._file.close()
+        self._segment += 1
+        self._file = self._open_segment(self._segment)
+
+    def _open_segment(self, number: int) -> IO[bytes]:
+        """Открыть сегмент на дозапись"""
+        return open(self._segment_path(number), "ab")
+
+    def _segment_path(self, number: int) -> Path:
+        """Путь к сегменту по номеру"""
+        return self.directory / f"{SEGMENT_PREFIX}{number:08d}{SEGMENT_SUFFIX}"
+
+    def _segment_numbers(self) -> list[int]:
+        """Номера существующих сегментов по возрастанию"""
+        numbers = []
+        for path in self.directory.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"):
+            try:
+                numbers.append(int(path.name[len(SEGMENT_PREFIX) : -len(SEGMENT_SUFFIX)]))
+            except ValueError:
+                continue
+        return sorted(numbers)
+
+    def _snapshot_segment(self) -> int:
+        """Первый сегмент, не покрытый снимком (0 - снимка нет)"""
+        for line in self._mapped_lines(self.directory / SNAPSHOT_NAME):
+            return int(json.loads(line)["segment"])
+        return 0
+
+    @staticmethod
+    def _mapped_lines(path: Path) -> Iterator[bytes]:
+        """Строки файла через mmap (без чтения файла целиком в память процесса)"""
+        if not path.exists() or path.stat().st_size == 0:
+            return
+
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b""):
+                line = line.rstrip(b"\n")
+                if line:
+                    yield line
@@ -1,74 +1,466 @@
 """Хранение истории диалогов"""
 
+import asyncio
 import logging
+import sys
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
 from datetime import datetime
+from typing import Any, TypeVar
 
-from .models import ConversationContext, LLMResponse, UserMessage
+from .history_log import HistoryLog
+from .models import Compaction, ConversationContext, LLMResponse, LLMUsage, UserMessage
+from .token_estimator import TokenEstimator, default_estimator
 
 logger = logging.getLogger(__name__)
 
+Record = TypeVar("Record", UserMessage, LLMResponse)
+
+# Оценка накладных расходов на один объект сообщения/ответа в памяти (байт)
+RECORD_OVERHEAD_BYTES = 200
+
+
+def record_size(record: UserMessage | LLMResponse) -> int:
+    """Оценка памяти, занимаемой сообщением или ответом (байт)"""
+    text = record.text if isinstance(record, UserMessage) else record.content
+    return sys.getsizeof(text) + RECORD_OVERHEAD_BYTES
+
+
+@dataclass
+class UserHistory:
+    """История пользователя в памяти: окна фиксированной длины и учет памяти"""
+
+    system_prompt: str
+    messages: deque[UserMessage]
+    responses: deque[LLMResponse]
+    summary: str | None = None
+    last_access: float = 0.0
+    size: int = 0
+
 
 class HistoryStorage:
-    """Хранилище истории диалогов"""
+    """
+    Хранилище истории диалогов в памяти
+
+    Окна сообщений и ответов - deque(maxlen=max_history), поэтому добавление
+    и обрезка выполняются за O(1). Пользователи вытесняются по LRU при
+    превышении max_users или бюджета памяти, а также после idle_ttl секунд
+    без обращений.
+
+    С журналом (log) каждое изменение дописывается в HistoryLog, а restore()
+    восстанавливает недавно активные истории после перезапуска без БД.
+    Периодический снимок при работающем event loop пишется в отдельном
+    потоке. В снимок попадают только истории в памяти: вытесненная история
+    потеряна и для работающего процесса, поэтому после снимка она не
+    восстанавливается.
+    """
 
-    def __init__(self, max_history: int = 10) -> None:
+    def __init__(
+        self,
+        max_history: int = 10,
+        token_estimator: TokenEstimator | None = None,
+        max_users: int = 0,
+        idle_ttl: float = 0.0,
+        memory_budget: int = 0,
+        log: HistoryLog | None = None,
+    ) -> None:
         """
         Инициализация хранилища
 
         Args:
             max_history: Максимальное количество сообщений в истории
+            token_estimator: Оценщик токенов для новых записей
+            max_users: Максимальное количество пользователей в памяти (0 - без ограничения)
+            idle_ttl: Время простоя в секундах до вытеснения (0 - без ограничения)
+            memory_budget: Бюджет памяти историй в байтах, оценка (0 - без ограничения)
+            log: Журнал на диске для восстановления истории после перезапуска
         """
         self.max_history = max_history
-        self.contexts: dict[int, ConversationContext] = {}
-        logger.info(f"HistoryStorage инициализирован (max_history={max_history})")
+        self.token_estimator = token_estimator or default_estimator
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self.memory_budget = memory_budget
+        self.log = log
+        self.memory_used = 0
+        self.evictions = 0
+        self.contexts: OrderedDict[int, UserHistory] = OrderedDict()
+        self._snapshot_task: asyncio.Task[None] | None = None
+        logger.info(
+            f"HistoryStorage инициализирован (max_history={max_history}, "
+            f"max_users={max_users}, idle_ttl={idle_ttl}s, memory_budget={memory_budget})"
+        )
 
     def get_or_create_context(self, user_id: int, system_prompt: str) -> ConversationContext:
         """Получить или создать контекст для пользователя"""
-        if user_id not in self.contexts:
-            self.contexts[user_id] = ConversationContext(
-                user_id=user_id,
-                messages=[],
-                responses=[],
-                system_prompt=system_prompt,
-            )
-            logger.debug(f"Создан новый контекст для user {user_id}")
-        return self.contexts[user_id]
+        return self._snapshot(user_id, self._get_or_create(user_id, system_prompt))
 
     def add_message(self, user_id: int, text: str, system_prompt: str) -> None:
         """Добавить сообщение пользователя"""
-        context = self.get_or_create_context(user_id, system_prompt)
-        message = UserMessage(user_id=user_id, text=text, timestamp=datetime.now())
-        context.messages.append(message)
-        self._trim_history(user_id)
+        history = self._get_or_create(user_id, system_prompt)
+        message = UserMessage(
+            user_id=user_id,
+            text=text,
+            timestamp=datetime.now(),
+            token_count=self.token_estimator.count(text),
+        )
+        self._append(history, history.messages, message)
+        self._write_log(
+            {
+                "op": "msg",
+                "u": user_id,
+                "p": system_prompt,
+                "x": text,
+                "t": message.timestamp.isoformat(),
+                "k": message.token_count,
+            }
+        )
+        self._evict()
         logger.info(f"Добавлено сообщение от user {user_id} ({len(text)} символов)")
 
-    def add_response(self, user_id: int, content: str, model: str) -> None:
-        """Добавить ответ LLM"""
-        if user_id not in self.contexts:
+    def add_message_and_get_context(
+        self, user_id: int, text: str, system_prompt: str
+    ) -> ConversationContext:
+        """Добавить сообщение пользователя и вернуть обновленный контекст"""
+        self.add_message(user_id, text, system_prompt)
+        return self._snapshot(user_id, self.contexts[user_id])
+
+    def add_response(
+        self, user_id: int, content: str, model: str, usage: LLMUsage | None = None
+    ) -> None:
+        """Добавить ответ LLM (расход токенов usage в памяти не хранится)"""
+        history = self._touch(user_id)
+        if history is None:
             logger.warning(f"Попытка добавить ответ для несуществующего user {user_id}")
             return
 
-        response = LLMResponse(content=content, timestamp=datetime.now(), model_used=model)
-        self.contexts[user_id].responses.append(response)
-        self._trim_history(user_id)
+        response = LLMResponse(
+            content=content,
+            timestamp=datetime.now(),
+            model_used=model,
+            token_count=self.token_estimator.count(content),
+        )
+        self._append(history, history.responses, response)
+        self._write_log(
+            {
+                "op": "resp",
+                "u": user_id,
+                "x": content,
+                "m": model,
+                "t": response.timestamp.isoformat(),
+                "k": response.token_count,
+            }
+        )
+        self._evict()
         logger.info(f"Добавлен ответ для user {user_id} ({len(content)} символов)")
 
     def get_context(self, user_id: int) -> ConversationContext | None:
-        """Получить контекст пользователя"""
-        return self.contexts.get(user_id)
+        """Получить контекст пользователя (снимок окна истории)"""
+        history = self._touch(user_id)
+        if history is None:
+            return None
+        return self._snapshot(user_id, history)
 
     def clear(self, user_id: int) -> None:
         """Очистить историю пользователя"""
-        if user_id in self.contexts:
-            del self.contexts[user_id]
+        # В журнал пишем и для вытесненной истории: ее записи еще есть на диске
+        self._write_log({"op": "clear", "u": user_id})
+        if self._drop(user_id):
             logger.info(f"История для user {user_id} очищена")
 
-    def _trim_history(self, user_id: int) -> None:
-        """Ограничить историю до max_history"""
-        context = self.contexts[user_id]
-        # Синхронизируем обрезку messages и responses
-        max_len = max(len(context.messages), len(context.responses))
-        if max_len > self.max_history:
-            context.messages = context.messages[-self.max_history :]
-            context.responses = context.responses[-self.max_history :]
-            logger.debug(f"История user {user_id} обрезана до {self.max_history} сообщений")
+    def compact_history(self, user_id: int, compaction: Compaction) -> None:
+        """Заменить записи раньше compaction.before кратким содержанием"""
+        summary, before = compaction.summary, compaction.before
+        if self._compact(user_id, summary, before):
+            self._write_log({"op": "compact", "u": user_id, "s": summary, "b": before.isoformat()})
+            logger.info(f"История user {user_id} сжата до {before}")
+
+    def restore(self) -> int:
+        """
+        Восстановить недавно активные истории из журнала
+
+        Пользователи из снимка, неактивные дольше idle_ttl, пропускаются;
+        операции после снимка применяются в порядке записи.
+
+        Returns:
+            Количество пользователей в памяти после восстановления
+        """
+        if self.log is None:
+            return len(self.contexts)
+
+        active_since = time.time() - self.idle_ttl if self.idle_ttl > 0 else 0.0
+        for last_active, state in self.log.read_snapshot(active_since):
+            self._restore_user(last_active, state)
+        for record in self.log.read_segments():
+            self._replay(record)
+        self._evict()
+
+        logger.info(f"HistoryStorage восстановлен из журнала: {len(self.contexts)} пользователей")
+        return len(self.contexts)
+
+    def snapshot(self) -> None:
+        """Записать снимок историй в памяти и удалить покрытые им сегменты журнала"""
+        if self.log is None:
+            return
+
+        self.log.write_snapshot(self._dump_users())
+
+    def close(self) -> None:
+        """Записать финальный снимок и закрыть журнал"""
+        if self.log is None:
+            return
+
+        self.snapshot()
+        self.log.close()
+
+    def _compact(self, user_id: int, summary: str, before: datetime) -> bool:
+        """Сжать историю пользователя в памяти (False - истории нет)"""
+        history = self.contexts.get(user_id)
+        if history is None:
+            return False
+
+        history.messages = deque(
+            (m for m in history.messages if m.timestamp >= before), maxlen=self.max_history
+        )
+        history.responses = deque(
+            (r for r in history.responses if r.timestamp >= before), maxlen=self.max_history
+        )
+        history.summary = summary
+
+        self.memory_used -= history.size
+        history.size = self._history_size(history)
+        self.memory_used += history.size
+        return True
+
+    def _drop(self, user_id: int) -> bool:
+        """Удалить историю пользователя из памяти (False - истории нет)"""
+        history = self.contexts.pop(user_id, None)
+        if history is None:
+            return False
+
+        self.memory_used -= history.size
+        return True
+
+    def stats(self) -> dict[str, float]:
+        """Статистика хранилища: пользователи в памяти, оценка байт, вытеснения"""
+        return {
+            "users": len(self.contexts),
+            "memory_used": self.memory_used,
+            "evictions": self.evictions,
+        }
+
+    def _get_or_create(self, user_id: int, system_prompt: str) -> UserHistory:
+        """Найти историю пользователя (с обновлением LRU) или создать новую"""
+        history = self._touch(user_id)
+        if history is None:
+            history = self._new_history(system_prompt, time.monotonic())
+            self.contexts[user_id] = history
+            logger.debug(f"Создан новый контекст для user {user_id}")
+        return history
+
+    def _touch(self, user_id: int) -> UserHistory | None:
+        """Отметить обращение к истории пользователя"""
+        history = self.contexts.get(user_id)
+        if history is None:
+            return None
+
+        if self.idle_ttl > 0 and time.monotonic() - history.last_access > self.idle_ttl:
+            # Простаивающая история вытесняется, даже если общий лимит не достигнут
+            self._drop(user_id)
+            self.evictions += 1
+            return None
+
+        history.last_access = time.monotonic()
+        self.contexts.move_to_end(user_id)
+        return history
+
+    def _append(
+        self,
+        history: UserHistory,
+        window: deque[Record],
+        record: Record,
+    ) -> None:
+        """Добавить запись в окно истории с учетом вытесненной старой записи"""
+        if len(window) == window.maxlen:
+            dropped = record_size(window[0])
+            history.size -= dropped
+            self.memory_used -= dropped
+
+        window.append(record)
+        added = record_size(record)
+        history.size += added
+        self.memory_used += added
+
+    def _evict(self) -> None:
+        """Вытеснить простаивающие и давно неиспользуемые истории сверх лимитов"""
+        now = time.monotonic()
+        # Самую свежую историю (текущего пользователя) не вытесняем
+        while len(self.contexts) > 1:
+            user_id, history = next(iter(self.contexts.items()))
+            idle = self.idle_ttl > 0 and now - history.last_access > self.idle_ttl
+            over_users = self.max_users > 0 and len(self.contexts) > self.max_users
+            over_memory = self.memory_budget > 0 and self.memory_used > self.memory_budget
+            if not (idle or over_users or over_memory):
+                break
+
+            self.contexts.popitem(last=False)
+            self.memory_used -= history.size
+            self.evictions += 1
+            logger.debug(f"История user {user_id} вытеснена из памяти")
+
+    def _write_log(self, record: dict[str, Any]) -> None:
+        """Дописать операцию в журнал и при необходимости записать снимок"""
+        if self.log is None:
+            return
+
+        self.log.append(record)
+        if self.log.should_snapshot():
+            self._snapshot_in_background(self.log)
+
+    def _snapshot_in_background(self, log: HistoryLog) -> None:
+        """
+        Записать снимок в отдельном потоке, не блокируя event loop
+
+        Состояние историй снимается в потоке event loop (истории меняются
+        только в нем), а сериализация, запись файла, fsync и удаление
+        сегментов выполняются в потоке. Без работающего event loop снимок
+        пишется синхронно.
+        """
+        if self._snapshot_task is not None and not self._snapshot_task.done():
+            return  # снимок уже пишется, следующий - после него
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.snapshot()
+            return
+
+        covered_until = log.begin_snapshot()
+        users = self._dump_users()
+        self._snapshot_task = asyncio.create_task(
+            asyncio.to_thread(log.finish_snapshot, covered_until, users)
+        )
+        self._snapshot_task.add_done_callback(self._snapshot_done)
+
+    @staticmethod
+    def _snapshot_done(task: asyncio.Task[None]) -> None:
+        """Записать в лог ошибку фонового снимка"""
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Ошибка записи снимка журнала истории: {task.exception()}")
+
+    def _dump_users(self) -> list[tuple[float, dict[str, Any]]]:
+        """Состояния историй в памяти со временем последней активности (unix)"""
+        now_wall, now_mono = time.time(), time.monotonic()
+        return [
+            (now_wall - (now_mono - history.last_access), self._dump_user(user_id, history))
+            for user_id, history in self.contexts.items()
+        ]
+
+    def _restore_user(self, last_active: float, state: dict[str, Any]) -> None:
+        """Восстановить историю пользователя из строки снимка"""
+        user_id = state["u"]
+        self._drop(user_id)
+        history = self._new_history(state["p"], self._monotonic(last_active))
+        history.summary = state["s"]
+        for text, ts, tokens in state["m"]:
+            message = UserMessage(
+                user_id=user_id,
+                text=text,
+                timestamp=datetime.fromisoformat(ts),
+                token_count=tokens,
+            )
+            self._append(history, history.messages, message)
+        for content, ts, model, tokens in state["r"]:
+            response = LLMResponse(
+                content=content,
+                timestamp=datetime.fromisoformat(ts),
+                model_used=model,
+                token_count=tokens,
+            )
+            self._append(history, history.responses, response)
+        self.contexts[user_id] = history
+
+    def _replay(self, record: dict[str, Any]) -> None:
+        """Применить операцию журнала к историям в памяти"""
+        user_id = record["u"]
+        op = record["op"]
+        if op == "clear":
+            self._drop(user_id)
+            return
+        if op == "compact":
+            self._compact(user_id, record["s"], datetime.fromisoformat(record["b"]))
+            return
+
+        timestamp = datetime.fromisoformat(record["t"])
+        history = self.contexts.get(user_id)
+        if history is None:
+            if op != "msg":
+                return
+            history = self._new_history(record["p"], 0.0)
+            self.contexts[user_id] = history
+
+        if op == "msg":
+            message = UserMessage(
+                user_id=user_id, text=record["x"], timestamp=timestamp, token_count=record["k"]
+            )
+            self._append(history, history.messages, message)
+        else:
+            response = LLMResponse(
+                content=record["x"],
+                timestamp=timestamp,
+                model_used=record["m"],
+                token_count=record["k"],
+            )
+            self._append(history, history.responses, response)
+        history.last_access = self._monotonic(timestamp.timestamp())
+        self.contexts.move_to_end(user_id)
+
+    def _new_history(self, system_prompt: str, last_access: float) -> UserHistory:
+        """Создать пустую историю и учесть ее в памяти (без регистрации в contexts)"""
+        history = UserHistory(
+            system_prompt=system_prompt,
+            messages=deque(maxlen=self.max_history),
+            responses=deque(maxlen=self.max_history),
+            last_access=last_access,
+        )
+        history.size = self._history_size(history)
+        self.memory_used += history.size
+        return history
+
+    @staticmethod
+    def _dump_user(user_id: int, history: UserHistory) -> dict[str, Any]:
+        """Состояние истории пользователя для снимка журнала"""
+        return {
+            "u": user_id,
+            "p": history.system_prompt,
+            "s": history.summary,
+            "m": [[m.text, m.timestamp.isoformat(), m.token_count] for m in history.messages],
+            "r": [
+                [r.content, r.timestamp.isoformat(), r.model_used, r.token_count]
+                for r in history.responses
+            ],
+        }
+
+    @staticmethod
+    def _monotonic(wall_time: float) -> float:
+        """Перевести время unix в шкалу time.monotonic() текущего процесса"""
+        return time.monotonic() - (time.time() - wall_time)
+
+    @staticmethod
+    def _history_size(history: UserHistory) -> int:
+        """Оценка памяти истории пользователя (байт)"""
+        size = sys.getsizeof(history.system_prompt) + sys.getsizeof(history.summary)
+        size += sum(record_size(m) for m in history.messages)
+        size += sum(record_size(r) for r in history.responses)
+        return size
+
+    @staticmethod
+    def _snapshot(user_id: int, history: UserHistory) -> ConversationContext:
+        """Контекст диалога - копия окон истории на момент вызова"""
+        return ConversationContext(
+            user_id=user_id,
+            messages=list(history.messages),
+            responses=list(history.responses),
+            system_prompt=history.system_prompt,
+            summary=history.summary,
+        )
@@ -0,0 +1,91 @@
+"""Сжатие старых ходов диалога в краткое содержание"""
+
+import logging
+
+from .llm_client import LLMClient
+from .llm_scheduler import Priority
+from .models import Compaction, ConversationContext
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTION = (
+    "Ты сжимаешь историю диалога пользователя с ассистентом. "
+    "Объедини предыдущее краткое содержание (если есть) и новые реплики в одно "
+    "краткое содержание: факты о пользователе, его цели, принятые решения и "
+    "открытые вопросы. Пиши сжато, без вступлений, на языке диалога."
+)
+
+
+class HistorySummarizer:
+    """
+    Сжатие самых старых ходов диалога через отдельный запрос к LLM
+
+    Когда в окне истории набирается threshold ходов, все ходы, кроме
+    keep_recent последних, пересказываются вместе с прежним кратким
+    содержанием. Граница сжатия - последние сжатые сообщение и ответ.
+    """
+
+    def __init__(self, llm_client: LLMClient, threshold: int = 8, keep_recent: int = 4) -> None:
+        """
+        Инициализация суммаризатора
+
+        Args:
+            llm_client: Клиент LLM для запросов на пересказ
+            threshold: Количество ходов в окне, при котором запускается сжатие
+            keep_recent: Количество последних ходов, остающихся без сжатия
+        """
+        if not 0 < keep_recent < threshold:
+            raise ValueError(
+                f"keep_recent должен быть в диапазоне (0, threshold), "
+                f"получено keep_recent={keep_recent}, threshold={threshold}"
+            )
+
+        self.llm_client = llm_client
+        self.threshold = threshold
+        self.keep_recent = keep_recent
+        self.compactions = 0
+
+    def should_compact(self, context: ConversationContext) -> bool:
+        """Набралось ли в контексте достаточно ходов для сжатия"""
+        return len(context.messages) >= self.threshold
+
+    async def summarize(self, context: ConversationContext) -> Compaction | None:
+        """
+        Пересказать старые ходы контекста
+
+        Args:
+            context: Снимок контекста диалога
+
+        Returns:
+            Результат сжатия или None, если сжимать нечего
+        """
+        turns = min(len(context.messages) - self.keep_recent, len(context.responses))
+        if turns <= 0:
+            return None
+
+        lines = []
+        if context.summary:
+            lines.append(f"Предыдущее краткое содержание:\n{context.summary}\n")
+        lines.append("Новые реплики:")
+        for message, response in zip(
+            context.messages[:turns], context.responses[:turns], strict=True
+        ):
+            lines.append(f"Пользователь: {message.text}")
+            lines.append(f"Ассистент: {response.content}")
+
+        summary = await self.llm_client.get_response(
+            [
+                {"role": "system", "content": SUMMARY_INSTRUCTION},
+                {"role": "user", "content": "\n".join(lines)},
+            ],
+            priority=Priority.BACKGROUND,
+        )
+        self.compactions += 1
+        logger.info(f"Сжато {turns} ходов user {context.user_id} ({len(summary)} символов)")
+        return Compaction(
+            summary=summary,
+            before=context.messages[turns].timestamp,
+            turns=turns,
+            last_message=context.messages[turns - 1],
+            last_response=context.responses[turns - 1],
+        )
@@ -1,17 +1,50 @@
 """Клиент для работы с LLM через OpenRouter"""
 
+import asyncio
 import logging
-from typing import Any
+import time
+from collections.abc import AsyncGenerator, AsyncIterator, Awaitable, Sequence
+from contextlib import AbstractAsyncContextManager, aclosing, asynccontextmanager, nullcontext
+from dataclasses import fields
+from typing import Any, cast
 
-from openai import AsyncOpenAI
+import httpx
+from openai import NOT_GIVEN, AsyncOpenAI, AsyncStream
+from openai.types.chat import ChatCompletionChunk, ChatCompletionMessageParam
+
+from .deadline import Deadline, DeadlineExceededError, deadline_scope, iterate_within
+from .llm_resilience import RETRYABLE_ERRORS, CircuitBreaker, ModelHealth, RetryPolicy
+from .llm_response_cache import LLMResponseCache, request_key
+from .llm_scheduler import LLMScheduler, Priority
+from .models import LLMUsage
+from .single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+# Текст ответа и расход вызова API
+Completion = tuple[str, LLMUsage]
+
 
 class LLMClient:
     """Клиент для взаимодействия с OpenRouter API"""
 
-    def __init__(self, api_key: str, model: str, max_tokens: int, temperature: float):
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        max_tokens: int,
+        temperature: float,
+        response_cache: LLMResponseCache | None = None,
+        single_flight: bool = True,
+        scheduler: LLMScheduler | None = None,
+        fallback_models: Sequence[str] = (),
+        retry_policy: RetryPolicy | None = None,
+        base_url: str = OPENROUTER_BASE_URL,
+        http_client: httpx.AsyncClient | None = None,
+        breaker: CircuitBreaker | None = None,
+    ):
         """
         Инициализация клиента OpenRouter
 
@@ -20,49 +53,514 @@ class LLMClient:
             model: Название модели (например, openai/gpt-3.5-turbo)
             max_tokens: Максимальное количество токенов в ответе
             temperature: Температура генерации (0.0 - 1.0)
+            response_cache: Кеш ответов по точному совпадению запроса (None - отключен)
+            single_flight: Объединять одинаковые одновременные запросы в один вызов API
+            scheduler: Ограничение одновременных запросов к API (None - без ограничения)
+            fallback_models: Резервные модели в порядке использования при ошибках основной
+            retry_policy: Политика повторов и хеджирования (None - политика по умолчанию)
+            base_url: Адрес OpenAI-совместимого API
+            http_client: Общий HTTP-клиент с пулом соединений (None - клиент SDK по умолчанию)
+            breaker: Автомат защиты upstream: при массовых ошибках вызовы отклоняются
+                сразу (None - отключен)
         """
         self.model = model
         self.max_tokens = max_tokens
         self.temperature = temperature
+        self.response_cache = response_cache
+        self.inflight: SingleFlight[Completion] | None = SingleFlight() if single_flight else None
+        # Срок общего запроса single-flight: самый поздний из сроков ожидающих вызовов
+        self._shared_deadlines: dict[str, Deadline | None] = {}
+        self.scheduler = scheduler
+        self.fallback_models = [m for m in dict.fromkeys(fallback_models) if m != model]
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breaker = breaker
+        self.health: dict[str, ModelHealth] = {
+            m: ModelHealth(
+                failure_threshold=self.retry_policy.failure_threshold,
+                cooldown=self.retry_policy.cooldown,
+            )
+            for m in (model, *self.fallback_models)
+        }
+        self.retries = 0
+        self.hedges = 0
+        self.cancelled = 0
 
-        # Инициализация OpenAI клиента с base_url для OpenRouter
-        self.client = AsyncOpenAI(api_key=api_key, base_url="https://openrouter.ai/api/v1")
+        # Инициализация OpenAI клиента; повторы выполняет retry_policy, поэтому
+        # встроенные повторы SDK отключены. Без request_timeout действуют таймауты
+        # http_client (или SDK)
+        timeout = self.retry_policy.request_timeout
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,
+            timeout=NOT_GIVEN if timeout is None else timeout,
+            http_client=http_client,
+        )
 
-        logger.info(f"LLMClient инициализирован: {model}")
+        if self.fallback_models:
+            logger.info(
+                f"LLMClient инициализирован: {model} (резервные: "
+                f"{', '.join(self.fallback_models)}, {base_url})"
+            )
+        else:
+            logger.info(f"LLMClient инициализирован: {model} ({base_url})")
 
-    async def get_response(self, messages: list[dict[str, Any]]) -> str:
+    async def get_response(
+        self,
+        messages: list[dict[str, Any]],
+        cache: bool | None = None,
+        priority: Priority = Priority.INTERACTIVE,
+        usage: LLMUsage | None = None,
+        model: str | None = None,
+        max_tokens: int | None = None,
+        deadline: Deadline | None = None,
+    ) -> str:
         """
         Получить ответ от LLM
 
+        Кеш ответов (если передан в конструктор) используется для
+        детерминированных настроек (temperature=0) или когда вызывающий
+        маршрут явно разрешил его (cache=True); cache=False - обход кеша.
+        Одинаковые одновременные запросы выполняются одним вызовом API.
+        Вызов API ждет слот планировщика с указанным приоритетом. Временные
+        ошибки повторяются по retry_policy (с переходом на резервные модели),
+        медленный ответ дублируется запросом к следующей модели (хеджирование).
+        По истечении срока хода ожидание и вызовы API отменяются, повтор, пауза
+        перед которым не укладывается в срок, не выполняется.
+
         Args:
             messages: Список сообщений в формате [{"role": "...", "content": "..."}]
+            cache: Использовать кеш ответов (None - только при temperature=0)
+            priority: Приоритет запроса в очереди планировщика
+            usage: Заполняется моделью, токенами и задержкой вызова API
+            model: Модель запроса (None - основная); основная и резервные
+                модели становятся ее резервными
+            max_tokens: Лимит токенов ответа (None - max_tokens клиента)
+            deadline: Срок хода (None - без ограничения)
 
         Returns:
             Текст ответа от LLM
 
         Raises:
+            LLMQueueTimeoutError: Если запрос не дождался слота планировщика
+            LLMUnavailableError: Если автомат защиты upstream разомкнут
+            DeadlineExceededError: Если срок хода истек
             Exception: При ошибках API
         """
-        try:
-            logger.info(f"Отправка запроса к {self.model} ({len(messages)} сообщений)")
+        model = model or self.model
+        max_tokens = max_tokens or self.max_tokens
+        if usage is not None:
+            usage.model = model
+        if cache is None:
+            cache = self.temperature == 0
+        use_cache = self.response_cache is not None and cache
 
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,  # type: ignore[arg-type]
-                max_tokens=self.max_tokens,
-                temperature=self.temperature,
+        key = None
+        if use_cache or self.inflight is not None:
+            key = request_key(model, self.temperature, max_tokens, messages)
+        if use_cache and self.response_cache is not None and key is not None:
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                logger.info(f"Ответ из кеша: {len(cached)} символов")
+                return cached
+
+        async with deadline_scope(deadline, "ответ LLM"):
+            content, call_usage = await self._coalesced(
+                messages, priority, key, model, max_tokens, deadline
             )
+        if usage is not None:
+            for field in fields(LLMUsage):
+                setattr(usage, field.name, getattr(call_usage, field.name))
+
+        if use_cache and self.response_cache is not None and key is not None and content:
+            self.response_cache.put(key, content)
+        return content
+
+    async def close(self) -> None:
+        """Закрыть HTTP-клиент (вместе с переданным общим пулом соединений)"""
+        await self.client.close()
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Статистика повторов, хеджирования и состояния моделей
+
+        Returns:
+            Словарь с количеством повторов, дублирующих и отмененных запросов и
+            статистикой по моделям
+        """
+        stats: dict[str, Any] = {
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "cancelled": self.cancelled,
+            "models": {model: health.stats() for model, health in self.health.items()},
+        }
+        if self.breaker is not None:
+            stats["circuit"] = self.breaker.stats()
+        return stats
+
+    def ensure_available(self) -> None:
+        """
+        Отклонить запрос сразу, если автомат защиты upstream его не пропустит
+
+        Позволяет не начинать ход (запись в БД, очередь планировщика), который
+        все равно завершится ошибкой.
+
+        Raises:
+            LLMUnavailableError: Если автомат разомкнут
+        """
+        if self.breaker is not None:
+            self.breaker.check()
+
+    def _slot(self, priority: Priority) -> AbstractAsyncContextManager[None]:
+        """Слот планировщика для вызова API (без планировщика - без ожидания)"""
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot(priority)
+
+    @asynccontextmanager
+    async def _upstream(
+        self, priority: Priority, measure_latency: bool = True
+    ) -> AsyncIterator[None]:
+        """Один вызов API: слот планировщика и автомат защиты upstream"""
+        # Не занимать место в очереди, если вызов все равно будет отклонен
+        self.ensure_available()
+        async with self._slot(priority):
+            if self.breaker is None:
+                yield
+                return
+            with self.breaker.call(RETRYABLE_ERRORS, measure_latency):
+                yield
+
+    def _candidates(self, model: str) -> list[str]:
+        """
+        Модели в порядке попыток: доступные по порядку настройки, затем деградировавшие
+
+        Модель запроса идет первой, за ней основная и резервные модели клиента.
+        """
+        models = list(dict.fromkeys((model, self.model, *self.fallback_models)))
+        for m in models:
+            if m not in self.health:
+                self.health[m] = ModelHealth(
+                    failure_threshold=self.retry_policy.failure_threshold,
+                    cooldown=self.retry_policy.cooldown,
+                )
+        return sorted(models, key=lambda m: not self.health[m].available)
+
+    async def _before_attempt(
+        self, attempt: int, candidates: list[str], deadline: Deadline | None
+    ) -> str:
+        """
+        Выбрать модель для попытки и выдержать паузу перед повтором
+
+        Пауза с джиттером нужна, только когда все модели уже пробовали:
+        переход на резервную модель выполняется сразу. Повтор, который
+        начнется уже после срока хода, не выполняется.
+        """
+        model = candidates[attempt % len(candidates)]
+        pause = 0.0
+        if attempt >= len(candidates):
+            pause = self.retry_policy.backoff(attempt - len(candidates))
+        if attempt and deadline is not None and pause >= deadline.remaining():
+            raise DeadlineExceededError("повтор запроса к LLM")
+        if attempt:
+            self.retries += 1
+            logger.warning(f"Повтор {attempt} запроса к LLM через {model}")
+        if pause:
+            await asyncio.sleep(pause)
+        return model
+
+    async def _coalesced(
+        self,
+        messages: list[dict[str, Any]],
+        priority: Priority,
+        key: str | None,
+        model: str,
+        max_tokens: int,
+        deadline: Deadline | None,
+    ) -> Completion:
+        """
+        Выполнить запрос или присоединиться к одинаковому выполняющемуся
+
+        Повторы общего запроса ограничены самым поздним сроком из ожидающих
+        его вызовов: срок вызова, который начал запрос, не обрывает повторы для
+        остальных. Ожидание каждого вызова ограничено его собственным сроком
+        (deadline_scope в get_response); сам запрос отменяется, когда его
+        перестали ждать все вызовы.
+        """
+        if self.inflight is None or key is None:
+            return await self._complete(messages, priority, model, max_tokens, deadline)
+
+        leader = False
 
-            content = response.choices[0].message.content
-            if content is None:
-                content = ""
+        async def shared() -> Completion:
+            try:
+                return await self._complete(messages, priority, model, max_tokens, deadline, key)
+            finally:
+                self._shared_deadlines.pop(key, None)
 
-            tokens_used = response.usage.total_tokens if response.usage else 0
+        def start() -> Awaitable[Completion]:
+            nonlocal leader
+            leader = True
+            self._shared_deadlines[key] = deadline
+            return shared()
 
-            logger.info(f"Получен ответ: {len(content)} символов, {tokens_used} токенов")
+        if key in self._shared_deadlines:
+            self._extend_shared_deadline(key, deadline)
+        content, usage = await self.inflight.run(key, start)
+        # Расход объединенного запроса учтен у вызова, выполнившего запрос к API
+        return content, usage if leader else LLMUsage(model=usage.model)
 
-            return content
+    def _extend_shared_deadline(self, key: str, deadline: Deadline | None) -> None:
+        """Продлить срок общего запроса до срока присоединившегося вызова (None - без срока)"""
+        current = self._shared_deadlines[key]
+        if current is not None and (deadline is None or deadline.expires_at > current.expires_at):
+            self._shared_deadlines[key] = deadline
+
+    async def _complete(
+        self,
+        messages: list[dict[str, Any]],
+        priority: Priority,
+        model: str,
+        max_tokens: int,
+        deadline: Deadline | None,
+        shared_key: str | None = None,
+    ) -> Completion:
+        """
+        Запрос chat completions к OpenRouter с повторами и резервными моделями
+
+        Для общего запроса single-flight (shared_key) срок перед каждой
+        попыткой берется заново: к запросу могли присоединиться вызовы с
+        более поздним сроком.
+        """
+        try:
+            candidates = self._candidates(model)
+            attempt = 0
+            while True:
+                if shared_key is not None:
+                    deadline = self._shared_deadlines.get(shared_key, deadline)
+                model = await self._before_attempt(attempt, candidates, deadline)
+                try:
+                    return await self._hedged(messages, model, candidates, priority, max_tokens)
+                except RETRYABLE_ERRORS as e:
+                    if attempt == self.retry_policy.max_retries:
+                        raise
+                    logger.warning(f"Временная ошибка {model}: {e}")
+                attempt += 1
 
         except Exception as e:
             logger.error(f"Ошибка при запросе к LLM: {e}")
             raise
+
+    async def _hedged(
+        self,
+        messages: list[dict[str, Any]],
+        model: str,
+        candidates: list[str],
+        priority: Priority,
+        max_tokens: int,
+    ) -> Completion:
+        """
+        Попытка запроса с хеджированием
+
+        Если модель не ответила за перцентиль своей задержки, запускается
+        дублирующий запрос к следующей модели; используется первый успешный
+        ответ, второй запрос отменяется.
+        """
+        delay = None
+        if self.retry_policy.hedge_percentile > 0:
+            delay = self.health[model].latency_percentile(
+                self.retry_policy.hedge_percentile, self.retry_policy.hedge_min_samples
+            )
+        if delay is None:
+            return await self._call(messages, model, priority, max_tokens)
+
+        tasks = [asyncio.ensure_future(self._call(messages, model, priority, max_tokens))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                hedge_model = candidates[(candidates.index(model) + 1) % len(candidates)]
+                self.hedges += 1
+                logger.info(
+                    f"{model} не ответила за {delay:.2f}s, дублирующий запрос к {hedge_model}"
+                )
+                tasks.append(
+                    asyncio.ensure_future(self._call(messages, hedge_model, priority, max_tokens))
+                )
+
+            pending = set(tasks)
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        return task.result()
+            assert error is not None
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # ошибка проигравшего запроса уже не нужна
+
+    async def _call(
+        self, messages: list[dict[str, Any]], model: str, priority: Priority, max_tokens: int
+    ) -> Completion:
+        """Один вызов chat completions с учетом задержки и ошибок модели"""
+        async with self._upstream(priority):
+            logger.info(f"Отправка запроса к {model} ({len(messages)} сообщений)")
+            started = time.monotonic()
+            try:
+                response = await self.client.chat.completions.create(
+                    model=model,
+                    messages=cast(list[ChatCompletionMessageParam], messages),
+                    max_tokens=max_tokens,
+                    temperature=self.temperature,
+                )
+            except asyncio.CancelledError:
+                # Ответ больше не нужен: клиент ушел, истек срок хода или выиграл дубль
+                self.cancelled += 1
+                raise
+            except RETRYABLE_ERRORS:
+                # Ошибки запроса (400, длина контекста) не говорят о здоровье модели
+                self.health[model].record_failure()
+                raise
+            elapsed = time.monotonic() - started
+            self.health[model].record_success(elapsed)
+
+        content = response.choices[0].message.content
+        if content is None:
+            content = ""
+
+        # Обычный ответ приходит целиком: первый токен доступен вместе с последним
+        latency_ms = round(elapsed * 1000)
+        usage = LLMUsage(model=model, latency_ms=latency_ms, first_token_ms=latency_ms)
+        if response.usage:
+            usage.prompt_tokens = response.usage.prompt_tokens
+            usage.completion_tokens = response.usage.completion_tokens
+        tokens_used = response.usage.total_tokens if response.usage else 0
+
+        logger.info(
+            f"Получен ответ: {len(content)} символов, {tokens_used} токенов, {latency_ms} мс"
+        )
+
+        return content, usage
+
+    async def stream_response(
+        self,
+        messages: list[dict[str, Any]],
+        priority: Priority = Priority.INTERACTIVE,
+        usage: LLMUsage | None = None,
+        model: str | None = None,
+        max_tokens: int | None = None,
+        deadline: Deadline | None = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        Получить ответ от LLM потоком (stream=True)
+
+        Слот планировщика занят до конца потока. Временная ошибка до первого
+        фрагмента повторяется по retry_policy (с переходом на резервные модели),
+        после первого фрагмента - пробрасывается. Срок хода ограничивает
+        ожидание каждого фрагмента: по его истечении поток закрывается.
+
+        Args:
+            messages: Список сообщений в формате [{"role": "...", "content": "..."}]
+            priority: Приоритет запроса в очереди планировщика
+            usage: Заполняется моделью, токенами и задержками после окончания потока
+            model: Модель запроса (None - основная)
+            max_tokens: Лимит токенов ответа (None - max_tokens клиента)
+            deadline: Срок хода (None - без ограничения)
+
+        Yields:
+            Фрагменты текста ответа по мере генерации
+
+        Raises:
+            LLMQueueTimeoutError: Если запрос не дождался слота планировщика
+            LLMUnavailableError: Если автомат защиты upstream разомкнут
+            DeadlineExceededError: Если срок хода истек
+            Exception: При ошибках API
+        """
+        if usage is None:
+            usage = LLMUsage()
+        try:
+            candidates = self._candidates(model or self.model)
+            for attempt in range(self.retry_policy.max_retries + 1):
+                model = await self._before_attempt(attempt, candidates, deadline)
+                started = False
+                try:
+                    # aclosing освобождает слот сразу, если потребитель прекратил чтение
+                    stream = self._stream(
+                        messages, model, priority, usage, max_tokens or self.max_tokens
+                    )
+                    async with aclosing(stream) as chunks:
+                        async for delta in iterate_within(deadline, chunks, "поток ответа LLM"):
+                            started = True
+                            yield delta
+                    return
+                except RETRYABLE_ERRORS as e:
+                    if started or attempt == self.retry_policy.max_retries:
+                        raise
+                    logger.warning(f"Временная ошибка потока {model}: {e}")
+
+        except Exception as e:
+            logger.error(f"Ошибка при потоковом запросе к LLM: {e}")
+            raise
+
+    async def _stream(
+        self,
+        messages: list[dict[str, Any]],
+        model: str,
+        priority: Priority,
+        usage: LLMUsage,
+        max_tokens: int,
+    ) -> AsyncGenerator[str, None]:
+        """Один потоковый вызов chat completions с учетом задержки и ошибок модели"""
+        length = 0
+
+        # Контекст потока закрывает HTTP-соединение, если потребитель прекратил чтение.
+        # Длительность потока зависит от длины ответа и автоматом не учитывается
+        async with self._upstream(priority, measure_latency=False):
+            logger.info(f"Отправка потокового запроса к {model} ({len(messages)} сообщений)")
+            started = time.monotonic()
+            first_token_at: float | None = None
+            try:
+                stream: AsyncStream[
+                    ChatCompletionChunk
+                ] = await self.client.chat.completions.create(
+                    model=model,
+                    messages=cast(list[ChatCompletionMessageParam], messages),
+                    max_tokens=max_tokens,
+                    temperature=self.temperature,
+                    stream=True,
+                    # Последний чанк содержит usage (токены промпта и ответа)
+                    stream_options={"include_usage": True},
+                )
+                async with stream:
+                    async for chunk in stream:
+                        if chunk.usage:
+                            usage.prompt_tokens = chunk.usage.prompt_tokens
+                            usage.completion_tokens = chunk.usage.completion_tokens
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if not delta:
+                            continue
+                        if first_token_at is None:
+                            first_token_at = time.monotonic() - started
+                            logger.info(f"Первый токен через {first_token_at:.2f}s")
+                        length += len(delta)
+                        yield delta
+            except (asyncio.CancelledError, GeneratorExit):
+                # Потребитель прекратил чтение: остаток ответа не генерируется
+                self.cancelled += 1
+                raise
+            except RETRYABLE_ERRORS:
+                # Ошибки запроса (400, длина контекста) не говорят о здоровье модели
+                self.health[model].record_failure()
+                raise
+            elapsed = time.monotonic() - started
+            self.health[model].record_success(elapsed)
+
+        usage.model = model
+        usage.latency_ms = round(elapsed * 1000)
+        usage.first_token_ms = round((elapsed if first_token_at is None else first_token_at) * 1000)
+        logger.info(f"Получен потоковый ответ: {length} символов за {elapsed:.2f}s")
@@ -0,0 +1,331 @@
+"""Политика повторов, учет состояния моделей и автомат защиты upstream LLM"""
+
+import logging
+import random
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from enum import StrEnum
+
+from openai import APIConnectionError, InternalServerError, RateLimitError
+
+# Временные ошибки, после которых запрос имеет смысл повторить (в т.ч. APITimeoutError)
+RETRYABLE_ERRORS: tuple[type[Exception], ...] = (
+    APIConnectionError,
+    InternalServerError,
+    RateLimitError,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailableError(Exception):
+    """Upstream LLM недоступен: автомат защиты разомкнут, запрос отклонен без вызова API"""
+
+    def __init__(self, retry_after: float) -> None:
+        """
+        Args:
+            retry_after: Через сколько секунд имеет смысл повторить запрос
+        """
+        super().__init__(f"LLM временно недоступен, повторите через {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+@dataclass(slots=True)
+class RetryPolicy:
+    """
+    Политика повторов и хеджирования запросов к LLM
+
+    Attributes:
+        max_retries: Количество повторов после неудачной попытки
+        base_delay: Базовая пауза перед повтором в секундах
+        max_delay: Максимальная пауза перед повтором в секундах
+        hedge_percentile: Перцентиль задержки модели, после которого запускается
+            дублирующий запрос (0 - без хеджирования)
+        hedge_min_samples: Минимум измерений задержки для расчета порога хеджирования
+        request_timeout: Таймаут одной попытки в секундах (None - таймаут SDK)
+        failure_threshold: Ошибок подряд до исключения модели из маршрутизации
+        cooldown: Время исключения модели после серии ошибок в секундах
+    """
+
+    max_retries: int = 2
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    hedge_percentile: float = 0.0
+    hedge_min_samples: int = 20
+    request_timeout: float | None = None
+    failure_threshold: int = 3
+    cooldown: float = 30.0
+
+    def backoff(self, retry: int) -> float:
+        """
+        Пауза перед повтором с экспоненциальным ростом и полным джиттером
+
+        Args:
+            retry: Номер повтора (с 0)
+
+        Returns:
+            Случайная пауза в интервале [0, min(max_delay, base_delay * 2^retry)]
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**retry))
+
+
+class ModelHealth:
+    """
+    Задержки и ошибки модели за последние window запросов
+
+    После failure_threshold ошибок подряд модель считается деградировавшей
+    на cooldown секунд: запросы направляются на нее только если остальные
+    модели тоже недоступны.
+    """
+
+    def __init__(self, window: int = 100, failure_threshold: int = 3, cooldown: float = 30.0):
+        """
+        Инициализация счетчиков модели
+
+        Args:
+            window: Количество последних запросов для статистики
+            failure_threshold: Ошибок подряд до пометки модели деградировавшей
+            cooldown: Время исключения деградировавшей модели в секундах
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.degraded_until = 0.0
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._outcomes: deque[bool] = deque(maxlen=window)
+
+    @property
+    def available(self) -> bool:
+        """Модель не находится в периоде исключения после серии ошибок"""
+        return time.monotonic() >= self.degraded_until
+
+    def record_success(self, latency: float) -> None:
+        """Учесть успешный запрос и его задержку"""
+        self._latencies.append(latency)
+        self._outcomes.append(True)
+        self.consecutive_failures = 0
+        self.degraded_until = 0.0
+
+    def record_failure(self) -> None:
+        """Учесть ошибку запроса (серия ошибок исключает модель на cooldown)"""
+        self._outcomes.append(False)
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            self.degraded_until = time.monotonic() + self.cooldown
+
+    def latency_percentile(self, q: float, min_samples: int = 1) -> float | None:
+        """
+        Перцентиль задержки успешных запросов
+
+        Args:
+            q: Перцентиль в долях (0.95 - p95)
+            min_samples: Минимум измерений для расчета
+
+        Returns:
+            Задержка в секундах или None, если измерений недостаточно
+        """
+        if len(self._latencies) < max(min_samples, 1):
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def stats(self) -> dict[str, float | bool]:
+        """
+        Статистика модели
+
+        Returns:
+            Словарь с количеством запросов, долей ошибок, p50/p95 задержки и доступностью
+        """
+        errors = self._outcomes.count(False)
+        return {
+            "requests": len(self._outcomes),
+            "error_rate": errors / len(self._outcomes) if self._outcomes else 0.0,
+            "p50": self.latency_percentile(0.5) or 0.0,
+            "p95": self.latency_percentile(0.95) or 0.0,
+            "consecutive_failures": self.consecutive_failures,
+            "available": self.available,
+        }
+
+
+class CircuitState(StrEnum):
+    """Состояние автомата защиты"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Автомат защиты upstream LLM с пробными запросами
+
+    В замкнутом состоянии учитываются исходы последних window вызовов API;
+    при доле ошибок не меньше failure_rate (и хотя бы min_requests вызовах)
+    автомат размыкается и вызовы отклоняются сразу, без ожидания таймаутов.
+    Через open_timeout секунд пропускается один пробный вызов: успех замыкает
+    автомат, ошибка размыкает его снова с удвоенным таймаутом (не больше
+    max_open_timeout), так что длительная деградация не нагружается пробами.
+    Ошибкой считаются временные ошибки API и вызовы дольше slow_call_threshold.
+    """
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        min_requests: int = 10,
+        window: int = 50,
+        open_timeout: float = 5.0,
+        max_open_timeout: float = 120.0,
+        slow_call_threshold: float = 0.0,
+    ) -> None:
+        """
+        Инициализация автомата
+
+        Args:
+            failure_rate: Доля ошибок в окне, при которой автомат размыкается
+            min_requests: Минимум вызовов в окне для оценки доли ошибок
+            window: Количество последних вызовов в окне
+            open_timeout: Начальное время разомкнутого состояния в секундах
+            max_open_timeout: Предел роста времени разомкнутого состояния в секундах
+            slow_call_threshold: Вызов дольше этого времени считается ошибкой
+                (0 - длительность не учитывается)
+        """
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.open_timeout = open_timeout
+        self.max_open_timeout = max_open_timeout
+        self.slow_call_threshold = slow_call_threshold
+        self.opened = 0
+        self.rejected = 0
+
+        self._state = CircuitState.CLOSED
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._timeout = open_timeout
+        self._open_until = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> CircuitState:
+        """Текущее состояние (разомкнутый автомат переходит в пробный по таймауту)"""
+        if self._state is CircuitState.OPEN and time.monotonic() >= self._open_until:
+            self._state = CircuitState.HALF_OPEN
+            logger.info("Автомат защиты LLM: пробный режим")
+        return self._state
+
+    @property
+    def accepting(self) -> bool:
+        """Вызов будет пропущен: автомат замкнут или свободен слот пробного вызова"""
+        state = self.state
+        return state is CircuitState.CLOSED or (
+            state is CircuitState.HALF_OPEN and not self._probe_in_flight
+        )
+
+    @property
+    def retry_after(self) -> float:
+        """Время до следующего пробного вызова в секундах (0 - вызовы пропускаются)"""
+        if self.accepting:
+            return 0.0
+        return max(self._open_until - time.monotonic(), 1.0)
+
+    def check(self) -> None:
+        """
+        Отклонить запрос, если автомат его не пропустит
+
+        Raises:
+            LLMUnavailableError: Если автомат разомкнут или пробный вызов уже идет
+        """
+        if not self.accepting:
+            self.rejected += 1
+            raise LLMUnavailableError(self.retry_after)
+
+    @contextmanager
+    def call(
+        self, failure_errors: tuple[type[BaseException], ...], measure_latency: bool = True
+    ) -> Iterator[None]:
+        """
+        Выполнить вызов API под защитой автомата
+
+        Args:
+            failure_errors: Ошибки, которые считаются отказом upstream
+            measure_latency: Учитывать длительность вызова (slow_call_threshold)
+
+        Raises:
+            LLMUnavailableError: Если автомат не пропускает вызов
+        """
+        self.check()
+        probe = self.state is CircuitState.HALF_OPEN
+        if probe:
+            self._probe_in_flight = True
+        started = time.monotonic()
+        try:
+            yield
+        except failure_errors:
+            self._record(False, probe)
+            raise
+        except BaseException:
+            # Отмена и ошибки запроса (не upstream) не влияют на состояние
+            if probe:
+                self._probe_in_flight = False
+            raise
+        slow = (
+            measure_latency
+            and self.slow_call_threshold > 0
+            and time.monotonic() - started > self.slow_call_threshold
+        )
+        self._record(not slow, probe)
+
+    def stats(self) -> dict[str, float | str]:
+        """
+        Статистика автомата
+
+        Returns:
+            Словарь с состоянием, долей ошибок в окне, числом размыканий и отклоненных
+            запросов и временем до следующего пробного вызова
+        """
+        return {
+            "state": self.state.value,
+            "failure_rate": self._failures() / len(self._outcomes) if self._outcomes else 0.0,
+            "window_requests": len(self._outcomes),
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_after": self.retry_after,
+        }
+
+    def _failures(self) -> int:
+        """Количество ошибок в окне"""
+        return self._outcomes.count(False)
+
+    def _record(self, success: bool, probe: bool) -> None:
+        """Учесть исход вызова и сменить состояние"""
+        if probe:
+            self._probe_in_flight = False
+            if success:
+                self._close()
+            else:
+                self._open(self._timeout * 2)
+            return
+
+        if self._state is not CircuitState.CLOSED:
+            return  # исход вызова, начатого до размыкания
+        self._outcomes.append(success)
+        if len(self._outcomes) >= self.min_requests and self._failures() >= self.failure_rate * len(
+            self._outcomes
+        ):
+            self._open(self.open_timeout)
+
+    def _open(self, timeout: float) -> None:
+        """Разомкнуть автомат на timeout секунд (не больше max_open_timeout)"""
+        self._timeout = min(timeout, self.max_open_timeout)
+        self._open_until = time.monotonic() + self._timeout
+        self._state = CircuitState.OPEN
+        self.opened += 1
+        logger.warning(f"Автомат защиты LLM разомкнут на {self._timeout:.0f}s")
+
+    def _close(self) -> None:
+        """Замкнуть автомат и начать окно заново"""
+        self._state = CircuitState.CLOSED
+        self._outcomes.clear()
+        self._timeout = self.open_timeout
+        logger.info("Автомат защиты LLM замкнут: upstream отвечает")
@@ -0,0 +1,132 @@
+"""Кеш ответов LLM по точному совпадению запроса"""
+
+import hashlib
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+def request_key(
+    model: str, temperature: float, max_tokens: int, messages: list[dict[str, Any]]
+) -> str:
+    """
+    Канонический ключ запроса к LLM
+
+    Сообщения сериализуются в JSON с сортировкой ключей, поэтому порядок
+    полей в словарях сообщений не влияет на ключ.
+
+    Returns:
+        SHA-256 канонического представления запроса (hex)
+    """
+    canonical = json.dumps(
+        [model, temperature, max_tokens, messages],
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    LRU/TTL кеш ответов LLM, ограниченный количеством записей и объемом
+
+    Хранит текст ответа по ключу request_key; записи старше ttl считаются
+    промахом и удаляются при обращении.
+    """
+
+    def __init__(
+        self, max_entries: int = 1000, max_bytes: int = 16 * 1024 * 1024, ttl: float = 3600.0
+    ) -> None:
+        """
+        Инициализация кеша
+
+        Args:
+            max_entries: Максимальное количество ответов в кеше
+            max_bytes: Бюджет памяти ответов в байтах, оценка (0 - без ограничения)
+            ttl: Время жизни ответа в секундах
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple[str, float, int]] = OrderedDict()
+        logger.info(
+            f"LLMResponseCache инициализирован (max_entries={max_entries}, "
+            f"max_bytes={max_bytes}, ttl={ttl}s)"
+        )
+
+    def get(self, key: str) -> str | None:
+        """
+        Получить ответ из кеша
+
+        Args:
+            key: Ключ запроса (request_key)
+
+        Returns:
+            Текст ответа или None при промахе
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        response, expires_at, size = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.bytes_used -= size
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return response
+
+    def put(self, key: str, response: str) -> None:
+        """Сохранить ответ (ответ больше бюджета памяти не кешируется)"""
+        size = sys.getsizeof(response) + sys.getsizeof(key)
+        if self.max_entries <= 0 or (self.max_bytes > 0 and size > self.max_bytes):
+            return
+
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.bytes_used -= previous[2]
+
+        self._entries[key] = (response, time.monotonic() + self.ttl, size)
+        self.bytes_used += size
+        while len(self._entries) > self.max_entries or (
+            self.max_bytes > 0 and self.bytes_used > self.max_bytes
+        ):
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self.bytes_used -= evicted_size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Очистить кеш"""
+        self._entries.clear()
+        self.bytes_used = 0
+
+    def stats(self) -> dict[str, float]:
+        """
+        Статистика кеша
+
+        Returns:
+            Словарь с размером кеша, объемом, попаданиями, промахами и долей попаданий
+        """
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "bytes": self.bytes_used,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,153 @@
+"""Ограничение одновременных запросов к LLM с приоритетной очередью"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from enum import IntEnum
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Приоритет запроса к LLM (меньше - раньше)"""
+
+    INTERACTIVE = 0  # ходы диалога, которых ждет пользователь
+    ANALYTICS = 1  # text2sql в admin режиме
+    BACKGROUND = 2  # фоновые задачи (сжатие истории)
+
+
+class LLMQueueTimeoutError(Exception):
+    """Запрос не дождался свободного слота за отведенное время"""
+
+
+class LLMScheduler:
+    """
+    Планировщик запросов к LLM: не более max_concurrency одновременно
+
+    Запросы сверх лимита ждут в очереди по приоритету (FIFO внутри
+    приоритета). Освободившийся слот передается первому ожидающему
+    напрямую, поэтому новые запросы не обгоняют очередь. Запрос, не
+    получивший слот за queue_timeout секунд, завершается LLMQueueTimeoutError.
+    """
+
+    def __init__(self, max_concurrency: int = 8, queue_timeout: float = 30.0) -> None:
+        """
+        Инициализация планировщика
+
+        Args:
+            max_concurrency: Максимальное количество одновременных запросов
+            queue_timeout: Максимальное время ожидания в очереди в секундах (0 - без ограничения)
+        """
+        if max_concurrency <= 0:
+            raise ValueError(f"max_concurrency должен быть больше 0, получено {max_concurrency}")
+
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.admitted = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._queue: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._queued: dict[Priority, int] = dict.fromkeys(Priority, 0)
+        self._seq = itertools.count()
+        logger.info(
+            f"LLMScheduler инициализирован (max_concurrency={max_concurrency}, "
+            f"queue_timeout={queue_timeout}s)"
+        )
+
+    @asynccontextmanager
+    async def slot(
+        self, priority: Priority = Priority.INTERACTIVE, queue_timeout: float | None = None
+    ) -> AsyncIterator[None]:
+        """
+        Занять слот на время запроса к LLM
+
+        Args:
+            priority: Приоритет запроса
+            queue_timeout: Время ожидания в очереди (None - значение планировщика)
+
+        Raises:
+            LLMQueueTimeoutError: Если слот не освободился вовремя
+        """
+        await self._acquire(
+            priority, self.queue_timeout if queue_timeout is None else queue_timeout
+        )
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict[str, float]:
+        """
+        Метрики планировщика
+
+        Returns:
+            Словарь с активными запросами, глубиной очереди (всего и по приоритетам),
+            количеством допущенных запросов, таймаутов и временем ожидания
+        """
+        stats: dict[str, float] = {
+            "active": self.active,
+            "queued": sum(self._queued.values()),
+            "admitted": self.admitted,
+            "timeouts": self.timeouts,
+            "avg_wait": self.total_wait / self.admitted if self.admitted else 0.0,
+            "max_wait": self.max_wait,
+        }
+        for priority, count in self._queued.items():
+            stats[f"queued_{priority.name.lower()}"] = count
+        return stats
+
+    async def _acquire(self, priority: Priority, queue_timeout: float) -> None:
+        """Получить слот сразу или дождаться его в очереди"""
+        if self.active < self.max_concurrency and not self._queue:
+            self.active += 1
+            self._admit(0.0)
+            return
+
+        started = time.monotonic()
+        waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+        self._queued[priority] += 1
+        try:
+            async with asyncio.timeout(queue_timeout or None):
+                await waiter
+        except (TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Слот уже передан этому запросу - возвращаем его следующему
+                self._release()
+            else:
+                waiter.cancel()
+                self._queued[priority] -= 1
+            if isinstance(e, TimeoutError):
+                self.timeouts += 1
+                logger.warning(
+                    f"Запрос к LLM (priority={priority.name}) не дождался слота за {queue_timeout}s"
+                )
+                raise LLMQueueTimeoutError(
+                    f"Очередь запросов к LLM: ожидание дольше {queue_timeout}s"
+                ) from e
+            raise
+
+        self._admit(time.monotonic() - started)
+
+    def _release(self) -> None:
+        """Освободить слот: передать его первому ожидающему или уменьшить счетчик"""
+        while self._queue:
+            priority, _, waiter = heapq.heappop(self._queue)
+            if waiter.done():
+                continue  # ожидание отменено или истекло
+            self._queued[Priority(priority)] -= 1
+            waiter.set_result(None)
+            return
+        self.active -= 1
+
+    def _admit(self, waited: float) -> None:
+        """Учесть допущенный запрос и время его ожидания"""
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
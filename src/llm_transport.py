@@ -0,0 +1,69 @@
+"""HTTP-транспорт клиента LLM: общий настраиваемый пул соединений"""
+
+import importlib.util
+import logging
+from dataclasses import dataclass
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class TransportSettings:
+    """
+    Настройки пула соединений к API LLM
+
+    Пул обслуживает один base_url, поэтому лимиты соединений фактически
+    действуют на один хост.
+
+    Attributes:
+        max_connections: Максимум одновременных соединений
+        max_keepalive_connections: Максимум простаивающих соединений в пуле
+        keepalive_expiry: Время жизни простаивающего соединения в секундах
+        connect_timeout: Таймаут установки соединения в секундах
+        read_timeout: Таймаут чтения ответа в секундах (между порциями данных)
+        http2: Использовать HTTP/2 (мультиплексирование запросов в одном соединении)
+    """
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 600.0
+    http2: bool = False
+
+
+def create_http_client(settings: TransportSettings) -> httpx.AsyncClient:
+    """
+    Создать HTTP-клиент с пулом соединений для AsyncOpenAI
+
+    HTTP/2 требует пакет h2 (extra http2); без него используется HTTP/1.1
+    с предупреждением в логе.
+
+    Args:
+        settings: Настройки пула соединений
+
+    Returns:
+        httpx.AsyncClient, который можно разделять между клиентами LLM
+    """
+    http2 = settings.http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP/2 недоступен (не установлен пакет h2), используется HTTP/1.1")
+        http2 = False
+
+    logger.info(
+        f"Пул соединений LLM: max_connections={settings.max_connections}, "
+        f"keepalive={settings.max_keepalive_connections}/{settings.keepalive_expiry}s, "
+        f"http2={http2}"
+    )
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.max_connections,
+            max_keepalive_connections=settings.max_keepalive_connections,
+            keepalive_expiry=settings.keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(settings.read_timeout, connect=settings.connect_timeout),
+        follow_redirects=True,
+    )
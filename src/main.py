@@ -3,10 +3,13 @@
 import asyncio
 import logging
 
+from .cached_history_storage import CachedHistoryStorage
 from .config import Config
 from .conversation_manager import ConversationManager
 from .database import create_engine
 from .db_history_storage import DatabaseHistoryStorage
+from .factory import create_history_storage, create_llm_client, create_model_router
+from .history_storage import HistoryStorage
 from .llm_client import LLMClient
 from .telegram_bot import TelegramBot
 
@@ -23,6 +26,8 @@ logger = logging.getLogger(__name__)
 async def main() -> None:
     """Запуск Telegram бота с полной интеграцией"""
     engine = None
+    llm_client: LLMClient | None = None
+    storage: HistoryStorage | DatabaseHistoryStorage | CachedHistoryStorage | None = None
     try:
         logger.info("=== Запуск LLM-ассистента ===")
 
@@ -35,32 +40,39 @@ async def main() -> None:
         logger.info("✅ Движок БД инициализирован")
 
         # Инициализация LLM клиента
-        llm_client = LLMClient(
-            api_key=config.openrouter_key,
-            model=config.default_model,
-            max_tokens=config.max_tokens,
-            temperature=config.temperature,
-        )
+        llm_client = create_llm_client(config)
         logger.info("✅ LLM клиент инициализирован")
 
-        # Инициализация хранилища с БД
-        storage = DatabaseHistoryStorage(
-            engine=engine,
-            max_history=config.max_history_messages,
-        )
-        logger.info("✅ DatabaseHistoryStorage инициализирован")
+        # Инициализация хранилища истории
+        storage = create_history_storage(engine, config)
+        logger.info(f"✅ {type(storage).__name__} инициализирован")
 
         # Инициализация ConversationManager
         conversation_manager = ConversationManager(
             llm_client=llm_client,
             system_prompt=config.system_prompt,
             storage=storage,
+            background_persistence=config.background_persistence,
+            persist_max_retries=config.persist_max_retries,
+            persist_retry_delay=config.persist_retry_delay,
+            history_token_budget=config.history_token_budget,
+            summary_threshold=config.summary_threshold,
+            summary_keep_recent=config.summary_keep_recent,
+            prompt_cache_size=config.prompt_cache_size,
+            cache_first_turn="first_turn" in config.llm_cache_routes,
+            coalesce_messages=config.coalesce_messages,
+            coalesce_max_messages=config.coalesce_max_messages,
+            router=create_model_router(config, llm_client),
         )
         logger.info("✅ ConversationManager инициализирован")
 
         # Инициализация Telegram бота
         telegram_bot = TelegramBot(
-            token=config.telegram_token, conversation_manager=conversation_manager
+            token=config.telegram_token,
+            conversation_manager=conversation_manager,
+            stream_responses=config.stream_responses,
+            stream_edit_interval=config.stream_edit_interval,
+            turn_timeout=config.turn_timeout,
         )
         logger.info("✅ Telegram бот инициализирован")
 
@@ -79,6 +91,14 @@ async def main() -> None:
     finally:
         if "telegram_bot" in locals():
             await telegram_bot.stop()
+        if "conversation_manager" in locals():
+            await conversation_manager.close()
+        if isinstance(storage, HistoryStorage):
+            storage.close()
+        elif storage is not None:
+            await storage.close()
+        if llm_client is not None:
+            await llm_client.close()
         if engine:
             await engine.dispose()
             logger.info("Соединение с БД закрыто")
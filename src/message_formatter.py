@@ -1,22 +1,82 @@
 """Форматирование сообщений для LLM API"""
 
 import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import islice
 
-from .models import ConversationContext
+from .models import ConversationContext, LLMResponse, UserMessage
+from .token_estimator import MESSAGE_OVERHEAD_TOKENS, TokenEstimator, default_estimator
 
 logger = logging.getLogger(__name__)
 
+SUMMARY_PREFIX = "Краткое содержание предыдущей части диалога:"
+
+PairKey = tuple[datetime, datetime]
+
+
+@dataclass(slots=True)
+class FormattedPair:
+    """Пара (сообщение, ответ) истории в формате OpenAI API с оценкой токенов"""
+
+    key: PairKey
+    user: dict[str, str]
+    assistant: dict[str, str]
+    tokens: int
+
+
+@dataclass
+class FormattedHistory:
+    """Отформатированное окно пар истории пользователя"""
+
+    system_prompt: str
+    pairs: deque[FormattedPair] = field(default_factory=deque)
+
 
 class MessageFormatter:
-    """Форматирование сообщений для LLM API"""
+    """
+    Форматирование сообщений для LLM API
+
+    Отформатированные пары истории кешируются по пользователю (LRU на
+    cache_size пользователей): на каждом ходе к окну добавляется только
+    новая пара, а пары, ушедшие из окна при обрезке или сжатии, снимаются
+    с начала. Готовые словари сообщений переиспользуются между ходами,
+    поэтому вызывающий код не должен их изменять.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 0,
+        token_estimator: TokenEstimator | None = None,
+        cache_size: int = 10000,
+    ):
+        """
+        Инициализация форматтера
+
+        Args:
+            token_budget: Бюджет токенов промпта (0 - история не ограничивается)
+            token_estimator: Оценщик токенов для записей без сохраненной оценки
+            cache_size: Количество пользователей в кеше отформатированной истории
+                (0 - кеш отключен)
+        """
+        self.token_budget = token_budget
+        self.token_estimator = token_estimator or default_estimator
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[int, FormattedHistory] = OrderedDict()
 
-    @staticmethod
     def format_for_llm(
-        context: ConversationContext | None, system_prompt: str
+        self, context: ConversationContext | None, system_prompt: str
     ) -> list[dict[str, str]]:
         """
         Форматировать контекст для LLM API
 
+        С бюджетом токенов в промпт попадают системный промпт, последнее
+        сообщение пользователя и столько самых свежих пар (сообщение, ответ),
+        сколько помещается в оставшийся бюджет.
+
         Args:
             context: Контекст диалога
             system_prompt: Системный промпт по умолчанию
@@ -30,14 +90,130 @@ class MessageFormatter:
 
         messages: list[dict[str, str]] = [{"role": "system", "content": context.system_prompt}]
 
+        # Краткое содержание сжатых ходов заменяет их в промпте
+        if context.summary:
+            messages.append({"role": "system", "content": self._summary_text(context.summary)})
+
+        pairs = min(len(context.messages), len(context.responses))
+        unpaired = len(context.messages) > len(context.responses)
+        formatted = self._formatted_pairs(context, pairs)
+        first_pair = 0
+        if self.token_budget > 0:
+            first_pair = self._first_pair_in_budget(context, formatted, unpaired)
+
         # Чередуем user и assistant сообщения
-        for i in range(min(len(context.messages), len(context.responses))):
-            messages.append({"role": "user", "content": context.messages[i].text})
-            messages.append({"role": "assistant", "content": context.responses[i].content})
+        for pair in islice(formatted, first_pair, None):
+            messages.append(pair.user)
+            messages.append(pair.assistant)
 
         # Если есть непарное сообщение пользователя
-        if len(context.messages) > len(context.responses):
+        if unpaired:
             messages.append({"role": "user", "content": context.messages[-1].text})
 
         logger.debug(f"Отформатировано {len(messages)} сообщений для LLM")
         return messages
+
+    def invalidate(self, user_id: int) -> None:
+        """Сбросить кеш отформатированной истории пользователя (после очистки истории)"""
+        self._cache.pop(user_id, None)
+
+    def _formatted_pairs(self, context: ConversationContext, pairs: int) -> deque[FormattedPair]:
+        """
+        Отформатированные пары контекста: из кеша с дозаполнением новых пар
+
+        Args:
+            context: Контекст диалога
+            pairs: Количество пар (сообщение, ответ) в контексте
+
+        Returns:
+            Пары в порядке контекста
+        """
+        if self.cache_size <= 0:
+            return deque(self._format_pair(context, i) for i in range(pairs))
+
+        history = self._cache.get(context.user_id)
+        if history is None or history.system_prompt != context.system_prompt:
+            history = FormattedHistory(system_prompt=context.system_prompt)
+            self._cache[context.user_id] = history
+        self._cache.move_to_end(context.user_id)
+
+        window = history.pairs
+        if pairs:
+            # Пары, ушедшие из окна истории (обрезка, сжатие), снимаются с начала
+            first_key = self._pair_key(context, 0)
+            while window and window[0].key < first_key:
+                window.popleft()
+
+        cached = len(window)
+        if cached > pairs or (
+            cached
+            and (
+                window[0].key != self._pair_key(context, 0)
+                or window[-1].key != self._pair_key(context, cached - 1)
+            )
+        ):
+            # История изменилась не только добавлением пар - форматируем заново
+            window.clear()
+            cached = 0
+
+        if cached:
+            self.hits += 1
+        else:
+            self.misses += 1
+        for i in range(cached, pairs):
+            window.append(self._format_pair(context, i))
+
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return window
+
+    def _format_pair(self, context: ConversationContext, i: int) -> FormattedPair:
+        """Отформатировать i-ю пару (сообщение, ответ) контекста"""
+        message = context.messages[i]
+        response = context.responses[i]
+        return FormattedPair(
+            key=(message.timestamp, response.timestamp),
+            user={"role": "user", "content": message.text},
+            assistant={"role": "assistant", "content": response.content},
+            tokens=self._tokens(message) + self._tokens(response),
+        )
+
+    @staticmethod
+    def _pair_key(context: ConversationContext, i: int) -> PairKey:
+        """Ключ i-й пары контекста - время сообщения и ответа"""
+        return context.messages[i].timestamp, context.responses[i].timestamp
+
+    def _first_pair_in_budget(
+        self, context: ConversationContext, pairs: deque[FormattedPair], unpaired: bool
+    ) -> int:
+        """Индекс самой старой пары истории, начиная с которой история помещается в бюджет"""
+        used = self.token_estimator.count(context.system_prompt) + MESSAGE_OVERHEAD_TOKENS
+        if context.summary:
+            used += self.token_estimator.count(self._summary_text(context.summary))
+            used += MESSAGE_OVERHEAD_TOKENS
+        if unpaired:
+            used += self._tokens(context.messages[-1])
+
+        first_pair = len(pairs)
+        for pair in reversed(pairs):
+            if used + pair.tokens > self.token_budget:
+                break
+            used += pair.tokens
+            first_pair -= 1
+
+        if first_pair:
+            logger.debug(f"Бюджет {self.token_budget} токенов: отброшено {first_pair} пар истории")
+        return first_pair
+
+    def _tokens(self, record: UserMessage | LLMResponse) -> int:
+        """Токены записи с учетом служебных (сохраненная оценка или вычисленная)"""
+        tokens = record.token_count
+        if not tokens:
+            text = record.text if isinstance(record, UserMessage) else record.content
+            tokens = self.token_estimator.count(text)
+        return tokens + MESSAGE_OVERHEAD_TOKENS
+
+    @staticmethod
+    def _summary_text(summary: str) -> str:
+        """Системное сообщение с кратким содержанием предыдущей части диалога"""
+        return f"{SUMMARY_PREFIX}\n{summary}"
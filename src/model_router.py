@@ -0,0 +1,208 @@
+"""Выбор модели LLM и лимита ответа для хода диалога"""
+
+import logging
+from collections import Counter
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+from .llm_resilience import ModelHealth
+from .token_estimator import TokenEstimator, default_estimator
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True, frozen=True)
+class ModelTier:
+    """
+    Ступень маршрутизации: модель и границы применимости
+
+    Attributes:
+        model: Модель LLM
+        max_dialog_tokens: Максимум токенов диалога (сообщение и история без
+            системного промпта), который обслуживает ступень (0 - без ограничения)
+        max_tokens: Лимит токенов ответа (0 - общий лимит маршрутизатора)
+    """
+
+    model: str
+    max_dialog_tokens: int = 0
+    max_tokens: int = 0
+
+    @classmethod
+    def parse(cls, spec: str) -> "ModelTier":
+        """
+        Разобрать описание ступени "model|max_dialog_tokens|max_tokens"
+
+        Числа можно опустить: "openai/gpt-4o" - ступень без ограничений.
+
+        Args:
+            spec: Описание ступени
+
+        Returns:
+            Ступень маршрутизации
+
+        Raises:
+            ValueError: Если описание некорректно
+        """
+        model, *limits = (part.strip() for part in spec.split("|"))
+        if not model or len(limits) > 2:
+            raise ValueError(
+                f"Ступень должна иметь вид model|max_dialog_tokens|max_tokens: {spec!r}"
+            )
+        try:
+            numbers = [int(limit or 0) for limit in limits]
+        except ValueError as e:
+            raise ValueError(f"Лимиты ступени должны быть целыми числами: {spec!r}") from e
+        if any(n < 0 for n in numbers):
+            raise ValueError(f"Лимиты ступени не могут быть отрицательными: {spec!r}")
+        return cls(model, *numbers)
+
+
+@dataclass(slots=True, frozen=True)
+class Route:
+    """
+    Решение маршрутизатора для хода
+
+    Attributes:
+        model: Выбранная модель
+        max_tokens: Лимит токенов ответа
+        tier: Индекс выбранной ступени
+    """
+
+    model: str
+    max_tokens: int
+    tier: int
+
+
+class ModelRouter:
+    """
+    Маршрутизатор ходов по ступеням моделей от дешевой к дорогой
+
+    Ход получает первую ступень, которая вмещает диалог по токенам и чья
+    модель здорова: не исключена после серии ошибок и укладывается в
+    latency_slo по наблюдаемому p95. Admin-режим начинается со ступени
+    admin_min_tier. Если подходящей ступени нет, используется последняя.
+    Лимит ответа растет с длиной сообщения: короткий вопрос не резервирует
+    тысячу токенов.
+    """
+
+    def __init__(
+        self,
+        tiers: Sequence[ModelTier],
+        health: Mapping[str, ModelHealth],
+        max_tokens: int,
+        admin_min_tier: int = 0,
+        latency_slo: float = 0.0,
+        latency_min_samples: int = 20,
+        response_ratio: float = 0.0,
+        min_response_tokens: int = 256,
+        token_estimator: TokenEstimator | None = None,
+    ) -> None:
+        """
+        Инициализация маршрутизатора
+
+        Args:
+            tiers: Ступени в порядке от дешевой модели к дорогой
+            health: Наблюдаемое состояние моделей (LLMClient.health)
+            max_tokens: Лимит ответа для ступеней без собственного лимита
+            admin_min_tier: Первая ступень для admin-режима
+            latency_slo: Допустимая p95 задержка модели в секундах (0 - не учитывать)
+            latency_min_samples: Минимум измерений задержки для проверки latency_slo
+            response_ratio: Лимит ответа в токенах на токен сообщения (0 - лимит ступени)
+            min_response_tokens: Нижняя граница адаптивного лимита ответа
+            token_estimator: Оценщик токенов сообщений
+
+        Raises:
+            ValueError: Если ступени не заданы или admin_min_tier вне списка
+        """
+        if not tiers:
+            raise ValueError("Маршрутизатору нужна хотя бы одна ступень")
+        if not 0 <= admin_min_tier < len(tiers):
+            raise ValueError(
+                f"admin_min_tier должно быть от 0 до {len(tiers) - 1}, получено: {admin_min_tier}"
+            )
+
+        self.tiers = list(tiers)
+        self.health = health
+        self.max_tokens = max_tokens
+        self.admin_min_tier = admin_min_tier
+        self.latency_slo = latency_slo
+        self.latency_min_samples = latency_min_samples
+        self.response_ratio = response_ratio
+        self.min_response_tokens = min_response_tokens
+        self.token_estimator = token_estimator or default_estimator
+        self.routed: Counter[str] = Counter()
+        self.escalations = 0
+
+        logger.info(
+            "ModelRouter инициализирован: "
+            + " → ".join(f"{t.model} (≤{t.max_dialog_tokens or '∞'})" for t in self.tiers)
+        )
+
+    def route(self, messages: list[dict[str, str]], mode: str = "normal") -> Route:
+        """
+        Выбрать модель и лимит ответа для хода
+
+        Args:
+            messages: Промпт хода в формате LLM (системный промпт, история, сообщение)
+            mode: Режим диалога: normal или admin
+
+        Returns:
+            Решение маршрутизатора
+        """
+        dialog = [m for m in messages if m["role"] != "system"]
+        dialog_tokens = sum(self.token_estimator.count(m["content"]) for m in dialog)
+        message_tokens = self.token_estimator.count(dialog[-1]["content"]) if dialog else 0
+
+        first = self.admin_min_tier if mode == "admin" else 0
+        index = len(self.tiers) - 1
+        for i in range(first, len(self.tiers)):
+            tier = self.tiers[i]
+            if tier.max_dialog_tokens and dialog_tokens > tier.max_dialog_tokens:
+                continue
+            reason = self._unhealthy(tier.model)
+            if reason is None:
+                index = i
+                break
+            # Ступень вмещает диалог, но модель деградировала - идем на следующую
+            self.escalations += 1
+            logger.info(f"Ступень {tier.model} пропущена: {reason}")
+
+        tier = self.tiers[index]
+        route = Route(tier.model, self._max_tokens(tier, message_tokens), index)
+        self.routed[route.model] += 1
+        logger.info(
+            f"Маршрут: {route.model} (ступень {index}, {mode}, диалог {dialog_tokens} токенов, "
+            f"лимит ответа {route.max_tokens})"
+        )
+        return route
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Статистика маршрутизации
+
+        Returns:
+            Количество ходов по моделям и пропусков деградировавших ступеней
+        """
+        return {"routed": dict(self.routed), "escalations": self.escalations}
+
+    def _unhealthy(self, model: str) -> str | None:
+        """Причина, по которой модель сейчас не стоит выбирать (None - модель здорова)"""
+        health = self.health.get(model)
+        if health is None:
+            return None
+        if not health.available:
+            return "модель исключена после серии ошибок"
+        if self.latency_slo > 0:
+            p95 = health.latency_percentile(0.95, self.latency_min_samples)
+            if p95 is not None and p95 > self.latency_slo:
+                return f"p95 {p95:.2f}s больше {self.latency_slo}s"
+        return None
+
+    def _max_tokens(self, tier: ModelTier, message_tokens: int) -> int:
+        """Лимит ответа: пропорционален длине сообщения, не больше лимита ступени"""
+        limit = tier.max_tokens or self.max_tokens
+        if self.response_ratio <= 0:
+            return limit
+        adaptive = max(self.min_response_tokens, round(message_tokens * self.response_ratio))
+        return min(adaptive, limit)
@@ -1,10 +1,15 @@
 """Модели данных для диалогов"""
 
+import sys
 from dataclasses import dataclass, field
 from datetime import datetime
 
+# Модели - слотовые dataclass без __dict__: в памяти живут тысячи контекстов,
+# а строки истории из БД создаются через from_row без повторного вычисления
+# content_length (см. benchmarks/model_footprint.py)
 
-@dataclass
+
+@dataclass(slots=True)
 class UserMessage:
     """Сообщение пользователя"""
 
@@ -14,13 +19,65 @@ class UserMessage:
     content_length: int = field(init=False)
     id: int | None = None
     is_deleted: bool = False
+    token_count: int = 0
 
     def __post_init__(self) -> None:
         """Вычисляем длину контента после инициализации"""
         self.content_length = len(self.text)
 
+    @classmethod
+    def from_row(
+        cls,
+        id: int | None,
+        user_id: int,
+        text: str,
+        timestamp: datetime,
+        content_length: int,
+        is_deleted: bool = False,
+        token_count: int = 0,
+    ) -> "UserMessage":
+        """
+        Создать сообщение из строки БД, минуя __init__ и __post_init__
+
+        Порядок аргументов совпадает с порядком колонок при загрузке истории,
+        поэтому строку можно передать как UserMessage.from_row(*row).
+        """
+        message = object.__new__(cls)
+        message.id = id
+        message.user_id = user_id
+        message.text = text
+        message.timestamp = timestamp
+        message.content_length = content_length
+        message.is_deleted = is_deleted
+        message.token_count = token_count
+        return message
+
+
+@dataclass(slots=True)
+class LLMUsage:
+    """
+    Модель, расход токенов и задержка вызова LLM
+
+    Поля остаются None, если вызова API не было (ответ из кеша или получен
+    объединенным запросом) или провайдер не вернул usage.
+
+    Attributes:
+        model: Модель, выдавшая ответ (с учетом резервных)
+        prompt_tokens: Токены промпта
+        completion_tokens: Токены ответа
+        latency_ms: Время вызова API до полного ответа в миллисекундах
+        first_token_ms: Время до первого токена в миллисекундах
+            (для обычного ответа совпадает с latency_ms)
+    """
+
+    model: str = ""
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    latency_ms: int | None = None
+    first_token_ms: int | None = None
+
 
-@dataclass
+@dataclass(slots=True)
 class LLMResponse:
     """Ответ LLM"""
 
@@ -30,13 +87,70 @@ class LLMResponse:
     content_length: int = field(init=False)
     id: int | None = None
     is_deleted: bool = False
+    token_count: int = 0
+    # Расход и задержка вызова LLM (только для записи в БД, из истории не загружается)
+    usage: LLMUsage | None = None
 
     def __post_init__(self) -> None:
-        """Вычисляем длину контента после инициализации"""
+        """Вычисляем длину контента и интернируем имя модели после инициализации"""
         self.content_length = len(self.content)
+        # Имен моделей единицы, ответов - тысячи: храним одну копию строки
+        self.model_used = sys.intern(self.model_used)
+
+    @classmethod
+    def from_row(
+        cls,
+        id: int | None,
+        content: str,
+        timestamp: datetime,
+        model_used: str,
+        content_length: int,
+        is_deleted: bool = False,
+        token_count: int = 0,
+    ) -> "LLMResponse":
+        """
+        Создать ответ из строки БД, минуя __init__ и __post_init__
+
+        Порядок аргументов совпадает с порядком колонок при загрузке истории,
+        поэтому строку можно передать как LLMResponse.from_row(*row).
+        """
+        response = object.__new__(cls)
+        response.id = id
+        response.content = content
+        response.timestamp = timestamp
+        response.model_used = sys.intern(model_used)
+        response.content_length = content_length
+        response.is_deleted = is_deleted
+        response.token_count = token_count
+        response.usage = None
+        return response
+
+
+@dataclass(slots=True)
+class Compaction:
+    """
+    Результат сжатия истории: новое краткое содержание и граница сжатых записей
+
+    Хранилища в БД сжимают по id последних сжатых записей: время записи в
+    снимке контекста может не совпадать с временем в БД. id записи,
+    поставленной в очередь write-behind, присваивается при сбросе буфера.
+
+    Attributes:
+        summary: Краткое содержание сжатых ходов (включая прежнее)
+        before: Время первого оставляемого сообщения (граница для истории в памяти)
+        turns: Количество сжатых ходов
+        last_message: Последнее сжатое сообщение
+        last_response: Последний сжатый ответ
+    """
+
+    summary: str
+    before: datetime
+    turns: int
+    last_message: UserMessage
+    last_response: LLMResponse
 
 
-@dataclass
+@dataclass(slots=True)
 class ConversationContext:
     """Контекст диалога"""
 
@@ -44,3 +158,4 @@ class ConversationContext:
     messages: list[UserMessage]
     responses: list[LLMResponse]
     system_prompt: str
+    summary: str | None = None
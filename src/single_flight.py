@@ -0,0 +1,75 @@
+"""Объединение одинаковых одновременных запросов (single-flight)"""
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass
+from typing import Generic, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass(eq=False)
+class _Call(Generic[T]):
+    """Выполняющийся запрос и количество ожидающих его вызовов"""
+
+    task: asyncio.Task[T]
+    waiters: int = 0
+
+
+class SingleFlight(Generic[T]):
+    """
+    Объединение одновременных вызовов с одинаковым ключом
+
+    Первый вызов запускает запрос отдельной задачей, последующие вызовы с тем
+    же ключом ждут ее результат (или исключение). Ожидание защищено через
+    asyncio.shield: отмена одного вызова не затрагивает остальных, а запрос
+    отменяется, только когда его перестали ждать все вызовы. После
+    завершения ключ освобождается - результаты не кешируются.
+    """
+
+    def __init__(self) -> None:
+        """Инициализация без выполняющихся запросов"""
+        self.coalesced = 0
+        self._calls: dict[Hashable, _Call[T]] = {}
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        Выполнить запрос или присоединиться к уже выполняющемуся
+
+        Args:
+            key: Канонический ключ запроса
+            factory: Функция, создающая корутину запроса (вызывается только первым)
+
+        Returns:
+            Результат общего запроса
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.coalesced += 1
+            logger.debug(f"Запрос {key!r} присоединен к выполняющемуся")
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Результат больше никому не нужен: новые вызовы начнут запрос заново
+                self._forget(key, call)
+                call.task.cancel()
+
+    def __len__(self) -> int:
+        """Количество выполняющихся запросов"""
+        return len(self._calls)
+
+    def _forget(self, key: Hashable, call: _Call[T]) -> None:
+        """Освободить ключ, если он все еще принадлежит этому запросу"""
+        if self._calls.get(key) is call:
+            del self._calls[key]
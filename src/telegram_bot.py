@@ -1,17 +1,28 @@
 """Telegram бот для работы с пользователями"""
 
+import asyncio
 import logging
+import time
+from collections.abc import AsyncIterator
+from contextlib import aclosing
 
 from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.filters import Command
 from aiogram.types import Message
 
 from .conversation_manager import ConversationManager
+from .deadline import Deadline, DeadlineExceededError
+from .llm_resilience import LLMUnavailableError
 
 logger = logging.getLogger(__name__)
 
 # Константы для ограничений
 MAX_MESSAGE_LENGTH = 4000
+# Максимальная длина сообщения Telegram (длинный потоковый ответ делится на части)
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Попытки окончательной правки потокового ответа при TelegramRetryAfter
+FINAL_EDIT_ATTEMPTS = 3
 
 # Текстовые константы
 WELCOME_TEXT = """👋 Привет! Я LLM-ассистент на основе GPT.
@@ -69,20 +80,42 @@ ERROR_MESSAGE_GENERAL = """❌ Извините, произошла ошибка
 • Повторить попытку позже"""
 
 
+ERROR_MESSAGE_BUSY = """⏳ Сейчас я перегружен и не могу ответить.
+
+Пожалуйста, повторите сообщение через минуту."""
+
+ERROR_MESSAGE_TIMEOUT = """⌛ Не успел подготовить ответ вовремя.
+
+Попробуйте задать вопрос короче или повторите попытку позже."""
+
+
 class TelegramBot:
     """Telegram бот с полной интеграцией LLM"""
 
-    def __init__(self, token: str, conversation_manager: ConversationManager) -> None:
+    def __init__(
+        self,
+        token: str,
+        conversation_manager: ConversationManager,
+        stream_responses: bool = False,
+        stream_edit_interval: float = 1.0,
+        turn_timeout: float = 0.0,
+    ) -> None:
         """
         Инициализация Telegram бота
 
         Args:
             token: Токен бота от BotFather
             conversation_manager: Менеджер диалогов
+            stream_responses: Показывать ответ по мере генерации (редактированием сообщения)
+            stream_edit_interval: Минимальный интервал между редактированиями в секундах
+            turn_timeout: Срок обработки сообщения в секундах (0 - без ограничения)
         """
         self.bot = Bot(token=token)
         self.dp = Dispatcher()
         self.conversation_manager = conversation_manager
+        self.stream_responses = stream_responses
+        self.stream_edit_interval = stream_edit_interval
+        self.turn_timeout = turn_timeout
 
         # Регистрация обработчиков команд
         self.dp.message.register(self.cmd_start, Command("start"))
@@ -199,18 +232,119 @@ class TelegramBot:
 
         logger.info(f"Получено сообщение от user {user_id} (@{username}): {len(text)} символов")
 
+        deadline = Deadline.after(self.turn_timeout) if self.turn_timeout > 0 else None
         try:
+            if self.stream_responses:
+                # aclosing: при ошибке отправки генератор закрывается сразу,
+                # освобождая очередь пользователя и слот планировщика LLM
+                async with aclosing(
+                    self.conversation_manager.process_message_stream(user_id, text, deadline)
+                ) as chunks:
+                    length = await self._stream_reply(message, chunks)
+                logger.info(f"Отправлен потоковый ответ user {user_id}: {length} символов")
+                return
+
             # Обработка сообщения через ConversationManager
-            response = await self.conversation_manager.process_message(user_id, text)
+            response = await self.conversation_manager.process_message(user_id, text, deadline)
+            if response is None:
+                # Сообщение объединено с соседним - ответ отправит обработчик того хода
+                logger.info(f"Сообщение user {user_id} объединено с соседним ходом")
+                return
+            if not response:
+                logger.warning(f"LLM вернул пустой ответ на сообщение user {user_id}")
+                await message.answer(ERROR_MESSAGE_GENERAL)
+                return
 
             # Отправка ответа пользователю
             await message.answer(response)
             logger.info(f"Отправлен ответ user {user_id}: {len(response)} символов")
 
+        except LLMUnavailableError as e:
+            logger.warning(f"LLM недоступен, сообщение user {user_id} отклонено: {e}")
+            await message.answer(ERROR_MESSAGE_BUSY)
+        except DeadlineExceededError as e:
+            logger.warning(f"Сообщение user {user_id} не обработано за {self.turn_timeout}s: {e}")
+            await message.answer(ERROR_MESSAGE_TIMEOUT)
         except Exception as e:
             logger.error(f"Ошибка при обработке сообщения от user {user_id}: {e}")
             await message.answer(ERROR_MESSAGE_GENERAL)
 
+    async def _stream_reply(self, message: Message, chunks: AsyncIterator[str]) -> int:
+        """
+        Отправить потоковый ответ, редактируя сообщение по мере генерации
+
+        Первый фрагмент отправляется сразу, дальнейшие редактирования - не
+        чаще stream_edit_interval (при TelegramRetryAfter - после указанной
+        паузы). Текст сверх TELEGRAM_MESSAGE_LIMIT продолжается новым сообщением.
+        Завершающие правки (заполненного и последнего сообщения) пропустить
+        нельзя, поэтому при TelegramRetryAfter они повторяются после паузы.
+
+        Args:
+            message: Сообщение пользователя
+            chunks: Фрагменты ответа
+
+        Returns:
+            Длина ответа в символах
+        """
+        reply: Message | None = None
+        shown = ""
+        text = ""
+        length = 0
+        next_edit = 0.0
+
+        async for chunk in chunks:
+            text += chunk
+            length += len(chunk)
+
+            while len(text) > TELEGRAM_MESSAGE_LIMIT:
+                # Завершаем заполненное сообщение, остаток - в новое
+                head, text = text[:TELEGRAM_MESSAGE_LIMIT], text[TELEGRAM_MESSAGE_LIMIT:]
+                if reply is None:
+                    await message.answer(head)
+                elif head != shown:
+                    await self._edit_final(reply, head)
+                reply, shown = None, ""
+            if not text:
+                continue
+
+            now = time.monotonic()
+            if reply is None:
+                reply = await message.answer(text)
+                shown, next_edit = text, now + self.stream_edit_interval
+            elif now >= next_edit and text != shown:
+                try:
+                    await reply.edit_text(text)
+                    shown = text
+                    next_edit = now + self.stream_edit_interval
+                except TelegramRetryAfter as e:
+                    next_edit = now + e.retry_after
+
+        if reply is not None and text != shown:
+            await self._edit_final(reply, text)
+        return length
+
+    @staticmethod
+    async def _edit_final(reply: Message, text: str) -> None:
+        """
+        Отредактировать сообщение окончательным текстом, дождавшись лимита Telegram
+
+        Args:
+            reply: Отредактируемое сообщение бота
+            text: Окончательный текст
+
+        Raises:
+            TelegramRetryAfter: Если лимит не снят после FINAL_EDIT_ATTEMPTS попыток
+        """
+        for attempt in range(1, FINAL_EDIT_ATTEMPTS + 1):
+            try:
+                await reply.edit_text(text)
+                return
+            except TelegramRetryAfter as e:
+                if attempt == FINAL_EDIT_ATTEMPTS:
+                    raise
+                logger.warning(f"Лимит Telegram на редактирование, повтор через {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+
     async def start_polling(self) -> None:
         """Запуск бота в режиме polling"""
         logger.info("Запуск polling...")
@@ -0,0 +1,49 @@
+"""Офлайн-оценка количества токенов в тексте"""
+
+import math
+from typing import Protocol
+
+# Служебные токены на одно сообщение в формате chat completions (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class TokenEstimator(Protocol):
+    """Интерфейс оценщика токенов (можно подключить точный токенизатор модели)"""
+
+    def count(self, text: str) -> int:
+        """Оценить количество токенов в тексте"""
+        ...
+
+
+class CharTokenEstimator:
+    """
+    Оценка токенов по количеству символов без обращения к токенизатору
+
+    BPE-токенизаторы кодируют латиницу примерно по 4 символа на токен,
+    а кириллицу и прочие не-ASCII символы - заметно плотнее, поэтому
+    они учитываются отдельно.
+    """
+
+    def __init__(self, ascii_chars_per_token: float = 4.0, other_chars_per_token: float = 2.0):
+        """
+        Инициализация оценщика
+
+        Args:
+            ascii_chars_per_token: Символов ASCII на один токен
+            other_chars_per_token: Прочих символов на один токен
+        """
+        self.ascii_chars_per_token = ascii_chars_per_token
+        self.other_chars_per_token = other_chars_per_token
+
+    def count(self, text: str) -> int:
+        """Оценить количество токенов в тексте"""
+        if not text:
+            return 0
+
+        ascii_chars = sum(1 for ch in text if ch.isascii())
+        other_chars = len(text) - ascii_chars
+        tokens = ascii_chars / self.ascii_chars_per_token + other_chars / self.other_chars_per_token
+        return max(1, math.ceil(tokens))
+
+
+default_estimator = CharTokenEstimator()
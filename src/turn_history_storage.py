@@ -0,0 +1,303 @@
+"""Хранение истории диалогов в модели turns (сообщение и ответ в одной строке)"""
+
+import logging
+from datetime import datetime
+
+from sqlalchemy import and_, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from .database import conversations, turns
+from .db_history_storage import DatabaseHistoryStorage, usage_columns
+from .models import Compaction, ConversationContext, LLMResponse, LLMUsage, UserMessage
+from .token_estimator import TokenEstimator
+
+logger = logging.getLogger(__name__)
+
+
+class TurnHistoryStorage(DatabaseHistoryStorage):
+    """
+    Хранилище истории, где один ход диалога - одна строка таблицы turns
+
+    Сообщение пользователя создает ход, ответ LLM дописывается в ту же строку.
+    Контекст загружается одним range scan по (conversation_id, seq), а пары
+    (сообщение, ответ) совпадают точно: ход без ответа (ошибка LLM) не
+    смещает последующие пары. Поиск диалога, кеш и обрезка окна - общие
+    с DatabaseHistoryStorage; отложенная запись (write-behind) не поддерживается.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        max_history: int = 10,
+        conversation_cache_size: int = 10000,
+        conversation_cache_ttl: float = 3600.0,
+        history_token_budget: int = 0,
+        token_estimator: TokenEstimator | None = None,
+    ) -> None:
+        """
+        Инициализация хранилища
+
+        Args:
+            engine: Асинхронный движок SQLAlchemy
+            max_history: Максимальное количество ходов в истории
+            conversation_cache_size: Размер кеша user_id → conversation_id (0 - отключен)
+            conversation_cache_ttl: Время жизни записи кеша в секундах
+            history_token_budget: Бюджет токенов окна истории (0 - только лимит max_history)
+            token_estimator: Оценщик токенов для новых записей
+        """
+        super().__init__(
+            engine,
+            max_history=max_history,
+            conversation_cache_size=conversation_cache_size,
+            conversation_cache_ttl=conversation_cache_ttl,
+            history_token_budget=history_token_budget,
+            token_estimator=token_estimator,
+        )
+
+    async def add_response(
+        self, user_id: int, content: str, model: str, usage: LLMUsage | None = None
+    ) -> LLMResponse | None:
+        """
+        Записать ответ LLM в последний ход диалога
+
+        Args:
+            user_id: ID пользователя
+            content: Содержимое ответа
+            model: Модель LLM
+            usage: Расход токенов и задержка вызова LLM (None - неизвестны)
+
+        Returns:
+            Записанный ответ (id совпадает с id хода) или None, если нет хода,
+            ожидающего ответа
+        """
+        response = LLMResponse(
+            content=content,
+            timestamp=datetime.now(),
+            model_used=model,
+            token_count=self.token_estimator.count(content),
+            usage=usage,
+        )
+        async with self._transaction(user_id) as conn:
+            row = await self._find_conversation(conn, user_id)
+
+            if not row:
+                logger.warning(f"Попытка добавить ответ для несуществующего user {user_id}")
+                return None
+
+            last_turn = (
+                select(turns.c.id)
+                .where(
+                    and_(
+                        turns.c.conversation_id == row[0],
+                        turns.c.is_deleted == False,  # noqa: E712
+                    )
+                )
+                .order_by(turns.c.seq.desc())
+                .limit(1)
+                .scalar_subquery()
+            )
+            result = await conn.execute(
+                update(turns)
+                .where(and_(turns.c.id == last_turn, turns.c.response.is_(None)))
+                .values(
+                    response=content,
+                    response_content_length=response.content_length,
+                    response_token_count=response.token_count,
+                    response_timestamp=response.timestamp,
+                    model_used=model,
+                    **usage_columns(usage),
+                )
+                .returning(turns.c.id)
+            )
+            turn_id = result.scalar_one_or_none()
+
+        if turn_id is None:
+            logger.warning(f"Нет хода, ожидающего ответа, для user {user_id}")
+            return None
+
+        response.id = turn_id
+        logger.info(f"Добавлен ответ для user {user_id} ({len(content)} символов)")
+        return response
+
+    async def clear(self, user_id: int) -> None:
+        """
+        Очистить историю пользователя (soft delete)
+
+        Args:
+            user_id: ID пользователя
+        """
+        async with self._transaction(user_id) as conn:
+            row = await self._find_conversation(conn, user_id)
+
+            if not row:
+                return
+
+            conversation_id = row[0]
+            self.conversation_cache.invalidate(user_id)
+
+            await conn.execute(
+                update(conversations)
+                .where(conversations.c.id == conversation_id)
+                .values(summary=None)
+            )
+            await conn.execute(
+                update(turns)
+                .where(
+                    and_(
+                        turns.c.conversation_id == conversation_id,
+                        turns.c.is_deleted == False,  # noqa: E712
+                    )
+                )
+                .values(is_deleted=True)
+            )
+
+        logger.info(f"История для user {user_id} очищена (soft delete)")
+
+    async def compact_history(self, user_id: int, compaction: Compaction) -> None:
+        """
+        Заменить ходы до последнего сжатого (по id хода) кратким содержанием
+
+        Args:
+            user_id: ID пользователя
+            compaction: Краткое содержание и последние сжатые записи
+        """
+        last_turn_id = compaction.last_message.id
+        if last_turn_id is None:
+            logger.warning(f"Сжатие истории user {user_id} пропущено: ход не сохранен")
+            return
+
+        async with self._transaction(user_id) as conn:
+            row = await self._find_conversation(conn, user_id)
+
+            if not row:
+                return
+
+            conversation_id = row[0]
+            await conn.execute(
+                update(conversations)
+                .where(conversations.c.id == conversation_id)
+                .values(summary=compaction.summary)
+            )
+            self.conversation_cache.put(user_id, conversation_id, row[1], compaction.summary)
+            await conn.execute(
+                update(turns)
+                .where(
+                    and_(
+                        turns.c.conversation_id == conversation_id,
+                        turns.c.is_deleted == False,  # noqa: E712
+                        turns.c.id <= last_turn_id,
+                    )
+                )
+                .values(is_deleted=True)
+            )
+
+        logger.info(f"История user {user_id} сжата: {compaction.turns} ходов")
+
+    async def _insert_message(
+        self, conn: AsyncConnection, conversation_id: int, user_id: int, text: str
+    ) -> UserMessage:
+        """Начать новый ход диалога и обрезать окно ходов"""
+        message = UserMessage(
+            user_id=user_id,
+            text=text,
+            timestamp=datetime.now(),
+            token_count=self.token_estimator.count(text),
+        )
+        seq = await self._next_seq(conn, conversation_id, conversations.c.turn_seq)
+        result = await conn.execute(
+            insert(turns)
+            .values(
+                conversation_id=conversation_id,
+                user_id=user_id,
+                seq=seq,
+                user_text=text,
+                user_content_length=message.content_length,
+                user_token_count=message.token_count,
+                user_timestamp=message.timestamp,
+                is_deleted=False,
+            )
+            .returning(turns.c.id)
+        )
+        message.id = result.scalar_one()
+        await self._trim_window(conn, turns, conversation_id, seq)
+        return message
+
+    async def _load_context(
+        self,
+        conn: AsyncConnection,
+        conversation_id: int,
+        user_id: int,
+        system_prompt: str,
+        summary: str | None,
+    ) -> ConversationContext:
+        """
+        Загрузить контекст диалога одним запросом по окну ходов
+
+        Ходы без ответа пропускаются, кроме последнего (текущего) хода,
+        поэтому сообщения и ответы контекста образуют точные пары.
+
+        Args:
+            conn: Открытое соединение (транзакция)
+            conversation_id: ID диалога
+            user_id: ID пользователя
+            system_prompt: Системный промпт контекста
+            summary: Краткое содержание сжатых ходов диалога
+
+        Returns:
+            Контекст диалога
+        """
+        result = await conn.execute(
+            self._window_query(
+                turns,
+                conversation_id,
+                conversations.c.turn_seq,
+                turns.c.id,
+                turns.c.user_text,
+                turns.c.user_timestamp,
+                turns.c.user_content_length,
+                turns.c.user_token_count,
+                turns.c.response,
+                turns.c.response_timestamp,
+                turns.c.model_used,
+                turns.c.response_content_length,
+                turns.c.response_token_count,
+                tokens=turns.c.user_token_count + turns.c.response_token_count,
+            )
+        )
+        rows = list(reversed(result.all()))
+
+        messages: list[UserMessage] = []
+        responses: list[LLMResponse] = []
+        for i, row in enumerate(rows):
+            if row[5] is None and i < len(rows) - 1:
+                continue
+
+            messages.append(
+                UserMessage.from_row(
+                    id=row[0],
+                    user_id=user_id,
+                    text=row[1],
+                    timestamp=row[2],
+                    content_length=row[3],
+                    token_count=row[4],
+                )
+            )
+            if row[5] is not None:
+                responses.append(
+                    LLMResponse.from_row(
+                        id=row[0],
+                        content=row[5],
+                        timestamp=row[6],
+                        model_used=row[7],
+                        content_length=row[8],
+                        token_count=row[9],
+                    )
+                )
+
+        return ConversationContext(
+            user_id=user_id,
+            messages=messages,
+            responses=responses,
+            system_prompt=system_prompt,
+            summary=summary,
+        )
@@ -0,0 +1,103 @@
+"""Последовательная обработка ходов диалога одного пользователя"""
+
+import asyncio
+import logging
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(eq=False)
+class _PendingMessage:
+    """Сообщение, ожидающее своего хода"""
+
+    text: str
+    merged: bool = False
+
+
+class UserMailbox:
+    """
+    Почтовый ящик пользователя: ходы одного пользователя выполняются по очереди
+
+    Ходы разных пользователей идут параллельно. В режиме coalesce сообщения,
+    пришедшие пока выполняется ход, объединяются в один следующий запрос к LLM:
+    ход выполняет первый из ожидающих, остальные получают None.
+    """
+
+    def __init__(self, coalesce: bool = False, max_batch: int = 10) -> None:
+        """
+        Инициализация почтового ящика
+
+        Args:
+            coalesce: Объединять сообщения, накопившиеся за время хода
+            max_batch: Максимальное количество сообщений в одном объединенном ходе
+        """
+        self.coalesce = coalesce
+        self.max_batch = max_batch
+        self.merged_messages = 0
+
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._users: dict[int, int] = {}
+        self._waiting: dict[int, list[_PendingMessage]] = {}
+
+    @asynccontextmanager
+    async def exclusive(self, user_id: int) -> AsyncIterator[None]:
+        """Эксклюзивный доступ к диалогу пользователя (очередь FIFO)"""
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        self._users[user_id] = self._users.get(user_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[user_id] -= 1
+            if self._users[user_id] == 0:
+                del self._users[user_id]
+                del self._locks[user_id]
+                if not self._waiting.get(user_id):
+                    self._waiting.pop(user_id, None)
+
+    async def submit(
+        self, user_id: int, text: str, turn: Callable[[str], Awaitable[str]]
+    ) -> str | None:
+        """
+        Выполнить ход диалога в очереди пользователя
+
+        Args:
+            user_id: ID пользователя
+            text: Текст сообщения
+            turn: Корутина хода, принимающая (возможно объединенный) текст
+
+        Returns:
+            Ответ хода или None, если сообщение вошло в ход другого вызова
+        """
+        if not self.coalesce:
+            async with self.exclusive(user_id):
+                return await turn(text)
+
+        pending = _PendingMessage(text)
+        self._waiting.setdefault(user_id, []).append(pending)
+        try:
+            async with self.exclusive(user_id):
+                if pending.merged:
+                    return None
+
+                # Блокировка FIFO: все более ранние сообщения уже обработаны
+                waiting = self._waiting[user_id]
+                batch = waiting[: self.max_batch]
+                del waiting[: len(batch)]
+                for item in batch:
+                    item.merged = True
+
+                if len(batch) > 1:
+                    self.merged_messages += len(batch) - 1
+                    logger.info(f"Объединено {len(batch)} сообщений user {user_id} в один ход")
+
+                return await turn("\n\n".join(item.text for item in batch))
+        finally:
+            # Отмененное до своего хода сообщение не должно попасть в чужой ход
+            if not pending.merged:
+                waiting = self._waiting.get(user_id, [])
+                if pending in waiting:
+                    waiting.remove(pending)
@@ -0,0 +1,185 @@
+"""Буфер отложенной (write-behind) записи истории в БД"""
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+
+from .models import LLMResponse, UserMessage
+
+logger = logging.getLogger(__name__)
+
+# Запись буфера: (user_id, system_prompt, сообщение или ответ)
+PendingWrite = tuple[int, str, UserMessage | LLMResponse]
+
+
+class WriteBehindBuffer:
+    """
+    Асинхронная очередь отложенных вставок с пакетным сбросом
+
+    Записи накапливаются в памяти и сбрасываются пачками при достижении
+    batch_size или по истечении flush_interval. До подтверждения коммита
+    записи остаются видимыми через pending_for(), что позволяет хранилищу
+    читать собственные несброшенные записи (read-your-writes). Пачка, которую
+    фоновый сброс не смог записать max_flush_retries раз подряд, отбрасывается,
+    чтобы не блокировать запись остальных.
+    """
+
+    def __init__(
+        self,
+        flush_callback: Callable[[list[PendingWrite]], Awaitable[None]],
+        batch_size: int = 100,
+        flush_interval: float = 0.05,
+        max_pending: int = 10000,
+        max_flush_retries: int = 5,
+    ) -> None:
+        """
+        Инициализация буфера
+
+        Args:
+            flush_callback: Корутина, записывающая пачку в БД одной транзакцией
+            batch_size: Размер пачки, при котором сброс выполняется сразу
+            flush_interval: Максимальная задержка записи в секундах
+            max_pending: Предел буфера, при достижении add() ждет сброса
+            max_flush_retries: Попыток фонового сброса пачки, после которых она отбрасывается
+        """
+        self.flush_callback = flush_callback
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_flush_retries = max_flush_retries
+        self.flushed_batches = 0
+        self.flushed_records = 0
+        self.dropped_records = 0
+
+        self._pending: list[PendingWrite] = []
+        self._not_empty = asyncio.Event()
+        self._batch_ready = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stop = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self._closed = False
+        self._head_failures = 0
+
+    def __len__(self) -> int:
+        """Количество несброшенных записей"""
+        return len(self._pending)
+
+    async def add(
+        self, user_id: int, system_prompt: str, record: UserMessage | LLMResponse
+    ) -> None:
+        """
+        Поставить запись в очередь на сброс
+
+        Args:
+            user_id: ID пользователя
+            system_prompt: Системный промпт (для создания диалога при сбросе)
+            record: Сообщение пользователя или ответ LLM
+        """
+        if self._closed:
+            raise RuntimeError("WriteBehindBuffer закрыт")
+
+        if len(self._pending) >= self.max_pending:
+            logger.warning(f"Буфер записи переполнен ({len(self._pending)}), синхронный сброс")
+            await self.flush()
+
+        self._pending.append((user_id, system_prompt, record))
+        self._not_empty.set()
+        if len(self._pending) >= self.batch_size:
+            self._batch_ready.set()
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def pending_for(self, user_id: int) -> list[PendingWrite]:
+        """Несброшенные записи пользователя в порядке добавления"""
+        return [item for item in self._pending if item[0] == user_id]
+
+    async def flush(self) -> None:
+        """
+        Сбросить все накопленные записи пачками по batch_size
+
+        Raises:
+            Exception: Ошибка записи в БД (записи остаются в буфере)
+        """
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[: self.batch_size]
+                try:
+                    await self.flush_callback(batch)
+                except Exception:
+                    self._head_failures += 1
+                    raise
+                self._head_failures = 0
+                # Новые записи добавляются только в конец, поэтому пачка - это префикс
+                del self._pending[: len(batch)]
+                self.flushed_batches += 1
+                self.flushed_records += len(batch)
+                logger.debug(f"Сброшена пачка из {len(batch)} записей")
+
+            self._not_empty.clear()
+            self._batch_ready.clear()
+
+    async def close(self) -> None:
+        """
+        Остановить фоновый сброс и дождаться записи всего буфера
+
+        Фоновая задача не отменяется: отмена посреди коммита вернула бы уже
+        записанную пачку в буфер, и финальный сброс записал бы ее повторно.
+        Вместо этого цикл останавливается флагом после текущего сброса.
+        """
+        self._closed = True
+        if self._task is not None:
+            self._stop.set()
+            # Будим цикл, ожидающий записей или заполнения пачки
+            self._not_empty.set()
+            self._batch_ready.set()
+            await self._task
+            self._task = None
+
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Не удалось сбросить {len(self._pending)} записей при остановке: {e}")
+            raise
+
+        logger.info(
+            f"WriteBehindBuffer остановлен: {self.flushed_records} записей "
+            f"в {self.flushed_batches} пачках"
+        )
+
+    async def _run(self) -> None:
+        """Фоновый цикл: сброс по размеру пачки или по таймеру до вызова close()"""
+        while not self._stop.is_set():
+            await self._not_empty.wait()
+            if len(self._pending) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+                except TimeoutError:
+                    pass
+            if self._stop.is_set():
+                break
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка сброса буфера ({len(self._pending)} записей): {e}")
+                if self._head_failures >= self.max_flush_retries:
+                    await self._drop_head_batch()
+                try:
+                    await asyncio.wait_for(self._stop.wait(), self.flush_interval)
+                except TimeoutError:
+                    pass
+
+    async def _drop_head_batch(self) -> None:
+        """Отбросить пачку, которую не удалось записать max_flush_retries раз подряд"""
+        async with self._flush_lock:
+            batch = self._pending[: self.batch_size]
+            del self._pending[: len(batch)]
+            self.dropped_records += len(batch)
+            self._head_failures = 0
+            if not self._pending:
+                self._not_empty.clear()
+        logger.error(
+            f"Пачка из {len(batch)} записей отброшена после "
+            f"{self.max_flush_retries} неудачных попыток сброса"
+        )
@@ -0,0 +1,167 @@
+"""Тесты для Chat API (src/api/main.py)"""
+
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from fastapi import HTTPException, Request
+from fastapi.testclient import TestClient
+
+from src.api import main as api
+from src.api.main import ChatMessageRequest
+from src.conversation_manager import ConversationManager
+from src.deadline import DeadlineExceededError
+from src.llm_resilience import LLMUnavailableError
+
+
+@pytest.fixture
+def mock_llm_client():
+    """Мок LLMClient"""
+    client = AsyncMock()
+    client.model = "test-model"
+    client.ensure_available = Mock()
+    client.get_response = AsyncMock(return_value="Test response")
+    return client
+
+
+@pytest.fixture
+def chat_api(monkeypatch, mock_llm_client):
+    """Chat API с ConversationManager поверх мока LLMClient"""
+    manager = ConversationManager(mock_llm_client, "System prompt")
+    monkeypatch.setattr(api, "normal_conversation_manager", manager)
+    monkeypatch.setattr(api, "text2sql_manager", AsyncMock())
+    monkeypatch.setattr(api, "llm_client", mock_llm_client)
+    monkeypatch.setattr(api, "turn_timeout", 0.0)
+    return manager
+
+
+@pytest.mark.asyncio
+async def test_stream_disconnect_releases_user_turn(chat_api, mock_llm_client):
+    """Тест: клиент перестал читать поток - ход закрыт сразу, следующий ход не ждет GC"""
+    closed = False
+
+    async def stream(messages, **kwargs):
+        nonlocal closed
+        try:
+            while True:
+                yield "x" * 40
+                await asyncio.sleep(0)
+        finally:
+            closed = True
+
+    mock_llm_client.stream_response = stream
+    response = await api.stream_message(ChatMessageRequest(session_id="s1", message="Hi"))
+    events = response.body_iterator
+
+    assert "delta" in await anext(events)
+    await events.aclose()
+
+    # Ход закрыт синхронно с закрытием потока, а не финализатором генератора
+    assert closed
+    assert chat_api.stats()["abandoned"] == 1
+
+    user_id = hash("s1") % (10**9)
+    reply = await asyncio.wait_for(chat_api.process_message(user_id, "Again"), timeout=1)
+    assert reply == "Test response"
+
+
+@pytest.fixture
+def client(chat_api):
+    """TestClient без startup-событий (менеджеры подставлены фикстурой chat_api)"""
+    return TestClient(api.app)
+
+
+def test_send_message(client):
+    """Тест: обычный ход возвращает ответ LLM"""
+    response = client.post("/api/chat/message", json={"session_id": "s1", "message": "Hi"})
+
+    assert response.status_code == 200
+    assert response.json()["response"] == "Test response"
+
+
+@pytest.mark.asyncio
+async def test_send_message_client_disconnect(chat_api, mock_llm_client):
+    """Тест: отключение клиента - 499, запрос к LLM отменен"""
+    started = asyncio.Event()
+    cancelled = False
+
+    async def endless_response(messages, **kwargs):
+        nonlocal cancelled
+        started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+    async def receive():
+        await started.wait()
+        return {"type": "http.disconnect"}
+
+    mock_llm_client.get_response.side_effect = endless_response
+    http_request = Request({"type": "http", "method": "POST", "headers": []}, receive)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await api.send_message(ChatMessageRequest(session_id="s1", message="Hi"), http_request)
+
+    assert exc_info.value.status_code == 499
+    await asyncio.sleep(0)
+    assert cancelled
+    assert chat_api.stats()["abandoned"] == 1
+
+
+def test_send_message_turn_timeout(client, monkeypatch, mock_llm_client):
+    """Тест: ответ не получен за TURN_TIMEOUT - 504"""
+
+    async def slow_response(messages, **kwargs):
+        await asyncio.sleep(10)
+        return "Too late"
+
+    mock_llm_client.get_response.side_effect = slow_response
+    monkeypatch.setattr(api, "turn_timeout", 0.05)
+
+    response = client.post("/api/chat/message", json={"session_id": "s1", "message": "Hi"})
+
+    assert response.status_code == 504
+
+
+def test_send_message_deadline_exceeded(client, chat_api, monkeypatch):
+    """Тест: DeadlineExceededError из хода - 504"""
+    monkeypatch.setattr(
+        chat_api, "process_message", AsyncMock(side_effect=DeadlineExceededError("ответ LLM"))
+    )
+
+    response = client.post("/api/chat/message", json={"session_id": "s1", "message": "Hi"})
+
+    assert response.status_code == 504
+
+
+def test_send_message_shed_when_breaker_open(client, mock_llm_client):
+    """Тест: автомат защиты разомкнут - 503 с Retry-After до начала хода"""
+    mock_llm_client.ensure_available.side_effect = LLMUnavailableError(4.2)
+
+    response = client.post("/api/chat/message", json={"session_id": "s1", "message": "Hi"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+    mock_llm_client.get_response.assert_not_called()
+
+
+def test_send_message_llm_unavailable_during_turn(client, mock_llm_client):
+    """Тест: автомат разомкнулся во время хода - 503"""
+    mock_llm_client.get_response.side_effect = LLMUnavailableError(1.0)
+
+    response = client.post("/api/chat/message", json={"session_id": "s1", "message": "Hi"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_stream_shed_when_breaker_open(client, mock_llm_client):
+    """Тест: потоковый запрос при разомкнутом автомате - 503 без начала потока"""
+    mock_llm_client.ensure_available.side_effect = LLMUnavailableError(3.0)
+
+    response = client.post("/api/chat/stream", json={"session_id": "s1", "message": "Hi"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
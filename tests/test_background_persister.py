@@ -0,0 +1,74 @@
+"""Тесты для модуля background_persister"""
+
+import asyncio
+
+import pytest
+
+from src.background_persister import BackgroundPersister
+
+
+@pytest.mark.asyncio
+async def test_submit_returns_before_write():
+    """Тест: submit не ждет записи, wait_for дожидается ее"""
+    release = asyncio.Event()
+    written: list[str] = []
+
+    async def write(user_id: int, content: str, model: str, usage=None) -> None:
+        await release.wait()
+        written.append(content)
+
+    persister = BackgroundPersister(write)
+    persister.submit(123, "Response", "model")
+    await asyncio.sleep(0)
+
+    assert written == []
+    assert len(persister) == 1
+
+    release.set()
+    await persister.wait_for(123)
+    assert written == ["Response"]
+    assert len(persister) == 0
+
+
+@pytest.mark.asyncio
+async def test_per_user_order_preserved():
+    """Тест: Ответы одного пользователя записываются в порядке поступления"""
+    written: list[tuple[int, str]] = []
+
+    async def write(user_id: int, content: str, model: str, usage=None) -> None:
+        await asyncio.sleep(0.01 if content.endswith("0") else 0)
+        written.append((user_id, content))
+
+    persister = BackgroundPersister(write)
+    for i in range(3):
+        persister.submit(1, f"a{i}", "model")
+        persister.submit(2, f"b{i}", "model")
+    await persister.close()
+
+    assert [c for u, c in written if u == 1] == ["a0", "a1", "a2"]
+    assert [c for u, c in written if u == 2] == ["b0", "b1", "b2"]
+    assert persister.persisted == 6
+
+
+@pytest.mark.asyncio
+async def test_retry_and_give_up():
+    """Тест: Ошибка записи повторяется, после исчерпания попыток запись теряется"""
+    attempts = 0
+
+    async def flaky(user_id: int, content: str, model: str, usage=None) -> None:
+        nonlocal attempts
+        attempts += 1
+        if content == "broken" or attempts == 1:
+            raise RuntimeError("db is down")
+
+    persister = BackgroundPersister(flaky, max_retries=2, retry_delay=0)
+    persister.submit(123, "ok", "model")
+    persister.submit(123, "broken", "model")
+    await persister.close()
+
+    assert persister.persisted == 1
+    assert persister.failed == 1
+    assert persister.retries == 3
+
+    with pytest.raises(RuntimeError):
+        persister.submit(123, "late", "model")
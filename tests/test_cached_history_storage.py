@@ -0,0 +1,122 @@
+"""Тесты для модуля cached_history_storage"""
+
+import pytest
+
+from src.cached_history_storage import CachedHistoryStorage
+from src.db_history_storage import DatabaseHistoryStorage
+from src.turn_history_storage import TurnHistoryStorage
+
+
+@pytest.mark.asyncio
+async def test_read_through_hit(test_db_engine):
+    """Тест: Повторное чтение контекста обслуживается из кеша"""
+    storage = CachedHistoryStorage(DatabaseHistoryStorage(test_db_engine))
+    await storage.add_message_and_get_context(123, "Hello", "System prompt")
+
+    context = await storage.get_context(123)
+
+    assert context is not None
+    assert [m.text for m in context.messages] == ["Hello"]
+    assert storage.hits == 1
+    assert storage.misses == 1
+
+
+@pytest.mark.asyncio
+async def test_write_through_matches_database(test_db_engine):
+    """Тест: Кешированный контекст совпадает с БД после записи и обрезки"""
+    db_storage = DatabaseHistoryStorage(test_db_engine, max_history=3)
+    storage = CachedHistoryStorage(db_storage)
+
+    for i in range(5):
+        await storage.add_message_and_get_context(123, f"Message {i}", "System prompt")
+        await storage.add_response(123, f"Response {i}", "gpt-3.5")
+
+    cached = await storage.get_context(123)
+    stored = await db_storage.get_context(123)
+
+    assert cached is not None and stored is not None
+    assert [m.text for m in cached.messages] == [m.text for m in stored.messages]
+    assert [r.content for r in cached.responses] == [r.content for r in stored.responses]
+    assert [m.text for m in cached.messages] == ["Message 2", "Message 3", "Message 4"]
+
+
+@pytest.mark.asyncio
+async def test_returned_context_is_a_copy(test_db_engine):
+    """Тест: Изменение возвращенного контекста не портит кеш"""
+    storage = CachedHistoryStorage(DatabaseHistoryStorage(test_db_engine))
+    context = await storage.add_message_and_get_context(123, "Hello", "System prompt")
+    context.messages.clear()
+
+    cached = await storage.get_context(123)
+    assert cached is not None
+    assert len(cached.messages) == 1
+
+
+@pytest.mark.asyncio
+async def test_lru_and_memory_eviction(test_db_engine):
+    """Тест: Вытеснение по количеству пользователей и по бюджету памяти"""
+    storage = CachedHistoryStorage(DatabaseHistoryStorage(test_db_engine), max_users=2)
+    for user_id in (1, 2, 3):
+        await storage.add_message_and_get_context(user_id, "Hello", "p")
+
+    assert storage.stats()["users"] == 2
+    assert storage.evictions == 1
+    assert 1 not in storage._contexts
+
+    tiny = CachedHistoryStorage(DatabaseHistoryStorage(test_db_engine), memory_budget=0)
+    context = await tiny.add_message_and_get_context(4, "Hello", "p")
+    assert len(context.messages) == 1
+    assert tiny.stats()["users"] == 0
+    assert tiny.memory_used == 0
+
+
+@pytest.mark.asyncio
+async def test_clear_invalidates_cache(test_db_engine):
+    """Тест: Очистка истории удаляет контекст из кеша"""
+    storage = CachedHistoryStorage(DatabaseHistoryStorage(test_db_engine))
+    await storage.add_message_and_get_context(123, "Hello", "System prompt")
+
+    await storage.clear(123)
+
+    assert storage.stats()["users"] == 0
+    context = await storage.get_context(123)
+    assert context is not None
+    assert context.messages == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("write_behind", [False, True])
+async def test_cache_holds_persisted_records(test_db_engine, write_behind):
+    """Тест: В кеше лежат записанные записи (id и время как в БД)"""
+    db_storage = DatabaseHistoryStorage(test_db_engine, write_behind=write_behind)
+    storage = CachedHistoryStorage(db_storage)
+    await storage.add_message_and_get_context(123, "Hello", "System prompt")
+    await storage.add_message(123, "Again", "System prompt")
+    await storage.add_response(123, "Hi", "gpt-3.5")
+    await db_storage.flush()
+
+    cached = await storage.get_context(123)
+    stored = await db_storage.get_context(123)
+
+    assert cached is not None and stored is not None
+    assert [(m.id, m.timestamp) for m in cached.messages] == [
+        (m.id, m.timestamp) for m in stored.messages
+    ]
+    assert [(r.id, r.timestamp) for r in cached.responses] == [
+        (r.id, r.timestamp) for r in stored.responses
+    ]
+    assert all(m.id is not None for m in cached.messages)
+
+
+@pytest.mark.asyncio
+async def test_skipped_response_not_cached(test_db_engine):
+    """Тест: Ответ, который хранилище не записало, не попадает в кеш"""
+    storage = CachedHistoryStorage(TurnHistoryStorage(test_db_engine))
+    await storage.add_message_and_get_context(123, "Hello", "System prompt")
+    await storage.add_response(123, "Hi", "gpt-3.5")
+    # Второй ответ без нового хода не записывается
+    await storage.add_response(123, "Duplicate", "gpt-3.5")
+
+    cached = await storage.get_context(123)
+    assert cached is not None
+    assert [r.content for r in cached.responses] == ["Hi"]
@@ -51,6 +51,24 @@ def test_config_invalid_temperature(valid_env, monkeypatch):
         Config()
 
 
+def test_config_invalid_history_storage(valid_env, monkeypatch):
+    """Тест: ValueError при неизвестной модели хранения истории"""
+    monkeypatch.setenv("HISTORY_STORAGE", "files")
+
+    with pytest.raises(ValueError, match="HISTORY_STORAGE"):
+        Config()
+
+
+def test_config_llm_cache_routes(valid_env, monkeypatch):
+    """Тест: LLM_CACHE_ROUTES разбирается в множество и проверяется"""
+    monkeypatch.setenv("LLM_CACHE_ROUTES", " First_Turn, text2sql ")
+    assert Config().llm_cache_routes == {"first_turn", "text2sql"}
+
+    monkeypatch.setenv("LLM_CACHE_ROUTES", "first_turn,chat")
+    with pytest.raises(ValueError, match="LLM_CACHE_ROUTES"):
+        Config()
+
+
 def test_config_custom_values(valid_env, monkeypatch):
     """Тест: Config правильно использует кастомные значения"""
     monkeypatch.setenv("DEFAULT_MODEL", "custom/model")
@@ -0,0 +1,59 @@
+"""Тесты для модуля conversation_id_cache"""
+
+from src.conversation_id_cache import ConversationIdCache
+
+
+def test_put_and_get():
+    """Тест: Запись попадает в кеш и считается попаданием"""
+    cache = ConversationIdCache(max_size=10)
+    assert cache.get(123) is None
+
+    cache.put(123, 1, "System prompt")
+
+    assert cache.get(123) == (1, "System prompt", None)
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_summary_is_cached():
+    """Тест: Краткое содержание хранится вместе с диалогом и обновляется повторным put"""
+    cache = ConversationIdCache(max_size=10)
+    cache.put(123, 1, "p", "Summary")
+    assert cache.get(123) == (1, "p", "Summary")
+
+    cache.put(123, 1, "p", "New summary")
+    assert cache.get(123) == (1, "p", "New summary")
+
+
+def test_lru_eviction():
+    """Тест: При переполнении вытесняется давно неиспользуемая запись"""
+    cache = ConversationIdCache(max_size=2)
+    cache.put(1, 10, "p")
+    cache.put(2, 20, "p")
+    cache.get(1)  # 1 становится самым свежим
+    cache.put(3, 30, "p")
+
+    assert cache.get(2) is None
+    assert cache.get(1) == (10, "p", None)
+    assert cache.get(3) == (30, "p", None)
+
+
+def test_ttl_expiration():
+    """Тест: Просроченная запись считается промахом"""
+    cache = ConversationIdCache(max_size=10, ttl=0)
+    cache.put(123, 1, "p")
+
+    assert cache.get(123) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_invalidate_and_disabled_cache():
+    """Тест: Инвалидация и отключенный кеш"""
+    cache = ConversationIdCache(max_size=10)
+    cache.put(123, 1, "p")
+    cache.invalidate(123)
+    assert cache.get(123) is None
+
+    disabled = ConversationIdCache(max_size=0)
+    disabled.put(123, 1, "p")
+    assert disabled.get(123) is None
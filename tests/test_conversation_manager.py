@@ -1,10 +1,16 @@
 """Тесты для модуля conversation_manager"""
 
-from unittest.mock import AsyncMock
+import asyncio
+from unittest.mock import AsyncMock, Mock
 
 import pytest
 
+from src.cached_history_storage import CachedHistoryStorage
 from src.conversation_manager import ConversationManager
+from src.db_history_storage import DatabaseHistoryStorage
+from src.deadline import Deadline, DeadlineExceededError
+from src.llm_resilience import LLMUnavailableError
+from src.model_router import ModelRouter, ModelTier
 
 
 @pytest.fixture
@@ -12,6 +18,7 @@ def mock_llm_client():
     """Мок LLMClient"""
     client = AsyncMock()
     client.model = "test-model"
+    client.ensure_available = Mock()
     client.get_response = AsyncMock(return_value="Test response")
     return client
 
@@ -33,6 +40,15 @@ async def test_process_message(mock_llm_client):
     assert len(context.responses) == 1
 
 
+@pytest.mark.asyncio
+async def test_empty_llm_reply_is_not_merged(mock_llm_client):
+    """Тест: Пустой ответ LLM возвращается строкой, None - только для объединенных сообщений"""
+    mock_llm_client.get_response.return_value = ""
+    manager = ConversationManager(mock_llm_client, "System prompt")
+
+    assert await manager.process_message(123, "Hello") == ""
+
+
 @pytest.mark.asyncio
 async def test_process_multiple_messages(mock_llm_client):
     """Тест: Обработка нескольких сообщений"""
@@ -51,12 +67,15 @@ async def test_process_multiple_messages(mock_llm_client):
 async def test_clear_history(mock_llm_client):
     """Тест: Очистка истории"""
     manager = ConversationManager(mock_llm_client, "System prompt")
-    manager.storage.add_message(123, "Hello", "System prompt")
+    await manager.process_message(123, "Hello")
+    await manager.process_message(123, "Again")
 
     assert manager.storage.get_context(123) is not None
+    assert 123 in manager.formatter._cache
 
     await manager.clear_history(123)
     assert manager.storage.get_context(123) is None
+    assert 123 not in manager.formatter._cache
 
 
 class TestGetRoleDescription:
@@ -95,3 +114,304 @@ class TestGetRoleDescription:
         # Assert
         assert "Python Code Reviewer Expert" in description
         assert "🤖" in description  # Emoji должно быть в форматировании
+
+
+@pytest.mark.asyncio
+async def test_process_message_with_database_storage(mock_llm_client, test_db_engine):
+    """Тест: Ход диалога с DatabaseHistoryStorage использует единый unit-of-work"""
+    storage = DatabaseHistoryStorage(test_db_engine)
+    manager = ConversationManager(mock_llm_client, "System prompt", storage=storage)
+
+    await manager.process_message(123, "First")
+    await manager.process_message(123, "Second")
+
+    # LLM получает всю историю: system + user + assistant + user
+    messages = mock_llm_client.get_response.call_args[0][0]
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+    assert messages[-1]["content"] == "Second"
+
+    context = await storage.get_context(123)
+    assert context is not None
+    assert len(context.messages) == 2
+    assert len(context.responses) == 2
+
+
+@pytest.mark.asyncio
+async def test_background_persistence_keeps_turn_order(mock_llm_client, test_db_engine):
+    """Тест: Фоновое сохранение ответа не теряет его в следующем ходе"""
+    storage = DatabaseHistoryStorage(test_db_engine)
+    manager = ConversationManager(
+        mock_llm_client, "System prompt", storage=storage, background_persistence=True
+    )
+
+    await manager.process_message(123, "First")
+    await manager.process_message(123, "Second")
+
+    messages = mock_llm_client.get_response.call_args[0][0]
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+
+    await manager.close()
+    context = await storage.get_context(123)
+    assert context is not None
+    assert len(context.responses) == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_messages_are_serialized(mock_llm_client):
+    """Тест: Ходы одного пользователя не пересекаются"""
+    active = 0
+    max_active = 0
+
+    async def slow_response(messages, cache=None, **kwargs):
+        nonlocal active, max_active
+        active += 1
+        max_active = max(max_active, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return "Test response"
+
+    mock_llm_client.get_response.side_effect = slow_response
+    manager = ConversationManager(mock_llm_client, "System prompt")
+
+    await asyncio.gather(*(manager.process_message(123, f"Message {i}") for i in range(3)))
+
+    assert max_active == 1
+    context = manager.storage.get_context(123)
+    assert context is not None
+    assert [m.text for m in context.messages] == ["Message 0", "Message 1", "Message 2"]
+
+
+@pytest.mark.asyncio
+async def test_burst_messages_are_coalesced(mock_llm_client):
+    """Тест: Сообщения, пришедшие во время хода, уходят в LLM одним запросом"""
+    release = asyncio.Event()
+
+    async def blocked_response(messages, cache=None, **kwargs):
+        await release.wait()
+        return "Test response"
+
+    mock_llm_client.get_response.side_effect = blocked_response
+    manager = ConversationManager(mock_llm_client, "System prompt", coalesce_messages=True)
+
+    first = asyncio.create_task(manager.process_message(123, "First"))
+    await asyncio.sleep(0)
+    burst = [asyncio.create_task(manager.process_message(123, t)) for t in ("Second", "Third")]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(first, *burst)
+
+    assert results == ["Test response", "Test response", None]
+    assert mock_llm_client.get_response.call_count == 2
+    context = manager.storage.get_context(123)
+    assert context is not None
+    assert [m.text for m in context.messages] == ["First", "Second\n\nThird"]
+
+
+@pytest.mark.asyncio
+async def test_history_compaction(mock_llm_client):
+    """Тест: Старые ходы сжимаются в краткое содержание, которое попадает в промпт"""
+    manager = ConversationManager(
+        mock_llm_client, "System prompt", summary_threshold=3, summary_keep_recent=1
+    )
+
+    for i in range(3):
+        await manager.process_message(123, f"Message {i}")
+    await asyncio.gather(*manager._compactions.values())
+
+    context = manager.storage.get_context(123)
+    assert context is not None
+    assert context.summary == "Test response"
+    assert [m.text for m in context.messages] == ["Message 2"]
+
+    await manager.process_message(123, "Message 3")
+    messages = mock_llm_client.get_response.call_args[0][0]
+    assert messages[1]["role"] == "system"
+    assert "Test response" in messages[1]["content"]
+    assert [m["content"] for m in messages[2:]] == ["Message 2", "Test response", "Message 3"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("write_behind", [False, True])
+async def test_history_compaction_with_cache(mock_llm_client, test_db_engine, write_behind):
+    """Тест: Сжатие через кеш контекстов удаляет в БД ровно сжатые ходы"""
+    mock_llm_client.get_response = AsyncMock(side_effect=[f"Answer {i}" for i in range(4)])
+    db_storage = DatabaseHistoryStorage(test_db_engine, write_behind=write_behind)
+    manager = ConversationManager(
+        mock_llm_client,
+        "System prompt",
+        storage=CachedHistoryStorage(db_storage),
+        summary_threshold=3,
+        summary_keep_recent=1,
+    )
+
+    for i in range(3):
+        await manager.process_message(123, f"Message {i}")
+    await asyncio.gather(*manager._compactions.values())
+
+    context = await db_storage.get_context(123)
+    assert context is not None
+    assert context.summary == "Answer 3"
+    assert [m.text for m in context.messages] == ["Message 2"]
+    assert [r.content for r in context.responses] == ["Answer 2"]
+
+
+@pytest.mark.asyncio
+async def test_process_message_stream(mock_llm_client):
+    """Тест: Потоковый ход отдает фрагменты и сохраняет собранный ответ"""
+
+    async def stream(messages, **kwargs):
+        for delta in ["Hel", "lo"]:
+            yield delta
+
+    mock_llm_client.stream_response = stream
+    manager = ConversationManager(mock_llm_client, "System prompt")
+
+    deltas = [delta async for delta in manager.process_message_stream(123, "Hi")]
+
+    assert deltas == ["Hel", "lo"]
+    context = manager.storage.get_context(123)
+    assert context is not None
+    assert [r.content for r in context.responses] == ["Hello"]
+
+
+@pytest.mark.asyncio
+async def test_process_message_stream_aborted(mock_llm_client):
+    """Тест: Прерванный поток не сохраняет ответ и освобождает очередь пользователя"""
+
+    async def stream(messages, **kwargs):
+        yield "partial"
+        raise RuntimeError("connection lost")
+
+    mock_llm_client.stream_response = stream
+    manager = ConversationManager(mock_llm_client, "System prompt")
+
+    with pytest.raises(RuntimeError):
+        async for _ in manager.process_message_stream(123, "Hi"):
+            pass
+
+    context = manager.storage.get_context(123)
+    assert context is not None
+    assert context.responses == []
+    assert await manager.process_message(123, "Again") == "Test response"
+
+
+@pytest.mark.asyncio
+async def test_cache_first_turn(mock_llm_client):
+    """Тест: Кеш ответов разрешается только для первого хода без истории"""
+    manager = ConversationManager(mock_llm_client, "System prompt", cache_first_turn=True)
+
+    await manager.process_message(123, "Hello")
+    assert mock_llm_client.get_response.call_args.kwargs["cache"] is True
+
+    await manager.process_message(123, "Again")
+    assert mock_llm_client.get_response.call_args.kwargs["cache"] is None
+
+
+@pytest.mark.asyncio
+async def test_router_picks_model_per_turn(mock_llm_client):
+    """Тест: маршрутизатор выбирает модель и лимит ответа для каждого хода"""
+    router = ModelRouter(
+        [ModelTier("cheap", max_dialog_tokens=10, max_tokens=50), ModelTier("large")],
+        {},
+        max_tokens=1000,
+    )
+    manager = ConversationManager(mock_llm_client, "System prompt", router=router)
+
+    await manager.process_message(123, "hi")
+    await manager.process_message(123, "x" * 400)
+
+    calls = mock_llm_client.get_response.call_args_list
+    assert [(c.kwargs["model"], c.kwargs["max_tokens"]) for c in calls] == [
+        ("cheap", 50),
+        ("large", 1000),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_unavailable_llm_sheds_turn_before_storage(mock_llm_client):
+    """Тест: при разомкнутом автомате ход отклоняется до записи сообщения"""
+    mock_llm_client.ensure_available.side_effect = LLMUnavailableError(5.0)
+    manager = ConversationManager(mock_llm_client, "System prompt")
+
+    with pytest.raises(LLMUnavailableError):
+        await manager.process_message(123, "Hello")
+
+    assert manager.storage.get_context(123) is None
+    mock_llm_client.get_response.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_deadline_expired_in_queue(mock_llm_client):
+    """Тест: ход, срок которого истек в очереди пользователя, не пишет сообщение и не зовет LLM"""
+    release = asyncio.Event()
+
+    async def blocked_response(messages, **kwargs):
+        await release.wait()
+        return "Test response"
+
+    mock_llm_client.get_response.side_effect = blocked_response
+    manager = ConversationManager(mock_llm_client, "System prompt")
+
+    first = asyncio.create_task(manager.process_message(123, "First"))
+    await asyncio.sleep(0)
+    with pytest.raises(DeadlineExceededError):
+        await manager.process_message(123, "Late", deadline=Deadline.after(0.01))
+    release.set()
+    await first
+
+    context = manager.storage.get_context(123)
+    assert context is not None
+    assert [m.text for m in context.messages] == ["First"]
+    assert mock_llm_client.get_response.call_count == 1
+    assert manager.stats()["expired"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_turn_is_counted(mock_llm_client):
+    """Тест: отмена вызова (клиент ушел) прерывает запрос к LLM и учитывается в статистике"""
+    started = asyncio.Event()
+
+    async def hang(messages, **kwargs):
+        started.set()
+        await asyncio.sleep(10)
+
+    mock_llm_client.get_response.side_effect = hang
+    manager = ConversationManager(mock_llm_client, "System prompt")
+
+    task = asyncio.create_task(manager.process_message(123, "Hello"))
+    await started.wait()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert manager.stats()["abandoned"] == 1
+    context = manager.storage.get_context(123)
+    assert context is not None
+    assert context.responses == []
+
+
+@pytest.mark.asyncio
+async def test_abandoned_stream_counts_wasted_tokens(mock_llm_client):
+    """Тест: прерванный поток закрывает запрос к LLM и учитывает сгенерированные токены"""
+    closed = False
+
+    async def stream(messages, **kwargs):
+        nonlocal closed
+        try:
+            yield "x" * 40
+            yield "y" * 40
+        finally:
+            closed = True
+
+    mock_llm_client.stream_response = stream
+    manager = ConversationManager(mock_llm_client, "System prompt")
+
+    chunks = manager.process_message_stream(123, "Hi")
+    assert await anext(chunks) == "x" * 40
+    await chunks.aclose()
+
+    assert closed
+    stats = manager.stats()
+    assert stats["abandoned"] == 1
+    assert stats["wasted_tokens"] == manager.storage.token_estimator.count("x" * 40)
+    assert await manager.process_message(123, "Again") == "Test response"
@@ -1,8 +1,24 @@
 """Тесты для модуля db_history_storage"""
 
 import pytest
+from sqlalchemy import event, select
 
+from src.database import conversations, llm_responses, user_messages
 from src.db_history_storage import DatabaseHistoryStorage
+from src.deadline import Deadline, DeadlineExceededError
+from src.message_formatter import MessageFormatter
+from src.models import Compaction, ConversationContext, LLMUsage
+
+
+def compaction(context: ConversationContext, summary: str, turns: int) -> Compaction:
+    """Сжатие первых turns ходов контекста"""
+    return Compaction(
+        summary=summary,
+        before=context.messages[turns].timestamp,
+        turns=turns,
+        last_message=context.messages[turns - 1],
+        last_response=context.responses[turns - 1],
+    )
 
 
 @pytest.mark.asyncio
@@ -128,3 +144,288 @@ async def test_multiple_users(test_db_engine):
     assert len(context_456.messages) == 1
     assert context_123.messages[0].text == "User 123 message"
     assert context_456.messages[0].text == "User 456 message"
+
+
+@pytest.mark.asyncio
+async def test_add_message_and_get_context(test_db_engine):
+    """Тест: Добавление сообщения и загрузка контекста за одну транзакцию"""
+    storage = DatabaseHistoryStorage(test_db_engine, max_history=2)
+    await storage.add_message(123, "First", "Stored prompt")
+    await storage.add_response(123, "Answer", "gpt-3.5")
+    await storage.add_message(123, "Second", "Stored prompt")
+
+    context = await storage.add_message_and_get_context(123, "Third", "Other prompt")
+
+    # Используется системный промпт существующего диалога
+    assert context.system_prompt == "Stored prompt"
+    # История обрезана до max_history в той же транзакции; ответ на выпавшее
+    # из окна сообщение не попадает в контекст
+    assert [m.text for m in context.messages] == ["Second", "Third"]
+    assert context.responses == []
+
+
+@pytest.mark.asyncio
+async def test_add_message_and_get_context_new_user(test_db_engine):
+    """Тест: Ход диалога для нового пользователя создает контекст"""
+    storage = DatabaseHistoryStorage(test_db_engine)
+
+    context = await storage.add_message_and_get_context(555, "Hello", "System prompt")
+
+    assert context.user_id == 555
+    assert context.system_prompt == "System prompt"
+    assert len(context.messages) == 1
+    assert context.messages[0].text == "Hello"
+    assert context.responses == []
+
+
+@pytest.mark.asyncio
+async def test_conversation_id_cache(test_db_engine):
+    """Тест: Поиск диалога обслуживается кешем, clear инвалидирует запись"""
+    storage = DatabaseHistoryStorage(test_db_engine)
+
+    await storage.add_message(123, "First", "System prompt")
+    await storage.add_response(123, "Answer", "gpt-3.5")
+    await storage.add_message(123, "Second", "System prompt")
+
+    # Диалог закеширован при создании, дальнейшие операции - попадания
+    assert storage.conversation_cache.hits == 2
+
+    await storage.clear(123)
+    assert storage.conversation_cache.stats()["size"] == 0
+
+    context = await storage.get_context(123)
+    assert context is not None
+    assert context.messages == []
+
+
+@pytest.mark.asyncio
+async def test_trim_by_sequence_number(test_db_engine):
+    """Тест: Обрезка помечает удаленной только запись, выпавшую из окна seq"""
+    storage = DatabaseHistoryStorage(test_db_engine, max_history=2)
+    for i in range(4):
+        await storage.add_message(123, f"Message {i}", "System prompt")
+
+    async with test_db_engine.begin() as conn:
+        rows = (
+            await conn.execute(
+                select(user_messages.c.seq, user_messages.c.is_deleted).order_by(
+                    user_messages.c.seq
+                )
+            )
+        ).all()
+        head = (await conn.execute(select(conversations.c.message_seq))).scalar_one()
+
+    assert head == 4
+    assert [tuple(row) for row in rows] == [(1, True), (2, True), (3, False), (4, False)]
+
+
+@pytest.mark.asyncio
+async def test_context_window_follows_head(test_db_engine):
+    """Тест: Чтение ограничено окном seq > head - max_history"""
+    storage = DatabaseHistoryStorage(test_db_engine, max_history=5)
+    for i in range(4):
+        await storage.add_message(123, f"Message {i}", "System prompt")
+
+    # Уменьшение max_history сразу сужает окно без сканирования истории
+    storage.max_history = 2
+    context = await storage.get_context(123)
+    assert context is not None
+    assert [m.text for m in context.messages] == ["Message 2", "Message 3"]
+
+
+@pytest.mark.asyncio
+async def test_write_behind_read_your_writes(test_db_engine):
+    """Тест: В write-behind режиме контекст видит несброшенные записи"""
+    storage = DatabaseHistoryStorage(
+        test_db_engine, max_history=3, write_behind=True, write_flush_interval=60
+    )
+
+    context = await storage.add_message_and_get_context(123, "Hello", "System prompt")
+    await storage.add_response(123, "Hi", "gpt-3.5")
+
+    assert [m.text for m in context.messages] == ["Hello"]
+    assert storage.write_behind is not None
+    assert len(storage.write_behind) == 2
+
+    context = await storage.get_context(123)
+    assert context is not None
+    assert [r.content for r in context.responses] == ["Hi"]
+
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_write_behind_batch_flush_and_trim(test_db_engine):
+    """Тест: Пачка записывается с корректными seq и обрезкой окна"""
+    storage = DatabaseHistoryStorage(
+        test_db_engine, max_history=3, write_behind=True, write_flush_interval=60
+    )
+    for i in range(5):
+        await storage.add_message(123, f"Message {i}", "System prompt")
+        await storage.add_response(123, f"Response {i}", "gpt-3.5")
+    await storage.add_message(456, "Other user", "System prompt")
+
+    # Drain при остановке
+    await storage.close()
+
+    async with test_db_engine.begin() as conn:
+        rows = (
+            await conn.execute(
+                select(user_messages.c.text, user_messages.c.seq, user_messages.c.is_deleted)
+                .where(user_messages.c.user_id == 123)
+                .order_by(user_messages.c.seq)
+            )
+        ).all()
+    assert [row[1] for row in rows] == [1, 2, 3, 4, 5]
+    assert [row[2] for row in rows] == [True, True, False, False, False]
+
+    plain = DatabaseHistoryStorage(test_db_engine, max_history=3)
+    context = await plain.get_context(123)
+    assert context is not None
+    assert [m.text for m in context.messages] == ["Message 2", "Message 3", "Message 4"]
+    assert [r.content for r in context.responses] == ["Response 2", "Response 3", "Response 4"]
+    assert await plain.get_context(456) is not None
+
+
+@pytest.mark.asyncio
+async def test_write_behind_clear_flushes_first(test_db_engine):
+    """Тест: clear сбрасывает буфер перед soft delete"""
+    storage = DatabaseHistoryStorage(test_db_engine, write_behind=True, write_flush_interval=60)
+    await storage.add_message(123, "Hello", "System prompt")
+
+    await storage.clear(123)
+
+    context = await storage.get_context(123)
+    assert context is not None
+    assert context.messages == []
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_token_counts_persisted_and_budget_window(test_db_engine):
+    """Тест: token_count сохраняется, а окно по бюджету читает только нужные записи"""
+    storage = DatabaseHistoryStorage(test_db_engine, max_history=10, history_token_budget=25)
+    for _ in range(5):
+        await storage.add_message(123, "x" * 40, "System prompt")  # 10 токенов
+
+    async with test_db_engine.connect() as conn:
+        counts = (await conn.execute(select(user_messages.c.token_count))).scalars().all()
+    assert counts == [10] * 5
+
+    # 10 + 10 < 25, третья запись пересекает бюджет и еще возвращается, дальше - нет
+    context = await storage.get_context(123)
+    assert context is not None
+    assert len(context.messages) == 3
+    assert all(m.token_count == 10 for m in context.messages)
+
+
+@pytest.mark.asyncio
+async def test_budget_window_keeps_pairs_aligned(test_db_engine):
+    """Тест: Короткие сообщения и длинные ответы - окна начинаются с одного хода"""
+    storage = DatabaseHistoryStorage(test_db_engine, max_history=10, history_token_budget=300)
+    for i in range(6):
+        await storage.add_message(123, f"q{i}", "System prompt")
+        await storage.add_response(123, f"a{i} " + "x" * 400, "gpt-3.5")
+    context = await storage.add_message_and_get_context(123, "q6", "System prompt")
+
+    # Бюджет отсекает больше ответов, чем сообщений: окна выровнены по ответам
+    assert [r.content[:2] for r in context.responses] == ["a3", "a4", "a5"]
+    assert [m.text for m in context.messages] == ["q3", "q4", "q5", "q6"]
+
+    formatted = MessageFormatter(token_budget=300).format_for_llm(context, "System prompt")
+    contents = [m["content"][:2] for m in formatted[1:]]
+    assert contents[-1] == "q6"
+    for question, answer in zip(contents[:-1:2], contents[1:-1:2], strict=True):
+        assert answer == "a" + question[1]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("write_behind", [False, True])
+async def test_usage_persisted(test_db_engine, write_behind):
+    """Тест: Расход токенов и задержка сохраняются, без usage - NULL"""
+    storage = DatabaseHistoryStorage(
+        test_db_engine, write_behind=write_behind, write_flush_interval=60
+    )
+    usage = LLMUsage("gpt-4", prompt_tokens=120, completion_tokens=30, latency_ms=850)
+    usage.first_token_ms = 200
+    await storage.add_message(123, "Hello", "System prompt")
+    await storage.add_response(123, "Hi there", "gpt-4", usage)
+    await storage.add_message(123, "Again", "System prompt")
+    await storage.add_response(123, "Cached", "gpt-4")
+    await storage.close()
+
+    columns = (
+        llm_responses.c.prompt_tokens,
+        llm_responses.c.completion_tokens,
+        llm_responses.c.latency_ms,
+        llm_responses.c.first_token_ms,
+    )
+    async with test_db_engine.connect() as conn:
+        rows = (await conn.execute(select(*columns).order_by(llm_responses.c.seq))).all()
+    assert rows == [(120, 30, 850, 200), (None, None, None, None)]
+
+
+@pytest.mark.asyncio
+async def test_compact_history(test_db_engine):
+    """Тест: Сжатие сохраняет краткое содержание и убирает старые записи, очистка - сбрасывает"""
+    storage = DatabaseHistoryStorage(test_db_engine)
+    for i in range(3):
+        await storage.add_message(123, f"Message {i}", "System prompt")
+        await storage.add_response(123, f"Response {i}", "gpt-3.5")
+
+    context = await storage.get_context(123)
+    assert context is not None
+    await storage.compact_history(123, compaction(context, "Summary", turns=2))
+
+    context = await storage.get_context(123)
+    assert context is not None
+    assert context.summary == "Summary"
+    assert [m.text for m in context.messages] == ["Message 2"]
+    assert [r.content for r in context.responses] == ["Response 2"]
+
+    await storage.clear(123)
+    context = await storage.get_context(123)
+    assert context is not None
+    assert context.summary is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("cache_size", [10000, 0])
+async def test_summary_loaded_without_extra_select(test_db_engine, cache_size):
+    """Тест: Краткое содержание приходит с поиском диалога, без отдельного запроса"""
+    storage = DatabaseHistoryStorage(test_db_engine, conversation_cache_size=cache_size)
+    for i in range(2):
+        await storage.add_message(123, f"Message {i}", "System prompt")
+        await storage.add_response(123, f"Response {i}", "gpt-3.5")
+    context = await storage.get_context(123)
+    assert context is not None
+    await storage.compact_history(123, compaction(context, "Summary", turns=1))
+
+    statements: list[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(test_db_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        context = await storage.get_context(123)
+    finally:
+        event.remove(test_db_engine.sync_engine, "before_cursor_execute", record)
+
+    assert context is not None
+    assert context.summary == "Summary"
+    # Окна сообщений и ответов плюс поиск диалога при отключенном кеше
+    assert len(statements) == (2 if cache_size else 3)
+
+
+@pytest.mark.asyncio
+async def test_expired_deadline_skips_message_write(test_db_engine):
+    """Тест: сообщение хода с истекшим сроком не записывается и не занимает соединение"""
+    storage = DatabaseHistoryStorage(test_db_engine)
+
+    with pytest.raises(DeadlineExceededError):
+        await storage.add_message_and_get_context(123, "Hello", "Prompt", Deadline.after(-1))
+
+    assert await storage.get_context(123) is None
+    context = await storage.add_message_and_get_context(123, "Hello", "Prompt", Deadline.after(10))
+    assert [m.text for m in context.messages] == ["Hello"]
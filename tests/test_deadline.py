@@ -0,0 +1,87 @@
+"""Тесты для модуля deadline"""
+
+import asyncio
+
+import pytest
+
+from src.deadline import Deadline, DeadlineExceededError, deadline_scope, iterate_within
+
+
+def test_deadline_check():
+    """Тест: истекший срок не дает начать этап"""
+    deadline = Deadline.after(10)
+    assert not deadline.expired
+    assert 9 < deadline.remaining() <= 10
+    deadline.check("запись")
+
+    expired = Deadline.after(-1)
+    assert expired.expired
+    assert expired.remaining() == 0
+    with pytest.raises(DeadlineExceededError) as exc_info:
+        expired.check("запись")
+    assert exc_info.value.stage == "запись"
+
+
+@pytest.mark.asyncio
+async def test_scope_cancels_work():
+    """Тест: работа внутри блока отменяется в момент истечения срока"""
+    cancelled = False
+
+    async def work() -> None:
+        nonlocal cancelled
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+    with pytest.raises(DeadlineExceededError) as exc_info:
+        async with Deadline.after(0.01).scope("ответ LLM"):
+            await work()
+
+    assert cancelled
+    assert exc_info.value.stage == "ответ LLM"
+
+
+@pytest.mark.asyncio
+async def test_nested_scopes_and_foreign_timeouts():
+    """Тест: вложенный этап сохраняет свое название, чужой таймаут не подменяется"""
+    deadline = Deadline.after(0.01)
+    with pytest.raises(DeadlineExceededError) as exc_info:
+        async with deadline.scope("ход"), deadline.scope("запись"):
+            await asyncio.sleep(10)
+    assert exc_info.value.stage in ("ход", "запись")
+
+    with pytest.raises(TimeoutError) as timeout_info:
+        async with deadline_scope(Deadline.after(10), "ход"):
+            raise TimeoutError("таймаут пула")
+    assert not isinstance(timeout_info.value, DeadlineExceededError)
+
+    async with deadline_scope(None, "ход"):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_iterate_within():
+    """Тест: срок ограничивает ожидание очередного элемента потока"""
+
+    async def stalled():
+        yield "first"
+        await asyncio.sleep(10)
+        yield "never"
+
+    received = []
+    with pytest.raises(DeadlineExceededError):
+        async for item in iterate_within(Deadline.after(0.05), stalled(), "поток"):
+            received.append(item)
+    assert received == ["first"]
+
+    async def finite():
+        for item in ("a", "b"):
+            yield item
+
+    assert [item async for item in iterate_within(None, finite(), "поток")] == ["a", "b"]
+    assert [item async for item in iterate_within(Deadline.after(10), finite(), "поток")] == [
+        "a",
+        "b",
+    ]
@@ -0,0 +1,80 @@
+"""Тесты для fake LLM сервера"""
+
+import random
+
+import httpx
+import pytest
+
+from src.fake_llm_server import FakeLLMSettings, create_app
+from src.llm_client import LLMClient
+from src.models import LLMUsage
+
+
+def _client(settings: FakeLLMSettings) -> LLMClient:
+    """LLMClient, подключенный к fake серверу без сети (ASGI транспорт)"""
+    http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(settings)))
+    return LLMClient(
+        api_key="fake",
+        model="fake-llm",
+        max_tokens=5,
+        temperature=0.7,
+        base_url="http://fake/v1",
+        http_client=http_client,
+    )
+
+
+def test_latency_distributions():
+    """Тест: задержка соответствует выбранному распределению"""
+    rng = random.Random(1)
+
+    assert FakeLLMSettings(latency_ms=200).sample_latency(rng) == 0.2
+    uniform = FakeLLMSettings(latency="uniform", latency_ms=200, jitter=0.5)
+    assert all(0.1 <= uniform.sample_latency(rng) <= 0.3 for _ in range(100))
+    lognormal = FakeLLMSettings(latency="lognormal", latency_ms=200, jitter=0.5)
+    samples = sorted(lognormal.sample_latency(rng) for _ in range(1001))
+    assert 0.15 < samples[500] < 0.25
+    assert samples[-1] > 0.3
+
+
+def test_unknown_distribution():
+    """Тест: неизвестное распределение задержки отклоняется"""
+    with pytest.raises(ValueError):
+        create_app(FakeLLMSettings(latency="pareto"))
+
+
+@pytest.mark.asyncio
+async def test_completion_through_llm_client():
+    """Тест: LLMClient получает ответ fake сервера, длина ограничена max_tokens"""
+    client = _client(FakeLLMSettings(latency_ms=0, tokens_per_second=0))
+
+    response = await client.get_response([{"role": "user", "content": "Hello"}])
+    await client.close()
+
+    assert response == "token0 token1 token2 token3 token4 "
+
+
+@pytest.mark.asyncio
+async def test_stream_through_llm_client():
+    """Тест: потоковый ответ fake сервера приходит по токенам, usage - в последнем чанке"""
+    client = _client(FakeLLMSettings(latency_ms=0, tokens_per_second=0, response_tokens=3))
+    usage = LLMUsage()
+
+    messages = [{"role": "user", "content": "Hello, fake LLM"}]
+    deltas = [d async for d in client.stream_response(messages, usage=usage)]
+    await client.close()
+
+    assert deltas == ["token0 ", "token1 ", "token2 "]
+    assert (usage.prompt_tokens, usage.completion_tokens) == (3, 3)
+
+
+@pytest.mark.asyncio
+async def test_error_rate():
+    """Тест: при error_rate=1 сервер отвечает 503"""
+    app = create_app(FakeLLMSettings(latency_ms=0, error_rate=1.0))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app)) as http:
+        response = await http.post(
+            "http://fake/v1/chat/completions",
+            json={"model": "fake-llm", "messages": [{"role": "user", "content": "Hi"}]},
+        )
+
+    assert response.status_code == 503
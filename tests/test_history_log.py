@@ -0,0 +1,194 @@
+"""Тесты для модуля history_log"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.history_log import HistoryLog
+from src.history_storage import HistoryStorage
+from src.models import Compaction
+
+
+def _storage(directory, **kwargs) -> HistoryStorage:
+    """Хранилище в памяти с журналом в каталоге directory"""
+    log_kwargs = {k: kwargs.pop(k) for k in ("segment_size", "snapshot_every") if k in kwargs}
+    storage = HistoryStorage(log=HistoryLog(directory, **log_kwargs), **kwargs)
+    storage.restore()
+    return storage
+
+
+def test_restart_replays_segments(tmp_path):
+    """Тест: после перезапуска история восстанавливается из сегментов журнала"""
+    storage = _storage(tmp_path)
+    storage.add_message(1, "Привет", "System")
+    storage.add_response(1, "Здравствуйте", "gpt")
+    storage.add_message(2, "Hi", "Other")
+    storage.log.close()  # аварийная остановка без снимка
+
+    restored = _storage(tmp_path)
+
+    context = restored.get_context(1)
+    assert context is not None
+    assert [m.text for m in context.messages] == ["Привет"]
+    assert [r.content for r in context.responses] == ["Здравствуйте"]
+    assert context.responses[0].model_used == "gpt"
+    assert context.messages[0].token_count > 0
+    assert restored.get_context(2).system_prompt == "Other"
+
+
+def test_close_writes_snapshot_and_drops_segments(tmp_path):
+    """Тест: при закрытии пишется снимок, покрытые им сегменты удаляются"""
+    storage = _storage(tmp_path, max_history=2)
+    for i in range(3):
+        storage.add_message(1, f"m{i}", "System")
+        storage.add_response(1, f"r{i}", "gpt")
+    storage.close()
+
+    assert (tmp_path / "snapshot.log").exists()
+    assert sorted(p.name for p in tmp_path.glob("segment-*")) == ["segment-00000002.log"]
+
+    restored = _storage(tmp_path, max_history=2)
+    context = restored.get_context(1)
+    assert [m.text for m in context.messages] == ["m1", "m2"]
+    assert [r.content for r in context.responses] == ["r1", "r2"]
+
+
+def test_snapshot_then_segments(tmp_path):
+    """Тест: операции после периодического снимка применяются поверх него"""
+    storage = _storage(tmp_path, snapshot_every=2)
+    storage.add_message(1, "first", "System")
+    storage.add_response(1, "answer", "gpt")  # здесь пишется снимок
+    storage.add_message(1, "second", "System")
+    storage.clear(2)
+    context = storage.get_context(1)
+    storage.compact_history(
+        1,
+        Compaction(
+            summary="summary",
+            before=datetime.now() + timedelta(seconds=1),
+            turns=1,
+            last_message=context.messages[-1],
+            last_response=context.responses[-1],
+        ),
+    )
+    storage.add_message(1, "third", "System")
+    assert storage.log.snapshots >= 1
+    storage.log.close()
+
+    restored = _storage(tmp_path)
+    context = restored.get_context(1)
+    assert context.summary == "summary"
+    assert [m.text for m in context.messages] == ["third"]
+    assert context.responses == []
+
+
+def test_clear_is_persisted(tmp_path):
+    """Тест: очищенная история не восстанавливается"""
+    storage = _storage(tmp_path)
+    storage.add_message(1, "Hello", "System")
+    storage.clear(1)
+    storage.log.close()
+
+    assert _storage(tmp_path).get_context(1) is None
+
+
+def test_restore_skips_idle_users(tmp_path, monkeypatch):
+    """Тест: из снимка восстанавливаются только недавно активные пользователи"""
+    storage = _storage(tmp_path, idle_ttl=60)
+    storage.add_message(1, "old", "System")
+    storage.contexts[1].last_access -= 120
+    storage.add_message(2, "recent", "System")
+    storage.close()
+
+    restored = _storage(tmp_path, idle_ttl=60)
+
+    assert restored.get_context(1) is None
+    assert restored.get_context(2) is not None
+
+
+@pytest.mark.asyncio
+async def test_periodic_snapshot_runs_off_event_loop(tmp_path):
+    """Тест: периодический снимок пишется в отдельном потоке, журнал продолжается"""
+    storage = _storage(tmp_path, snapshot_every=2)
+    threads: list[int] = []
+    finish_snapshot = storage.log.finish_snapshot
+
+    def finish_in_thread(covered_until, users):
+        threads.append(threading.get_ident())
+        finish_snapshot(covered_until, users)
+
+    storage.log.finish_snapshot = finish_in_thread
+    storage.add_message(1, "first", "System")
+    storage.add_response(1, "answer", "gpt")  # здесь запускается снимок
+    storage.add_message(1, "second", "System")
+    await storage._snapshot_task
+
+    assert threads and threads[0] != threading.get_ident()
+    assert storage.log.snapshots == 1
+    storage.log.close()
+
+    restored = _storage(tmp_path)
+    assert [m.text for m in restored.get_context(1).messages] == ["first", "second"]
+
+
+def test_evicted_history_is_not_snapshotted(tmp_path):
+    """Тест: вытесненная из памяти история не попадает в снимок и не восстанавливается"""
+    storage = _storage(tmp_path, max_users=1)
+    storage.add_message(1, "first user", "System")
+    storage.add_message(2, "second user", "System")  # user 1 вытеснен
+    assert storage.get_context(1) is None
+    storage.close()
+
+    restored = _storage(tmp_path, max_users=2)
+
+    assert restored.get_context(1) is None
+    assert [m.text for m in restored.get_context(2).messages] == ["second user"]
+
+
+def test_torn_record_is_skipped(tmp_path):
+    """Тест: оборванная последняя запись сегмента пропускается"""
+    storage = _storage(tmp_path)
+    storage.add_message(1, "Hello", "System")
+    storage.log.close()
+    with open(tmp_path / "segment-00000001.log", "ab") as f:
+        f.write(b'{"op":"msg","u":1,"x":"obo')
+
+    restored = _storage(tmp_path)
+
+    assert [m.text for m in restored.get_context(1).messages] == ["Hello"]
+
+
+def test_segment_rolls_by_size(tmp_path):
+    """Тест: сегмент сменяется при достижении segment_size"""
+    log = HistoryLog(tmp_path, segment_size=64)
+    for i in range(5):
+        log.append({"op": "clear", "u": i, "pad": "x" * 40})
+    log.close()
+
+    assert len(list(tmp_path.glob("segment-*"))) == 6
+    assert [r["u"] for r in HistoryLog(tmp_path).read_segments()] == [0, 1, 2, 3, 4]
+
+
+def test_read_snapshot_filters_by_activity(tmp_path):
+    """Тест: read_snapshot пропускает строки с давней активностью"""
+    log = HistoryLog(tmp_path)
+    now = time.time()
+    log.write_snapshot([(now - 1000, {"u": 1}), (now, {"u": 2})])
+
+    assert [state["u"] for _, state in log.read_snapshot(now - 10)] == [2]
+    assert len(list(log.read_snapshot())) == 2
+
+
+def test_older_snapshot_does_not_overwrite_newer(tmp_path):
+    """Тест: снимок, начатый раньше уже записанного, пропускается"""
+    log = HistoryLog(tmp_path)
+    older = log.begin_snapshot()
+    newer = log.begin_snapshot()
+    log.finish_snapshot(newer, [(time.time(), {"u": 2})])
+    log.finish_snapshot(older, [(time.time(), {"u": 1})])
+
+    assert log.snapshots == 1
+    assert [state["u"] for _, state in log.read_snapshot()] == [2]
+    log.close()
@@ -72,3 +72,60 @@ def test_get_nonexistent_context():
     context = storage.get_context(999)
     assert context is None
 
+
+def test_add_message_and_get_context():
+    """Тест: Добавление сообщения возвращает обновленный контекст"""
+    storage = HistoryStorage()
+    context = storage.add_message_and_get_context(123, "Hello", "System prompt")
+
+    assert context == storage.get_context(123)
+    assert len(context.messages) == 1
+    assert context.messages[0].text == "Hello"
+
+
+def test_lru_eviction_by_max_users():
+    """Тест: При превышении max_users вытесняется давно неиспользуемый пользователь"""
+    storage = HistoryStorage(max_users=2)
+    storage.add_message(1, "Hello", "p")
+    storage.add_message(2, "Hello", "p")
+    storage.get_context(1)  # 1 становится самым свежим
+    storage.add_message(3, "Hello", "p")
+
+    assert storage.get_context(2) is None
+    assert storage.get_context(1) is not None
+    assert storage.stats()["users"] == 2
+    assert storage.evictions == 1
+
+
+def test_memory_budget_and_accounting():
+    """Тест: Учет памяти совпадает с пересчетом, бюджет вытесняет старых пользователей"""
+    storage = HistoryStorage(max_history=2)
+    for i in range(5):
+        storage.add_message(1, f"Message {i}" * 10, "p")
+        storage.add_response(1, f"Response {i}", "m")
+    assert storage.memory_used == storage._history_size(storage.contexts[1])
+
+    one_user = storage.memory_used
+    bounded = HistoryStorage(max_history=2, memory_budget=one_user + 100)
+    for user_id in (1, 2):
+        for i in range(5):
+            bounded.add_message(user_id, f"Message {i}" * 10, "p")
+            bounded.add_response(user_id, f"Response {i}", "m")
+
+    assert list(bounded.contexts) == [2]
+    assert bounded.memory_used <= bounded.memory_budget
+
+
+def test_idle_eviction(monkeypatch):
+    """Тест: История, к которой не обращались дольше idle_ttl, вытесняется"""
+    now = 1000.0
+    monkeypatch.setattr("src.history_storage.time.monotonic", lambda: now)
+    storage = HistoryStorage(idle_ttl=60)
+    storage.add_message(1, "Hello", "p")
+
+    now += 61
+    storage.add_message(2, "Hello", "p")
+
+    assert 1 not in storage.contexts
+    assert storage.get_context(1) is None
+    assert storage.stats() == {"users": 1, "memory_used": storage.memory_used, "evictions": 1}
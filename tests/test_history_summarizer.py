@@ -0,0 +1,56 @@
+"""Тесты для модуля history_summarizer"""
+
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock
+
+import pytest
+
+from src.history_summarizer import HistorySummarizer
+from src.models import ConversationContext, LLMResponse, UserMessage
+
+
+def make_context(turns: int, summary: str | None = None) -> ConversationContext:
+    """Контекст из turns ходов с возрастающими временными метками"""
+    start = datetime(2026, 1, 1)
+    return ConversationContext(
+        user_id=123,
+        messages=[
+            UserMessage(123, f"Message {i}", start + timedelta(minutes=2 * i)) for i in range(turns)
+        ],
+        responses=[
+            LLMResponse(f"Answer {i}", start + timedelta(minutes=2 * i + 1), "gpt-3.5")
+            for i in range(turns)
+        ],
+        system_prompt="System",
+        summary=summary,
+    )
+
+
+@pytest.mark.asyncio
+async def test_summarize_oldest_turns():
+    """Тест: Пересказываются все ходы, кроме keep_recent последних, с прежним содержанием"""
+    llm_client = AsyncMock()
+    llm_client.get_response = AsyncMock(return_value="New summary")
+    summarizer = HistorySummarizer(llm_client, threshold=4, keep_recent=1)
+    context = make_context(4, summary="Old summary")
+
+    assert summarizer.should_compact(context)
+    compaction = await summarizer.summarize(context)
+
+    assert compaction is not None
+    assert compaction.summary == "New summary"
+    assert compaction.turns == 3
+    assert compaction.before == context.messages[3].timestamp
+    assert compaction.last_message is context.messages[2]
+    assert compaction.last_response is context.responses[2]
+
+    prompt = llm_client.get_response.call_args[0][0][1]["content"]
+    assert "Old summary" in prompt
+    assert "Message 2" in prompt
+    assert "Message 3" not in prompt
+
+
+def test_invalid_keep_recent():
+    """Тест: keep_recent должен быть меньше threshold"""
+    with pytest.raises(ValueError):
+        HistorySummarizer(AsyncMock(), threshold=4, keep_recent=4)
@@ -1,10 +1,18 @@
 """Тесты для LLMClient"""
 
+import asyncio
 from unittest.mock import AsyncMock, Mock, patch
 
+import httpx
 import pytest
+from openai import APIConnectionError, BadRequestError
 
+from src.deadline import Deadline, DeadlineExceededError
 from src.llm_client import LLMClient
+from src.llm_resilience import CircuitBreaker, LLMUnavailableError, RetryPolicy
+from src.llm_response_cache import LLMResponseCache
+from src.llm_scheduler import LLMScheduler, Priority
+from src.models import LLMUsage
 
 
 @pytest.fixture
@@ -180,3 +188,519 @@ async def test_get_response_multiple_messages(llm_client: LLMClient) -> None:
             temperature=0.7,
         )
 
+
+class _FakeStream:
+    """Поток чанков chat completions (async iterator + async context manager)"""
+
+    def __init__(self, deltas: list[str | None], usage: Mock | None = None) -> None:
+        self.chunks = []
+        for delta in deltas:
+            chunk = Mock()
+            chunk.choices = [Mock()]
+            chunk.choices[0].delta.content = delta
+            chunk.usage = None
+            self.chunks.append(chunk)
+        if usage is not None:
+            # Финальный чанк stream_options.include_usage: без choices, с usage
+            chunk = Mock()
+            chunk.choices = []
+            chunk.usage = usage
+            self.chunks.append(chunk)
+        self.closed = False
+
+    async def __aenter__(self) -> "_FakeStream":
+        return self
+
+    async def __aexit__(self, *args: object) -> None:
+        self.closed = True
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+@pytest.mark.asyncio
+async def test_stream_response(llm_client: LLMClient) -> None:
+    """Тест потокового ответа: пустые фрагменты пропускаются, поток закрывается"""
+    stream = _FakeStream(["Hel", None, "lo", ""])
+
+    with patch.object(
+        llm_client.client.chat.completions, "create", new_callable=AsyncMock
+    ) as mock_create:
+        mock_create.return_value = stream
+
+        messages = [{"role": "user", "content": "Hello"}]
+        deltas = [delta async for delta in llm_client.stream_response(messages)]
+
+        assert deltas == ["Hel", "lo"]
+        assert stream.closed
+        mock_create.assert_called_once_with(
+            model="test-model",
+            messages=messages,
+            max_tokens=100,
+            temperature=0.7,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+
+@pytest.mark.asyncio
+async def test_stream_response_usage(llm_client: LLMClient) -> None:
+    """Тест потокового ответа: usage из финального чанка и задержки заполняются"""
+    stream = _FakeStream(["Hi"], usage=Mock(prompt_tokens=12, completion_tokens=3))
+    usage = LLMUsage()
+
+    with patch.object(
+        llm_client.client.chat.completions, "create", new=AsyncMock(return_value=stream)
+    ):
+        messages = [{"role": "user", "content": "Hello"}]
+        deltas = [d async for d in llm_client.stream_response(messages, usage=usage)]
+
+    assert deltas == ["Hi"]
+    assert usage.model == "test-model"
+    assert (usage.prompt_tokens, usage.completion_tokens) == (12, 3)
+    assert usage.latency_ms is not None and usage.first_token_ms is not None
+    assert usage.first_token_ms <= usage.latency_ms
+
+
+def _completion(content: str, usage: Mock | None = None) -> Mock:
+    """Ответ chat completions с заданным текстом"""
+    response = Mock()
+    response.choices = [Mock()]
+    response.choices[0].message.content = content
+    response.usage = usage
+    return response
+
+
+@pytest.mark.asyncio
+async def test_get_response_usage() -> None:
+    """Тест usage: токены и задержка вызова; ответ из кеша и объединенный - без расхода"""
+    client = LLMClient(
+        api_key="test-api-key",
+        model="test-model",
+        max_tokens=100,
+        temperature=0.0,
+        response_cache=LLMResponseCache(),
+        single_flight=True,
+    )
+    messages = [{"role": "user", "content": "Hello"}]
+    api_usage = Mock(prompt_tokens=20, completion_tokens=5, total_tokens=25)
+
+    async def slow_create(**kwargs: object) -> Mock:
+        await asyncio.sleep(0.01)
+        return _completion("Hi", api_usage)
+
+    with patch.object(client.client.chat.completions, "create", new=slow_create):
+        leader, follower = LLMUsage(), LLMUsage()
+        await asyncio.gather(
+            client.get_response(messages, usage=leader),
+            client.get_response(messages, usage=follower),
+        )
+        cached = LLMUsage()
+        await client.get_response(messages, usage=cached)
+
+    assert (leader.prompt_tokens, leader.completion_tokens) == (20, 5)
+    assert leader.latency_ms is not None and leader.first_token_ms == leader.latency_ms
+    assert follower == LLMUsage(model="test-model")
+    assert cached == LLMUsage(model="test-model")
+
+
+@pytest.mark.asyncio
+async def test_response_cache() -> None:
+    """Тест кеша ответов: temperature=0 кешируется, cache=False обходит кеш"""
+    client = LLMClient(
+        api_key="test-api-key",
+        model="test-model",
+        max_tokens=100,
+        temperature=0.0,
+        response_cache=LLMResponseCache(),
+    )
+    messages = [{"role": "user", "content": "Hello"}]
+
+    with patch.object(
+        client.client.chat.completions, "create", new_callable=AsyncMock
+    ) as mock_create:
+        mock_create.return_value = _completion("Cached")
+
+        assert await client.get_response(messages) == "Cached"
+        assert await client.get_response(messages) == "Cached"
+        assert mock_create.call_count == 1
+
+        await client.get_response(messages, cache=False)
+        assert mock_create.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_response_cache_only_for_chosen_calls(llm_client: LLMClient) -> None:
+    """Тест кеша ответов: при temperature>0 кешируются только вызовы с cache=True"""
+    llm_client.response_cache = LLMResponseCache()
+    messages = [{"role": "user", "content": "Hello"}]
+
+    with patch.object(
+        llm_client.client.chat.completions, "create", new_callable=AsyncMock
+    ) as mock_create:
+        mock_create.return_value = _completion("Answer")
+
+        await llm_client.get_response(messages)
+        await llm_client.get_response(messages)
+        assert mock_create.call_count == 2
+
+        await llm_client.get_response(messages, cache=True)
+        await llm_client.get_response(messages, cache=True)
+        assert mock_create.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_requests_are_coalesced(llm_client: LLMClient) -> None:
+    """Тест single-flight: одинаковые одновременные запросы - один вызов API"""
+    release = asyncio.Event()
+
+    async def slow_create(**kwargs):
+        await release.wait()
+        return _completion("Shared")
+
+    with patch.object(
+        llm_client.client.chat.completions, "create", new=AsyncMock(side_effect=slow_create)
+    ) as mock_create:
+        messages = [{"role": "user", "content": "Hello"}]
+        waiters = [asyncio.create_task(llm_client.get_response(messages)) for _ in range(3)]
+        other = asyncio.create_task(llm_client.get_response([{"role": "user", "content": "Bye"}]))
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await asyncio.gather(*waiters) == ["Shared"] * 3
+        await other
+        assert mock_create.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_scheduler_limits_api_calls() -> None:
+    """Тест: вызовы API ждут слот планировщика с переданным приоритетом"""
+    scheduler = LLMScheduler(max_concurrency=1)
+    client = LLMClient(
+        api_key="test-api-key",
+        model="test-model",
+        max_tokens=100,
+        temperature=0.7,
+        scheduler=scheduler,
+    )
+    release = asyncio.Event()
+
+    async def slow_create(**kwargs):
+        await release.wait()
+        return _completion("Done")
+
+    with patch.object(
+        client.client.chat.completions, "create", new=AsyncMock(side_effect=slow_create)
+    ) as mock_create:
+        first = asyncio.create_task(client.get_response([{"role": "user", "content": "A"}]))
+        second = asyncio.create_task(
+            client.get_response([{"role": "user", "content": "B"}], priority=Priority.BACKGROUND)
+        )
+        await asyncio.sleep(0.01)
+
+        assert mock_create.call_count == 1
+        assert scheduler.stats()["queued_background"] == 1
+        release.set()
+        assert await asyncio.gather(first, second) == ["Done", "Done"]
+        assert scheduler.stats()["active"] == 0
+
+
+def _connection_error() -> APIConnectionError:
+    """Временная ошибка соединения с API"""
+    return APIConnectionError(request=Mock())
+
+
+def _bad_request() -> BadRequestError:
+    """Ошибка запроса (например, превышена длина контекста)"""
+    request = httpx.Request("POST", "https://example.test/chat/completions")
+    response = httpx.Response(400, request=request)
+    return BadRequestError("context length exceeded", response=response, body=None)
+
+
+@pytest.mark.asyncio
+async def test_client_error_does_not_affect_health() -> None:
+    """Тест: ошибка запроса (400) не считается отказом модели"""
+    client = LLMClient(api_key="test-api-key", model="primary", max_tokens=100, temperature=0.7)
+    with patch.object(
+        client.client.chat.completions, "create", new=AsyncMock(side_effect=_bad_request())
+    ):
+        with pytest.raises(BadRequestError):
+            await client.get_response([{"role": "user", "content": "Hi"}])
+        with pytest.raises(BadRequestError):
+            async for _ in client.stream_response([{"role": "user", "content": "Hi"}]):
+                pass
+
+    assert client.health["primary"].consecutive_failures == 0
+    assert client.stats()["models"]["primary"]["error_rate"] == 0.0
+
+
+@pytest.mark.asyncio
+async def test_retry_falls_back_to_next_model() -> None:
+    """Тест: после временной ошибки повтор уходит на резервную модель"""
+    client = LLMClient(
+        api_key="test-api-key",
+        model="primary",
+        max_tokens=100,
+        temperature=0.7,
+        fallback_models=["backup"],
+        retry_policy=RetryPolicy(max_retries=1),
+    )
+    with patch.object(
+        client.client.chat.completions,
+        "create",
+        new=AsyncMock(side_effect=[_connection_error(), _completion("From backup")]),
+    ) as mock_create:
+        result = await client.get_response([{"role": "user", "content": "Hi"}])
+
+    assert result == "From backup"
+    assert [c.kwargs["model"] for c in mock_create.call_args_list] == ["primary", "backup"]
+    assert client.retries == 1
+    assert client.health["primary"].consecutive_failures == 1
+
+
+@pytest.mark.asyncio
+async def test_routed_model_and_max_tokens() -> None:
+    """Тест: модель и лимит запроса переопределяются, основная модель становится резервной"""
+    client = LLMClient(
+        api_key="test-api-key",
+        model="primary",
+        max_tokens=100,
+        temperature=0.7,
+        fallback_models=["backup"],
+        retry_policy=RetryPolicy(max_retries=2, base_delay=0.001),
+    )
+    with patch.object(
+        client.client.chat.completions, "create", new=AsyncMock(side_effect=_connection_error())
+    ) as mock_create:
+        usage = LLMUsage()
+        with pytest.raises(APIConnectionError):
+            await client.get_response(
+                [{"role": "user", "content": "Hi"}], usage=usage, model="cheap", max_tokens=30
+            )
+
+    calls = mock_create.call_args_list
+    assert [c.kwargs["model"] for c in calls] == ["cheap", "primary", "backup"]
+    assert all(c.kwargs["max_tokens"] == 30 for c in calls)
+    assert usage.model == "cheap"
+    assert "cheap" in client.stats()["models"]
+
+
+@pytest.mark.asyncio
+async def test_retries_exhausted() -> None:
+    """Тест: после исчерпания повторов ошибка пробрасывается, постоянные ошибки не повторяются"""
+    client = LLMClient(
+        api_key="test-api-key",
+        model="test-model",
+        max_tokens=100,
+        temperature=0.7,
+        retry_policy=RetryPolicy(max_retries=2, base_delay=0.001),
+    )
+    with patch.object(
+        client.client.chat.completions, "create", new=AsyncMock(side_effect=_connection_error())
+    ) as mock_create:
+        with pytest.raises(APIConnectionError):
+            await client.get_response([{"role": "user", "content": "Hi"}])
+        assert mock_create.call_count == 3
+
+    with patch.object(
+        client.client.chat.completions, "create", new=AsyncMock(side_effect=ValueError("bad"))
+    ) as mock_create:
+        with pytest.raises(ValueError):
+            await client.get_response([{"role": "user", "content": "Hi"}])
+        assert mock_create.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_fast() -> None:
+    """Тест: после размыкания автомата запросы отклоняются без обращения к API"""
+    client = LLMClient(
+        api_key="test-api-key",
+        model="test-model",
+        max_tokens=100,
+        temperature=0.7,
+        retry_policy=RetryPolicy(max_retries=5, base_delay=0.001),
+        breaker=CircuitBreaker(failure_rate=0.5, min_requests=2, open_timeout=60),
+    )
+    with patch.object(
+        client.client.chat.completions, "create", new=AsyncMock(side_effect=_connection_error())
+    ) as mock_create:
+        # Повторы прекращаются, как только автомат разомкнулся
+        with pytest.raises(LLMUnavailableError):
+            await client.get_response([{"role": "user", "content": "Hi"}])
+        assert mock_create.call_count == 2
+
+        with pytest.raises(LLMUnavailableError):
+            client.ensure_available()
+        with pytest.raises(LLMUnavailableError):
+            await client.get_response([{"role": "user", "content": "Again"}])
+        assert mock_create.call_count == 2
+
+    assert client.stats()["circuit"]["state"] == "open"
+
+
+@pytest.mark.asyncio
+async def test_deadline_cancels_call() -> None:
+    """Тест: по истечении срока вызов API отменяется и не считается ошибкой модели"""
+    client = LLMClient(
+        api_key="test-api-key",
+        model="test-model",
+        max_tokens=100,
+        temperature=0.7,
+    )
+
+    async def hang(**kwargs):
+        await asyncio.sleep(10)
+
+    with patch.object(client.client.chat.completions, "create", new=hang):
+        with pytest.raises(DeadlineExceededError):
+            await client.get_response(
+                [{"role": "user", "content": "Hi"}], deadline=Deadline.after(0.01)
+            )
+        # Общий запрос single-flight отменяется отдельной задачей
+        await asyncio.sleep(0)
+
+    assert client.stats()["cancelled"] == 1
+    assert client.health["test-model"].consecutive_failures == 0
+
+
+@pytest.mark.asyncio
+async def test_retry_skipped_after_deadline() -> None:
+    """Тест: повтор, пауза перед которым не укладывается в срок, не выполняется"""
+    client = LLMClient(
+        api_key="test-api-key",
+        model="test-model",
+        max_tokens=100,
+        temperature=0.7,
+        retry_policy=RetryPolicy(max_retries=3, base_delay=60, max_delay=60),
+    )
+    with (
+        patch.object(
+            client.client.chat.completions, "create", new=AsyncMock(side_effect=_connection_error())
+        ) as mock_create,
+        patch("src.llm_resilience.random.uniform", return_value=60.0),
+    ):
+        with pytest.raises(DeadlineExceededError):
+            await client.get_response(
+                [{"role": "user", "content": "Hi"}], deadline=Deadline.after(5)
+            )
+
+    assert mock_create.call_count == 1
+    assert client.retries == 0
+
+
+@pytest.mark.asyncio
+async def test_coalesced_retry_uses_latest_waiter_deadline() -> None:
+    """Тест: срок вызова, начавшего общий запрос, не обрывает повторы для остальных"""
+    client = LLMClient(
+        api_key="test-api-key",
+        model="test-model",
+        max_tokens=100,
+        temperature=0.7,
+        retry_policy=RetryPolicy(max_retries=1, base_delay=0.05, max_delay=0.05),
+    )
+    messages = [{"role": "user", "content": "Hi"}]
+    release = asyncio.Event()
+    calls = 0
+
+    async def flaky_create(**kwargs):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            await release.wait()
+            raise _connection_error()
+        return _completion("Retried")
+
+    with (
+        patch.object(client.client.chat.completions, "create", new=flaky_create),
+        patch("src.llm_resilience.random.uniform", return_value=0.05),
+    ):
+        leader = asyncio.create_task(client.get_response(messages, deadline=Deadline.after(0.03)))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(client.get_response(messages, deadline=Deadline.after(5)))
+        await asyncio.sleep(0)
+        release.set()
+
+        with pytest.raises(DeadlineExceededError):
+            await leader
+        assert await follower == "Retried"
+
+    assert client.retries == 1
+
+
+@pytest.mark.asyncio
+async def test_degraded_model_is_routed_around() -> None:
+    """Тест: модель после серии ошибок пробуется после резервной"""
+    client = LLMClient(
+        api_key="test-api-key",
+        model="primary",
+        max_tokens=100,
+        temperature=0.7,
+        fallback_models=["backup"],
+        retry_policy=RetryPolicy(failure_threshold=1),
+    )
+    client.health["primary"].record_failure()
+
+    with patch.object(
+        client.client.chat.completions, "create", new=AsyncMock(return_value=_completion("Ok"))
+    ) as mock_create:
+        await client.get_response([{"role": "user", "content": "Hi"}])
+
+    assert mock_create.call_args.kwargs["model"] == "backup"
+
+
+@pytest.mark.asyncio
+async def test_slow_request_is_hedged() -> None:
+    """Тест: запрос дольше перцентиля задержки дублируется, побеждает первый ответ"""
+    client = LLMClient(
+        api_key="test-api-key",
+        model="primary",
+        max_tokens=100,
+        temperature=0.7,
+        fallback_models=["backup"],
+        retry_policy=RetryPolicy(hedge_percentile=0.9, hedge_min_samples=1),
+    )
+    client.health["primary"].record_success(0.01)
+    stuck = asyncio.Event()
+
+    async def create(**kwargs):
+        if kwargs["model"] == "primary":
+            await stuck.wait()
+        return _completion(kwargs["model"])
+
+    with patch.object(client.client.chat.completions, "create", new=AsyncMock(side_effect=create)):
+        result = await client.get_response([{"role": "user", "content": "Hi"}])
+
+    assert result == "backup"
+    assert client.hedges == 1
+    stats = client.stats()["models"]
+    assert stats["backup"]["requests"] == 1
+    # Отмененный дублирующий запрос не считается ошибкой модели
+    assert stats["primary"]["error_rate"] == 0.0
+
+
+@pytest.mark.asyncio
+async def test_stream_retries_before_first_token() -> None:
+    """Тест: ошибка потока до первого фрагмента повторяется на резервной модели"""
+    client = LLMClient(
+        api_key="test-api-key",
+        model="primary",
+        max_tokens=100,
+        temperature=0.7,
+        fallback_models=["backup"],
+        retry_policy=RetryPolicy(max_retries=1),
+    )
+    with patch.object(
+        client.client.chat.completions,
+        "create",
+        new=AsyncMock(side_effect=[_connection_error(), _FakeStream(["Hi"])]),
+    ) as mock_create:
+        deltas = [
+            delta async for delta in client.stream_response([{"role": "user", "content": "X"}])
+        ]
+
+    assert deltas == ["Hi"]
+    assert mock_create.call_args.kwargs["model"] == "backup"
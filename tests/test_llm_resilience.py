@@ -0,0 +1,128 @@
+"""Тесты для модуля llm_resilience"""
+
+import time
+
+import pytest
+
+from src.llm_resilience import (
+    CircuitBreaker,
+    CircuitState,
+    LLMUnavailableError,
+    ModelHealth,
+    RetryPolicy,
+)
+
+
+def test_backoff_is_bounded():
+    """Тест: пауза перед повтором растет экспоненциально и не превышает max_delay"""
+    policy = RetryPolicy(base_delay=0.5, max_delay=2.0)
+
+    for _ in range(100):
+        assert 0 <= policy.backoff(0) <= 0.5
+        assert 0 <= policy.backoff(1) <= 1.0
+        assert 0 <= policy.backoff(10) <= 2.0
+
+
+def test_latency_percentile():
+    """Тест: перцентиль задержки считается по последним window запросам"""
+    health = ModelHealth(window=10)
+    assert health.latency_percentile(0.5) is None
+
+    for latency in range(1, 21):
+        health.record_success(float(latency))
+
+    assert health.latency_percentile(0.5) == 16.0
+    assert health.latency_percentile(0.95) == 20.0
+    assert health.latency_percentile(0.5, min_samples=11) is None
+
+
+def test_consecutive_failures_degrade_model():
+    """Тест: серия ошибок исключает модель на cooldown, успех возвращает ее"""
+    health = ModelHealth(failure_threshold=2, cooldown=60.0)
+
+    health.record_failure()
+    assert health.available
+    health.record_failure()
+    assert not health.available
+    assert health.stats()["error_rate"] == 1.0
+
+    health.record_success(0.1)
+    assert health.available
+    assert health.stats()["consecutive_failures"] == 0
+
+
+def test_cooldown_expires():
+    """Тест: модель снова доступна после cooldown"""
+    health = ModelHealth(failure_threshold=1, cooldown=0.0)
+
+    health.record_failure()
+
+    assert health.available
+
+
+def _outcome(breaker: CircuitBreaker, error: BaseException | None = None) -> None:
+    """Выполнить вызов под автоматом с заданным исходом"""
+    if error is None:
+        with breaker.call((ConnectionError,)):
+            pass
+        return
+    with pytest.raises(type(error)):
+        with breaker.call((ConnectionError,)):
+            raise error
+
+
+def test_circuit_opens_on_failure_rate():
+    """Тест: автомат размыкается по доле ошибок в окне и отклоняет вызовы сразу"""
+    breaker = CircuitBreaker(failure_rate=0.5, min_requests=4, window=10, open_timeout=60)
+
+    for error in (None, ConnectionError(), None):
+        _outcome(breaker, error)
+    assert breaker.state is CircuitState.CLOSED
+
+    # Ошибки запроса (не upstream) доли ошибок не меняют
+    _outcome(breaker, ValueError("bad request"))
+    assert breaker.state is CircuitState.CLOSED
+
+    _outcome(breaker, ConnectionError())
+    assert breaker.state is CircuitState.OPEN
+    assert not breaker.accepting
+    with pytest.raises(LLMUnavailableError) as exc_info:
+        breaker.check()
+    assert 1 <= exc_info.value.retry_after <= 60
+    assert breaker.stats()["opened"] == 1
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_half_open_probe():
+    """Тест: после таймаута идет один пробный вызов; неудача удваивает таймаут, успех замыкает"""
+    breaker = CircuitBreaker(failure_rate=0.5, min_requests=1, open_timeout=0.01)
+    _outcome(breaker, ConnectionError())
+    time.sleep(0.02)
+
+    assert breaker.state is CircuitState.HALF_OPEN
+    with breaker.call((ConnectionError,)):
+        # Пока идет проба, остальные вызовы отклоняются
+        assert not breaker.accepting
+    assert breaker.state is CircuitState.CLOSED
+
+    _outcome(breaker, ConnectionError())
+    time.sleep(0.02)
+    _outcome(breaker, ConnectionError())
+    assert breaker.state is CircuitState.OPEN
+    time.sleep(0.015)
+    assert breaker.state is CircuitState.OPEN  # таймаут после неудачной пробы - 0.02s
+    time.sleep(0.01)
+    assert breaker.state is CircuitState.HALF_OPEN
+
+
+def test_slow_calls_count_as_failures():
+    """Тест: вызов дольше slow_call_threshold считается ошибкой"""
+    breaker = CircuitBreaker(failure_rate=0.5, min_requests=2, slow_call_threshold=0.001)
+
+    with breaker.call((ConnectionError,), measure_latency=False):
+        time.sleep(0.005)
+    assert breaker.state is CircuitState.CLOSED
+
+    with breaker.call((ConnectionError,)):
+        time.sleep(0.005)
+    assert breaker.state is CircuitState.OPEN
@@ -0,0 +1,73 @@
+"""Тесты для модуля llm_response_cache"""
+
+import time
+
+from src.llm_response_cache import LLMResponseCache, request_key
+
+
+def test_request_key_is_canonical():
+    """Тест: ключ не зависит от порядка полей сообщений, но зависит от параметров"""
+    messages = [{"role": "user", "content": "Hi"}]
+    reordered = [{"content": "Hi", "role": "user"}]
+
+    key = request_key("model", 0.0, 100, messages)
+
+    assert key == request_key("model", 0.0, 100, reordered)
+    assert key != request_key("model", 0.7, 100, messages)
+    assert key != request_key("model", 0.0, 200, messages)
+    assert key != request_key("other", 0.0, 100, messages)
+
+
+def test_get_put_and_hit_ratio():
+    """Тест: попадания и промахи учитываются в статистике"""
+    cache = LLMResponseCache()
+    assert cache.get("k") is None
+
+    cache.put("k", "answer")
+
+    assert cache.get("k") == "answer"
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+    assert stats["bytes"] > 0
+
+
+def test_lru_eviction_by_entries():
+    """Тест: при превышении max_entries вытесняется давно неиспользуемый ответ"""
+    cache = LLMResponseCache(max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.evictions == 1
+
+
+def test_eviction_by_bytes():
+    """Тест: бюджет памяти ограничивает кеш, слишком большой ответ не кешируется"""
+    cache = LLMResponseCache(max_bytes=400)
+    cache.put("a", "x" * 150)
+    cache.put("b", "y" * 150)
+
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+    assert cache.bytes_used <= 400
+
+    cache.put("huge", "z" * 1000)
+    assert cache.get("huge") is None
+
+
+def test_ttl_expiry(monkeypatch):
+    """Тест: просроченный ответ считается промахом и удаляется"""
+    cache = LLMResponseCache(ttl=10)
+    cache.put("k", "answer")
+
+    now = time.monotonic()
+    monkeypatch.setattr("src.llm_response_cache.time.monotonic", lambda: now + 11)
+
+    assert cache.get("k") is None
+    assert cache.stats()["size"] == 0
+    assert cache.bytes_used == 0
@@ -0,0 +1,141 @@
+"""Тесты для модуля llm_scheduler"""
+
+import asyncio
+
+import pytest
+
+from src.llm_scheduler import LLMQueueTimeoutError, LLMScheduler, Priority
+
+
+async def _hold(scheduler: LLMScheduler, priority: Priority, release: asyncio.Event, log: list):
+    """Занять слот, записать приоритет и держать слот до release"""
+    async with scheduler.slot(priority):
+        log.append(priority)
+        await release.wait()
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_capped():
+    """Тест: одновременно выполняется не больше max_concurrency запросов"""
+    scheduler = LLMScheduler(max_concurrency=2)
+    release = asyncio.Event()
+    started: list[Priority] = []
+
+    tasks = [
+        asyncio.create_task(_hold(scheduler, Priority.INTERACTIVE, release, started))
+        for _ in range(5)
+    ]
+    await asyncio.sleep(0)
+
+    assert len(started) == 2
+    assert scheduler.stats()["active"] == 2
+    assert scheduler.stats()["queued"] == 3
+
+    release.set()
+    await asyncio.gather(*tasks)
+    stats = scheduler.stats()
+    assert len(started) == 5
+    assert stats["active"] == 0
+    assert stats["queued"] == 0
+    assert stats["admitted"] == 5
+
+
+@pytest.mark.asyncio
+async def test_higher_priority_is_admitted_first():
+    """Тест: освободившийся слот получает запрос с высшим приоритетом, FIFO внутри приоритета"""
+    scheduler = LLMScheduler(max_concurrency=1)
+    gate = asyncio.Event()
+    order: list[Priority] = []
+
+    holder = asyncio.create_task(_hold(scheduler, Priority.BACKGROUND, gate, []))
+    await asyncio.sleep(0)
+
+    release = asyncio.Event()
+    release.set()
+    priorities = [Priority.BACKGROUND, Priority.ANALYTICS, Priority.INTERACTIVE, Priority.ANALYTICS]
+    waiters = []
+    for priority in priorities:
+        waiters.append(asyncio.create_task(_hold(scheduler, priority, release, order)))
+        await asyncio.sleep(0)
+
+    assert scheduler.stats()["queued_analytics"] == 2
+    gate.set()
+    await asyncio.gather(holder, *waiters)
+
+    assert order == [
+        Priority.INTERACTIVE,
+        Priority.ANALYTICS,
+        Priority.ANALYTICS,
+        Priority.BACKGROUND,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout():
+    """Тест: запрос, не дождавшийся слота, завершается LLMQueueTimeoutError"""
+    scheduler = LLMScheduler(max_concurrency=1, queue_timeout=0.01)
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(scheduler, Priority.INTERACTIVE, release, []))
+    await asyncio.sleep(0)
+
+    with pytest.raises(LLMQueueTimeoutError):
+        async with scheduler.slot(Priority.BACKGROUND):
+            pass
+
+    stats = scheduler.stats()
+    assert stats["timeouts"] == 1
+    assert stats["queued"] == 0
+
+    # Истекшее ожидание не забирает освободившийся слот
+    release.set()
+    await holder
+    async with scheduler.slot():
+        assert scheduler.stats()["active"] == 1
+    assert scheduler.stats()["active"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_queue():
+    """Тест: отмена ожидающего запроса убирает его из очереди без утечки слота"""
+    scheduler = LLMScheduler(max_concurrency=1)
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(scheduler, Priority.INTERACTIVE, release, []))
+    await asyncio.sleep(0)
+
+    waiter = asyncio.create_task(_hold(scheduler, Priority.INTERACTIVE, release, []))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert scheduler.stats()["queued"] == 0
+
+    release.set()
+    await holder
+    assert scheduler.stats()["active"] == 0
+
+
+@pytest.mark.asyncio
+async def test_wait_time_metrics():
+    """Тест: время ожидания слота попадает в метрики"""
+    scheduler = LLMScheduler(max_concurrency=1)
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(scheduler, Priority.INTERACTIVE, release, []))
+    await asyncio.sleep(0)
+
+    waiter = asyncio.create_task(_hold(scheduler, Priority.INTERACTIVE, asyncio.Event(), []))
+    await asyncio.sleep(0.02)
+    release.set()
+    await holder
+    await asyncio.sleep(0)
+    waiter.cancel()
+
+    stats = scheduler.stats()
+    assert stats["admitted"] == 2
+    assert stats["max_wait"] >= 0.02
+    assert 0 < stats["avg_wait"] <= stats["max_wait"]
+
+
+def test_invalid_concurrency():
+    """Тест: max_concurrency должен быть положительным"""
+    with pytest.raises(ValueError):
+        LLMScheduler(max_concurrency=0)
@@ -0,0 +1,26 @@
+"""Тесты для модуля llm_transport"""
+
+from unittest.mock import patch
+
+import pytest
+
+from src.llm_transport import TransportSettings, create_http_client
+
+
+@pytest.mark.asyncio
+async def test_http_client_uses_settings():
+    """Тест: таймауты пула берутся из настроек"""
+    client = create_http_client(TransportSettings(connect_timeout=2.0, read_timeout=30.0))
+
+    assert client.timeout.connect == 2.0
+    assert client.timeout.read == 30.0
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_http2_falls_back_without_h2():
+    """Тест: без пакета h2 клиент создается с HTTP/1.1"""
+    with patch("src.llm_transport.importlib.util.find_spec", return_value=None):
+        client = create_http_client(TransportSettings(http2=True))
+
+    await client.aclose()
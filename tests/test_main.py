@@ -1,6 +1,6 @@
 """Тесты для главной функции приложения"""
 
-from unittest.mock import AsyncMock, Mock, patch
+from unittest.mock import ANY, AsyncMock, Mock, patch
 
 import pytest
 
@@ -14,9 +14,10 @@ async def test_main_success() -> None:
     with (
         patch("src.main.Config") as mock_config_class,
         patch("src.main.create_engine") as mock_create_engine,
-        patch("src.main.DatabaseHistoryStorage") as mock_db_storage_class,
-        patch("src.main.LLMClient") as mock_llm_class,
-        patch("src.main.ConversationManager") as mock_conv_class,
+        patch("src.factory.DatabaseHistoryStorage", autospec=True) as mock_db_storage_class,
+        patch("src.factory.LLMClient", autospec=True) as mock_llm_class,
+        patch("src.factory.create_http_client") as mock_http_client,
+        patch("src.main.ConversationManager", autospec=True) as mock_conv_class,
         patch("src.main.TelegramBot") as mock_bot_class,
     ):
         # Настройка mock Config
@@ -29,6 +30,19 @@ async def test_main_success() -> None:
         mock_config.system_prompt = "Test prompt"
         mock_config.max_history_messages = 10
         mock_config.database_url = "sqlite+aiosqlite:///:memory:"
+        mock_config.context_cache_enabled = False
+        mock_config.history_token_budget = 0
+        mock_config.summary_threshold = 0
+        mock_config.history_storage = "messages"
+        mock_config.llm_cache_enabled = False
+        mock_config.llm_cache_routes = set()
+        mock_config.llm_single_flight = True
+        mock_config.llm_max_concurrency = 0
+        mock_config.llm_fallback_models = []
+        mock_config.llm_router_tiers = []
+        mock_config.llm_breaker_failure_rate = 0.0
+        mock_config.llm_request_timeout = 0.0
+        mock_config.llm_base_url = "https://openrouter.ai/api/v1"
         mock_config_class.return_value = mock_config
 
         # Настройка mock Engine
@@ -53,9 +67,20 @@ async def test_main_success() -> None:
             model="test-model",
             max_tokens=100,
             temperature=0.7,
+            response_cache=None,
+            single_flight=True,
+            scheduler=None,
+            fallback_models=[],
+            retry_policy=ANY,
+            base_url="https://openrouter.ai/api/v1",
+            breaker=None,
+            http_client=mock_http_client.return_value,
         )
+        mock_llm_class.return_value.close.assert_awaited_once()
         mock_db_storage_class.assert_called_once()
+        mock_db_storage_class.return_value.close.assert_awaited_once()
         mock_conv_class.assert_called_once()
+        mock_conv_class.return_value.close.assert_awaited_once()
         mock_bot_class.assert_called_once()
         mock_bot.start_polling.assert_called_once()
         mock_bot.stop.assert_called_once()
@@ -84,9 +109,10 @@ async def test_main_keyboard_interrupt() -> None:
     with (
         patch("src.main.Config") as mock_config_class,
         patch("src.main.create_engine") as mock_create_engine,
-        patch("src.main.DatabaseHistoryStorage"),
-        patch("src.main.LLMClient"),
-        patch("src.main.ConversationManager"),
+        patch("src.factory.DatabaseHistoryStorage", autospec=True),
+        patch("src.factory.LLMClient", autospec=True),
+        patch("src.factory.create_http_client"),
+        patch("src.main.ConversationManager", autospec=True),
         patch("src.main.TelegramBot") as mock_bot_class,
     ):
         # Настройка mock Config
@@ -99,6 +125,19 @@ async def test_main_keyboard_interrupt() -> None:
         mock_config.system_prompt = "Test prompt"
         mock_config.max_history_messages = 10
         mock_config.database_url = "sqlite+aiosqlite:///:memory:"
+        mock_config.context_cache_enabled = False
+        mock_config.history_token_budget = 0
+        mock_config.summary_threshold = 0
+        mock_config.history_storage = "messages"
+        mock_config.llm_cache_enabled = False
+        mock_config.llm_cache_routes = set()
+        mock_config.llm_single_flight = True
+        mock_config.llm_max_concurrency = 0
+        mock_config.llm_fallback_models = []
+        mock_config.llm_router_tiers = []
+        mock_config.llm_breaker_failure_rate = 0.0
+        mock_config.llm_request_timeout = 0.0
+        mock_config.llm_base_url = "https://openrouter.ai/api/v1"
         mock_config_class.return_value = mock_config
 
         # Настройка mock Engine
@@ -124,8 +163,9 @@ async def test_main_unexpected_error() -> None:
     """Тест обработки неожиданной ошибки"""
     with (
         patch("src.main.Config") as mock_config_class,
-        patch("src.main.LLMClient"),
-        patch("src.main.ConversationManager"),
+        patch("src.factory.LLMClient", autospec=True),
+        patch("src.factory.create_http_client"),
+        patch("src.main.ConversationManager", autospec=True),
         patch("src.main.TelegramBot") as mock_bot_class,
         pytest.raises(SystemExit) as exc_info,
     ):
@@ -172,8 +212,9 @@ async def test_main_bot_stops_on_error() -> None:
     """Тест, что бот корректно останавливается при ошибке"""
     with (
         patch("src.main.Config") as mock_config_class,
-        patch("src.main.LLMClient"),
-        patch("src.main.ConversationManager"),
+        patch("src.factory.LLMClient", autospec=True),
+        patch("src.factory.create_http_client"),
+        patch("src.main.ConversationManager", autospec=True),
         patch("src.main.TelegramBot") as mock_bot_class,
         pytest.raises(SystemExit),
     ):
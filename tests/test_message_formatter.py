@@ -1,6 +1,6 @@
 """Тесты для модуля message_formatter"""
 
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from src.message_formatter import MessageFormatter
 from src.models import ConversationContext, LLMResponse, UserMessage
@@ -57,3 +57,104 @@ def test_format_with_full_conversation():
     assert messages[3] == {"role": "user", "content": "How are you?"}
     assert messages[4] == {"role": "assistant", "content": "I'm fine"}
 
+
+def test_format_with_token_budget():
+    """Тест: Бюджет токенов отбрасывает самые старые пары, но не последнее сообщение"""
+    context = ConversationContext(
+        user_id=123,
+        messages=[
+            UserMessage(123, f"Message {i}", datetime.now(), token_count=10) for i in range(4)
+        ],
+        responses=[LLMResponse(f"Answer {i}", datetime.now(), "gpt-3.5") for i in range(3)],
+        system_prompt="System",
+    )
+    for response in context.responses:
+        response.token_count = 10
+
+    # system (1 + 4) + последнее сообщение (10 + 4) + одна пара (2 * 14) = 47
+    formatter = MessageFormatter(token_budget=50)
+    messages = formatter.format_for_llm(context, "Default")
+
+    assert [m["content"] for m in messages] == ["System", "Message 2", "Answer 2", "Message 3"]
+
+    tiny = MessageFormatter(token_budget=1)
+    assert [m["content"] for m in tiny.format_for_llm(context, "Default")] == [
+        "System",
+        "Message 3",
+    ]
+
+
+def _history(turns: int, start: int = 0, prompt: str = "System") -> ConversationContext:
+    """Контекст с парами start..turns-1 и непарным последним сообщением"""
+    base = datetime(2024, 1, 1)
+    return ConversationContext(
+        user_id=123,
+        messages=[
+            UserMessage(123, f"Message {i}", base + timedelta(minutes=2 * i))
+            for i in range(start, turns + 1)
+        ],
+        responses=[
+            LLMResponse(f"Answer {i}", base + timedelta(minutes=2 * i + 1), "gpt-3.5")
+            for i in range(start, turns)
+        ],
+        system_prompt=prompt,
+    )
+
+
+def test_cache_extends_and_shifts_window():
+    """Тест: Кеш дополняется новой парой и сдвигается при обрезке окна"""
+    formatter = MessageFormatter()
+    first = formatter.format_for_llm(_history(3), "Default")
+    assert formatter.misses == 1
+
+    # Следующий ход: окно сдвинулось на одну пару, добавилась новая
+    second = formatter.format_for_llm(_history(4, start=1), "Default")
+
+    assert formatter.hits == 1
+    assert [m["content"] for m in second] == [
+        "System",
+        "Message 1",
+        "Answer 1",
+        "Message 2",
+        "Answer 2",
+        "Message 3",
+        "Answer 3",
+        "Message 4",
+    ]
+    # Словари уже отформатированных пар переиспользуются
+    assert second[1] is first[3]
+
+
+def test_cache_rebuilds_on_prompt_change_and_invalidate():
+    """Тест: Смена системного промпта и invalidate сбрасывают кеш"""
+    formatter = MessageFormatter()
+    formatter.format_for_llm(_history(2), "Default")
+
+    changed = formatter.format_for_llm(_history(2, prompt="Other"), "Default")
+    assert changed[0]["content"] == "Other"
+    assert formatter.misses == 2
+
+    formatter.invalidate(123)
+    cleared = formatter.format_for_llm(_history(0, prompt="Other"), "Default")
+    assert [m["content"] for m in cleared] == ["Other", "Message 0"]
+
+
+def test_cache_rebuilds_when_history_diverges():
+    """Тест: История, отличающаяся не только новыми парами, форматируется заново"""
+    formatter = MessageFormatter()
+    formatter.format_for_llm(_history(3), "Default")
+
+    context = _history(3)
+    context.responses[-1] = LLMResponse("Edited", datetime(2024, 1, 2), "gpt-3.5")
+    messages = formatter.format_for_llm(context, "Default")
+
+    assert messages[-2]["content"] == "Edited"
+    assert formatter.misses == 2
+
+
+def test_cache_disabled():
+    """Тест: С cache_size=0 история форматируется без кеша"""
+    formatter = MessageFormatter(cache_size=0)
+    formatter.format_for_llm(_history(2), "Default")
+
+    assert formatter.hits == formatter.misses == 0
@@ -0,0 +1,88 @@
+"""Тесты для модуля model_router"""
+
+import pytest
+
+from src.llm_resilience import ModelHealth
+from src.model_router import ModelRouter, ModelTier
+
+TIERS = [
+    ModelTier("cheap", max_dialog_tokens=50, max_tokens=200),
+    ModelTier("mid", max_dialog_tokens=500),
+    ModelTier("large"),
+]
+
+
+def _messages(text: str, history: int = 0) -> list[dict[str, str]]:
+    """Промпт: системный промпт, history пар сообщений по 40 символов и вопрос"""
+    messages = [{"role": "system", "content": "x" * 4000}]
+    for _ in range(history):
+        messages.append({"role": "user", "content": "q" * 40})
+        messages.append({"role": "assistant", "content": "a" * 40})
+    messages.append({"role": "user", "content": text})
+    return messages
+
+
+def test_parse_tier():
+    """Тест: разбор ступени из конфигурации, лимиты необязательны"""
+    assert ModelTier.parse("meta/llama:free|300|400") == ModelTier("meta/llama:free", 300, 400)
+    assert ModelTier.parse(" openai/gpt-4o ") == ModelTier("openai/gpt-4o")
+    assert ModelTier.parse("m||512") == ModelTier("m", 0, 512)
+
+    for spec in ("|100", "m|x", "m|1|2|3", "m|-1"):
+        with pytest.raises(ValueError):
+            ModelTier.parse(spec)
+
+
+def test_route_by_dialog_size():
+    """Тест: ступень выбирается по токенам диалога (сообщение и история), системный промпт не считается"""
+    router = ModelRouter(TIERS, {}, max_tokens=1000)
+
+    short = router.route(_messages("hi"))
+    assert (short.model, short.max_tokens, short.tier) == ("cheap", 200, 0)
+
+    # Короткий вопрос с длинной историей уже не помещается в дешевую ступень
+    assert router.route(_messages("hi", history=3)).model == "mid"
+    assert router.route(_messages("x" * 4000)).model == "large"
+    assert router.route(_messages("x" * 4000)).max_tokens == 1000
+    assert router.stats() == {"routed": {"cheap": 1, "mid": 1, "large": 2}, "escalations": 0}
+
+
+def test_admin_mode_min_tier():
+    """Тест: admin-режим начинается с admin_min_tier"""
+    router = ModelRouter(TIERS, {}, max_tokens=1000, admin_min_tier=1)
+
+    assert router.route(_messages("hi"), "normal").model == "cheap"
+    assert router.route(_messages("hi"), "admin").model == "mid"
+
+    with pytest.raises(ValueError):
+        ModelRouter(TIERS, {}, max_tokens=1000, admin_min_tier=3)
+
+
+def test_unhealthy_model_escalates():
+    """Тест: деградировавшая или медленная модель пропускается"""
+    cheap = ModelHealth(failure_threshold=1)
+    health = {"cheap": cheap}
+    router = ModelRouter(TIERS, health, max_tokens=1000, latency_slo=2.0, latency_min_samples=3)
+
+    cheap.record_failure()
+    assert router.route(_messages("hi")).model == "mid"
+
+    for _ in range(3):
+        cheap.record_success(5.0)
+    assert router.route(_messages("hi")).model == "mid"
+
+    for _ in range(100):
+        cheap.record_success(0.5)
+    assert router.route(_messages("hi")).model == "cheap"
+    assert router.escalations == 2
+
+
+def test_adaptive_max_tokens():
+    """Тест: лимит ответа пропорционален сообщению, в пределах min_response_tokens и лимита ступени"""
+    router = ModelRouter(
+        [ModelTier("large")], {}, max_tokens=1000, response_ratio=4, min_response_tokens=100
+    )
+
+    assert router.route(_messages("hi")).max_tokens == 100
+    assert router.route(_messages("x" * 400)).max_tokens == 400
+    assert router.route(_messages("x" * 4000)).max_tokens == 1000
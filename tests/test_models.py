@@ -0,0 +1,49 @@
+"""Тесты для модуля models"""
+
+from datetime import datetime
+
+import pytest
+
+from src.models import ConversationContext, LLMResponse, UserMessage
+
+
+def test_models_have_no_instance_dict():
+    """Тест: модели слотовые - у экземпляров нет __dict__"""
+    now = datetime.now()
+    message = UserMessage(1, "Hello", now)
+    response = LLMResponse("Hi", now, "gpt-3.5")
+    context = ConversationContext(1, [message], [response], "System")
+
+    for obj in (message, response, context):
+        assert not hasattr(obj, "__dict__")
+        with pytest.raises(AttributeError):
+            obj.unknown = 1  # type: ignore[attr-defined]
+
+
+def test_from_row_matches_constructor():
+    """Тест: from_row создает ту же запись, что и конструктор"""
+    now = datetime.now()
+
+    assert UserMessage.from_row(7, 1, "Hello", now, 5, False, 2) == UserMessage(
+        1, "Hello", now, id=7, token_count=2
+    )
+    assert LLMResponse.from_row(8, "Hi", now, "gpt-3.5", 2, False, 1) == LLMResponse(
+        "Hi", now, "gpt-3.5", id=8, token_count=1
+    )
+
+
+def test_from_row_keeps_stored_content_length():
+    """Тест: from_row не пересчитывает content_length"""
+    message = UserMessage.from_row(1, 1, "Hello", datetime.now(), 42)
+    assert message.content_length == 42
+
+
+def test_model_name_is_interned():
+    """Тест: имя модели интернируется - ответы разделяют одну строку"""
+    now = datetime.now()
+    name = "".join(["openai/", "gpt-4o"])
+
+    first = LLMResponse("a", now, name)
+    second = LLMResponse.from_row(None, "b", now, "".join(["openai/", "gpt-4o"]), 1)
+
+    assert first.model_used is second.model_used
@@ -0,0 +1,62 @@
+"""Тесты для RealStatCollector (метрики LLM)"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.api.real_stat_collector import RealStatCollector
+from src.db_history_storage import DatabaseHistoryStorage
+from src.models import LLMUsage
+from src.turn_history_storage import TurnHistoryStorage
+
+STORAGES = {"messages": DatabaseHistoryStorage, "turns": TurnHistoryStorage}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("history_storage", ["messages", "turns"])
+async def test_llm_metrics_from_storage_table(test_db_engine, history_storage):
+    """Тест: метрики LLM читаются из таблицы модели хранения (llm_responses или turns)"""
+    storage = STORAGES[history_storage](test_db_engine, max_history=10)
+    for latency in (100, 200, 300, 400):
+        await storage.add_message(123, "Hello", "System prompt")
+        usage = LLMUsage("m", prompt_tokens=10, completion_tokens=5, latency_ms=latency)
+        usage.first_token_ms = latency // 2
+        await storage.add_response(123, "Hi", "m", usage)
+    # Ответ без вызова API (кеш) не искажает перцентили
+    await storage.add_message(123, "Hello", "System prompt")
+    await storage.add_response(123, "Hi", "m")
+
+    collector = RealStatCollector(test_db_engine, history_storage=history_storage)
+    now = datetime.now() + timedelta(seconds=1)
+    async with test_db_engine.connect() as conn:
+        usage = await collector._llm_usage(conn, now - timedelta(days=1), now)
+        cards = await collector._generate_llm_metrics(
+            conn, "day", now, now - timedelta(days=1), now - timedelta(days=2)
+        )
+
+    assert usage["responses"] == 4
+    assert usage["p50"] == pytest.approx(250.0)
+    assert usage["p95"] == pytest.approx(385.0)
+    assert usage["p99"] == pytest.approx(397.0)
+    assert usage["ttft_p50"] == pytest.approx(125.0)
+    assert usage["tokens"] == 60
+    assert [card.title for card in cards] == [
+        "LLM Latency p50",
+        "LLM Latency p95",
+        "LLM Latency p99",
+        "Tokens Used",
+    ]
+    assert cards[-1].value == "60"
+
+
+@pytest.mark.asyncio
+async def test_llm_metrics_empty(test_db_engine):
+    """Тест: без ответов LLM карточки метрик не показываются"""
+    collector = RealStatCollector(test_db_engine)
+    now = datetime.now()
+    async with test_db_engine.connect() as conn:
+        cards = await collector._generate_llm_metrics(
+            conn, "day", now, now - timedelta(days=1), now - timedelta(days=2)
+        )
+
+    assert cards == []
@@ -0,0 +1,115 @@
+"""Тесты для модуля single_flight"""
+
+import asyncio
+
+import pytest
+
+from src.single_flight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_request():
+    """Тест: одновременные вызовы с одним ключом выполняют запрос один раз"""
+    flight: SingleFlight[str] = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def request() -> str:
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "result"
+
+    waiters = [asyncio.create_task(flight.run("key", request)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*waiters) == ["result"] * 5
+    assert calls == 1
+    assert flight.coalesced == 4
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_different_keys_run_separately():
+    """Тест: запросы с разными ключами не объединяются"""
+    flight: SingleFlight[str] = SingleFlight()
+
+    async def request(value: str) -> str:
+        await asyncio.sleep(0)
+        return value
+
+    results = await asyncio.gather(
+        flight.run("a", lambda: request("a")), flight.run("b", lambda: request("b"))
+    )
+
+    assert results == ["a", "b"]
+    assert flight.coalesced == 0
+
+
+@pytest.mark.asyncio
+async def test_exception_is_shared():
+    """Тест: исключение запроса получают все ожидающие вызовы"""
+    flight: SingleFlight[str] = SingleFlight()
+
+    async def failing() -> str:
+        await asyncio.sleep(0)
+        raise RuntimeError("upstream error")
+
+    results = await asyncio.gather(
+        flight.run("key", failing), flight.run("key", failing), return_exceptions=True
+    )
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_affect_others():
+    """Тест: отмена одного вызова не прерывает запрос для остальных"""
+    flight: SingleFlight[str] = SingleFlight()
+    release = asyncio.Event()
+
+    async def request() -> str:
+        await release.wait()
+        return "result"
+
+    first = asyncio.create_task(flight.run("key", request))
+    second = asyncio.create_task(flight.run("key", request))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await second == "result"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+
+@pytest.mark.asyncio
+async def test_request_cancelled_when_all_waiters_leave():
+    """Тест: запрос отменяется, когда его перестали ждать все вызовы"""
+    flight: SingleFlight[str] = SingleFlight()
+    cancelled = asyncio.Event()
+
+    async def request() -> str:
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "never"
+
+    waiter = asyncio.create_task(flight.run("key", request))
+    await asyncio.sleep(0)
+    waiter.cancel()
+
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+    assert len(flight) == 0
+
+    # Новый вызов с тем же ключом начинает запрос заново
+    async def fresh() -> str:
+        return "fresh"
+
+    assert await flight.run("key", fresh) == "fresh"
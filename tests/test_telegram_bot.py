@@ -3,11 +3,16 @@
 from unittest.mock import AsyncMock, MagicMock
 
 import pytest
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.types import Message, User
 
+from src.deadline import Deadline, DeadlineExceededError
+from src.llm_resilience import LLMUnavailableError
 from src.telegram_bot import (
     CLEAR_TEXT,
+    ERROR_MESSAGE_BUSY,
     ERROR_MESSAGE_GENERAL,
+    ERROR_MESSAGE_TIMEOUT,
     HELP_TEXT,
     MAX_MESSAGE_LENGTH,
     WELCOME_TEXT,
@@ -153,11 +158,35 @@ async def test_handle_message_success(telegram_bot, mock_message):
     await telegram_bot.handle_message(mock_message)
 
     # Проверяем, что сообщение обработано
-    telegram_bot.conversation_manager.process_message.assert_called_once_with(12345, "Hello bot")
+    telegram_bot.conversation_manager.process_message.assert_called_once_with(
+        12345, "Hello bot", None
+    )
     # Проверяем, что отправлен ответ
     mock_message.answer.assert_called_once_with("Test response from LLM")
 
 
+@pytest.mark.asyncio
+async def test_handle_message_merged(telegram_bot, mock_message):
+    """Тест: сообщение, объединенное с соседним ходом, не получает отдельного ответа"""
+    telegram_bot.conversation_manager.process_message.return_value = None
+    mock_message.text = "Hello bot"
+
+    await telegram_bot.handle_message(mock_message)
+
+    mock_message.answer.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_handle_message_empty_reply(telegram_bot, mock_message):
+    """Тест: пустой ответ LLM (без объединения сообщений) - пользователь получает ошибку"""
+    telegram_bot.conversation_manager.process_message.return_value = ""
+    mock_message.text = "Hello bot"
+
+    await telegram_bot.handle_message(mock_message)
+
+    mock_message.answer.assert_called_once_with(ERROR_MESSAGE_GENERAL)
+
+
 @pytest.mark.asyncio
 async def test_handle_message_error(telegram_bot, mock_message):
     """Тест: обработка ошибки при работе с ConversationManager"""
@@ -170,6 +199,31 @@ async def test_handle_message_error(telegram_bot, mock_message):
     mock_message.answer.assert_called_once_with(ERROR_MESSAGE_GENERAL)
 
 
+@pytest.mark.asyncio
+async def test_handle_message_busy(telegram_bot, mock_message):
+    """Тест: при недоступности LLM пользователь получает ответ о перегрузке"""
+    telegram_bot.conversation_manager.process_message.side_effect = LLMUnavailableError(5.0)
+
+    await telegram_bot.handle_message(mock_message)
+
+    mock_message.answer.assert_called_once_with(ERROR_MESSAGE_BUSY)
+
+
+@pytest.mark.asyncio
+async def test_handle_message_timeout(telegram_bot, mock_message):
+    """Тест: ход получает срок turn_timeout, по его истечении пользователь узнает о таймауте"""
+    telegram_bot.turn_timeout = 30.0
+    manager = telegram_bot.conversation_manager
+    manager.process_message.side_effect = DeadlineExceededError("ответ LLM")
+
+    await telegram_bot.handle_message(mock_message)
+
+    deadline = manager.process_message.call_args.args[2]
+    assert isinstance(deadline, Deadline)
+    assert 0 < deadline.remaining() <= 30.0
+    mock_message.answer.assert_called_once_with(ERROR_MESSAGE_TIMEOUT)
+
+
 class TestCmdRole:
     """Тесты для команды /role"""
 
@@ -240,3 +294,95 @@ class TestCmdRole:
         # Assert: проверяем, что не было ошибок при извлечении user_info
         # (метод _get_user_info должен вызваться внутри cmd_role)
         mock_message.answer.assert_called_once()
+
+
+def _chunks(*deltas: str):
+    """Асинхронный поток фрагментов ответа"""
+
+    async def stream(user_id: int, text: str, deadline=None):
+        for delta in deltas:
+            yield delta
+
+    return stream
+
+
+@pytest.mark.asyncio
+async def test_handle_message_streaming(telegram_bot, mock_message):
+    """Тест: потоковый ответ отправляется сразу и дописывается редактированием"""
+    reply = MagicMock()
+    reply.edit_text = AsyncMock()
+    mock_message.answer = AsyncMock(return_value=reply)
+    telegram_bot.stream_responses = True
+    telegram_bot.stream_edit_interval = 3600  # промежуточные правки подавляются
+    telegram_bot.conversation_manager.process_message_stream = _chunks("Hel", "lo", "!")
+
+    await telegram_bot.handle_message(mock_message)
+
+    mock_message.answer.assert_called_once_with("Hel")
+    reply.edit_text.assert_called_once_with("Hello!")
+
+
+@pytest.mark.asyncio
+async def test_handle_message_streaming_splits_long_reply(telegram_bot, mock_message):
+    """Тест: потоковый ответ длиннее лимита Telegram продолжается новым сообщением"""
+    from src.telegram_bot import TELEGRAM_MESSAGE_LIMIT
+
+    reply = MagicMock()
+    reply.edit_text = AsyncMock()
+    mock_message.answer = AsyncMock(return_value=reply)
+    telegram_bot.stream_responses = True
+    telegram_bot.stream_edit_interval = 0
+    telegram_bot.conversation_manager.process_message_stream = _chunks(
+        "a" * TELEGRAM_MESSAGE_LIMIT, "bb"
+    )
+
+    await telegram_bot.handle_message(mock_message)
+
+    assert [c.args[0] for c in mock_message.answer.call_args_list] == [
+        "a" * TELEGRAM_MESSAGE_LIMIT,
+        "bb",
+    ]
+    reply.edit_text.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_streaming_final_edit_waits_for_retry_after(telegram_bot, mock_message, monkeypatch):
+    """Тест: окончательная правка при TelegramRetryAfter повторяется после паузы"""
+    retry_after = TelegramRetryAfter(method=MagicMock(), message="Flood control", retry_after=2)
+    reply = MagicMock()
+    reply.edit_text = AsyncMock(side_effect=[retry_after, None])
+    mock_message.answer = AsyncMock(return_value=reply)
+    sleep = AsyncMock()
+    monkeypatch.setattr("src.telegram_bot.asyncio.sleep", sleep)
+    telegram_bot.stream_responses = True
+    telegram_bot.stream_edit_interval = 3600
+    telegram_bot.conversation_manager.process_message_stream = _chunks("Hel", "lo")
+
+    await telegram_bot.handle_message(mock_message)
+
+    sleep.assert_awaited_once_with(2)
+    assert [c.args[0] for c in reply.edit_text.call_args_list] == ["Hello", "Hello"]
+    mock_message.answer.assert_called_once_with("Hel")
+
+
+@pytest.mark.asyncio
+async def test_streaming_send_failure_closes_generator(telegram_bot, mock_message):
+    """Тест: при ошибке отправки поток ответа закрывается сразу (освобождает очередь)"""
+    closed = False
+
+    async def stream(user_id: int, text: str, deadline=None):
+        nonlocal closed
+        try:
+            yield "Hel"
+            yield "lo"
+        finally:
+            closed = True
+
+    mock_message.answer = AsyncMock(side_effect=[RuntimeError("network"), None])
+    telegram_bot.stream_responses = True
+    telegram_bot.conversation_manager.process_message_stream = stream
+
+    await telegram_bot.handle_message(mock_message)
+
+    assert closed
+    mock_message.answer.assert_called_with(ERROR_MESSAGE_GENERAL)
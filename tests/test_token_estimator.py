@@ -0,0 +1,14 @@
+"""Тесты для модуля token_estimator"""
+
+from src.token_estimator import CharTokenEstimator
+
+
+def test_char_estimator():
+    """Тест: Оценка токенов латиницы и кириллицы"""
+    estimator = CharTokenEstimator()
+
+    assert estimator.count("") == 0
+    assert estimator.count("a") == 1
+    assert estimator.count("abcdefgh") == 2
+    # Кириллица кодируется плотнее латиницы
+    assert estimator.count("привет") > estimator.count("privet")
@@ -0,0 +1,86 @@
+"""Тесты для модуля turn_history_storage"""
+
+import pytest
+from sqlalchemy import select
+
+from src.database import turns
+from src.models import LLMUsage
+from src.turn_history_storage import TurnHistoryStorage
+
+
+@pytest.mark.asyncio
+async def test_turn_holds_message_and_reply(test_db_engine):
+    """Тест: Сообщение и ответ хранятся в одной строке"""
+    storage = TurnHistoryStorage(test_db_engine)
+    context = await storage.add_message_and_get_context(123, "Hello", "System prompt")
+    usage = LLMUsage("gpt-3.5", prompt_tokens=40, completion_tokens=8, latency_ms=300)
+    await storage.add_response(123, "Hi there", "gpt-3.5", usage)
+
+    assert [m.text for m in context.messages] == ["Hello"]
+    async with test_db_engine.connect() as conn:
+        rows = (
+            await conn.execute(
+                select(
+                    turns.c.user_text, turns.c.response, turns.c.prompt_tokens, turns.c.latency_ms
+                )
+            )
+        ).all()
+    assert rows == [("Hello", "Hi there", 40, 300)]
+
+    context = await storage.get_context(123)
+    assert context is not None
+    assert context.system_prompt == "System prompt"
+    assert context.responses[0].model_used == "gpt-3.5"
+    assert context.responses[0].content_length == 8
+
+
+@pytest.mark.asyncio
+async def test_pairs_stay_aligned_after_failed_reply(test_db_engine):
+    """Тест: Ход без ответа (ошибка LLM) не смещает пары истории"""
+    storage = TurnHistoryStorage(test_db_engine)
+    await storage.add_message(123, "First", "p")
+    await storage.add_response(123, "Answer 1", "m")
+    await storage.add_message(123, "Lost", "p")  # LLM не ответил
+    await storage.add_message(123, "Third", "p")
+    await storage.add_response(123, "Answer 3", "m")
+    await storage.add_message(123, "Current", "p")
+
+    context = await storage.get_context(123)
+    assert context is not None
+    assert [m.text for m in context.messages] == ["First", "Third", "Current"]
+    assert [r.content for r in context.responses] == ["Answer 1", "Answer 3"]
+
+
+@pytest.mark.asyncio
+async def test_response_without_pending_turn_is_ignored(test_db_engine):
+    """Тест: Ответ без ожидающего хода не перезаписывает предыдущий ответ"""
+    storage = TurnHistoryStorage(test_db_engine)
+    await storage.add_response(999, "Orphan", "m")
+    await storage.add_message(123, "Hello", "p")
+    await storage.add_response(123, "Hi", "m")
+    await storage.add_response(123, "Duplicate", "m")
+
+    context = await storage.get_context(123)
+    assert context is not None
+    assert [r.content for r in context.responses] == ["Hi"]
+    assert await storage.get_context(999) is None
+
+
+@pytest.mark.asyncio
+async def test_turn_window_trim_and_clear(test_db_engine):
+    """Тест: Окно ходов обрезается до max_history, очистка удаляет все ходы"""
+    storage = TurnHistoryStorage(test_db_engine, max_history=3)
+    for i in range(5):
+        await storage.add_message(123, f"Message {i}", "p")
+        await storage.add_response(123, f"Response {i}", "m")
+
+    context = await storage.get_context(123)
+    assert context is not None
+    assert [m.text for m in context.messages] == ["Message 2", "Message 3", "Message 4"]
+    assert [r.content for r in context.responses] == ["Response 2", "Response 3", "Response 4"]
+
+    await storage.clear(123)
+    context = await storage.get_context(123)
+    assert context is not None
+    assert context.messages == []
+    assert context.responses == []
@@ -0,0 +1,76 @@
+"""Тесты для модуля user_mailbox"""
+
+import asyncio
+
+import pytest
+
+from src.user_mailbox import UserMailbox
+
+
+@pytest.mark.asyncio
+async def test_turns_of_one_user_are_serialized():
+    """Тест: Ходы одного пользователя выполняются по очереди, разных - параллельно"""
+    mailbox = UserMailbox()
+    log: list[str] = []
+
+    async def turn(text: str) -> str:
+        log.append(f"start {text}")
+        await asyncio.sleep(0.01)
+        log.append(f"end {text}")
+        return text
+
+    results = await asyncio.gather(
+        mailbox.submit(1, "a", turn), mailbox.submit(1, "b", turn), mailbox.submit(2, "c", turn)
+    )
+
+    assert results == ["a", "b", "c"]
+    assert log.index("end a") < log.index("start b")
+    assert log.index("start c") < log.index("end a")
+    assert mailbox._locks == {}
+
+
+@pytest.mark.asyncio
+async def test_coalesce_messages_waiting_for_turn():
+    """Тест: Сообщения, ожидающие хода, объединяются в один ход"""
+    mailbox = UserMailbox(coalesce=True, max_batch=2)
+    release = asyncio.Event()
+    turns: list[str] = []
+
+    async def turn(text: str) -> str:
+        turns.append(text)
+        await release.wait()
+        return f"answer to {text}"
+
+    tasks = [asyncio.create_task(mailbox.submit(1, text, turn)) for text in "abcd"]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*tasks)
+
+    assert turns == ["a", "b\n\nc", "d"]
+    assert results == ["answer to a", "answer to b\n\nc", None, "answer to d"]
+    assert mailbox.merged_messages == 1
+    assert mailbox._waiting == {}
+
+
+@pytest.mark.asyncio
+async def test_cancelled_message_is_not_merged():
+    """Тест: Отмененное до своего хода сообщение не попадает в объединенный ход"""
+    mailbox = UserMailbox(coalesce=True)
+    release = asyncio.Event()
+    turns: list[str] = []
+
+    async def turn(text: str) -> str:
+        turns.append(text)
+        await release.wait()
+        return text
+
+    first = asyncio.create_task(mailbox.submit(1, "a", turn))
+    await asyncio.sleep(0)
+    cancelled = asyncio.create_task(mailbox.submit(1, "b", turn))
+    kept = asyncio.create_task(mailbox.submit(1, "c", turn))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    release.set()
+    await asyncio.gather(first, kept, cancelled, return_exceptions=True)
+
+    assert turns == ["a", "c"]
@@ -0,0 +1,139 @@
+"""Тесты для модуля write_behind_buffer"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from src.models import LLMResponse, UserMessage
+from src.write_behind_buffer import WriteBehindBuffer
+
+
+class RecordingSink:
+    """Приемник пачек для проверки сброса"""
+
+    def __init__(self, fail_times: int = 0) -> None:
+        self.batches: list[list] = []
+        self.fail_times = fail_times
+
+    async def __call__(self, batch: list) -> None:
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("DB unavailable")
+        self.batches.append(list(batch))
+
+
+def make_message(text: str) -> UserMessage:
+    return UserMessage(user_id=1, text=text, timestamp=datetime.now())
+
+
+@pytest.mark.asyncio
+async def test_flush_by_batch_size():
+    """Тест: Заполненная пачка сбрасывается без ожидания таймера"""
+    sink = RecordingSink()
+    buffer = WriteBehindBuffer(sink, batch_size=2, flush_interval=60)
+
+    await buffer.add(1, "prompt", make_message("a"))
+    await buffer.add(1, "prompt", make_message("b"))
+    await asyncio.sleep(0.01)
+
+    assert len(sink.batches) == 1
+    assert len(sink.batches[0]) == 2
+    assert len(buffer) == 0
+    await buffer.close()
+
+
+@pytest.mark.asyncio
+async def test_flush_by_interval():
+    """Тест: Неполная пачка сбрасывается по таймеру"""
+    sink = RecordingSink()
+    buffer = WriteBehindBuffer(sink, batch_size=100, flush_interval=0.01)
+
+    await buffer.add(1, "prompt", make_message("a"))
+    await asyncio.sleep(0.05)
+
+    assert len(sink.batches) == 1
+    await buffer.close()
+
+
+@pytest.mark.asyncio
+async def test_pending_visible_until_flushed():
+    """Тест: Несброшенные записи доступны через pending_for"""
+    sink = RecordingSink()
+    buffer = WriteBehindBuffer(sink, batch_size=100, flush_interval=60)
+    response = LLMResponse(content="hi", timestamp=datetime.now(), model_used="m")
+
+    await buffer.add(1, "prompt", make_message("a"))
+    await buffer.add(2, "prompt", response)
+
+    assert [item[2] for item in buffer.pending_for(2)] == [response]
+    await buffer.flush()
+    assert buffer.pending_for(2) == []
+    await buffer.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_records_and_close_drains():
+    """Тест: Ошибка записи не теряет записи, close дожидается сброса"""
+    sink = RecordingSink(fail_times=1)
+    buffer = WriteBehindBuffer(sink, batch_size=100, flush_interval=60)
+    await buffer.add(1, "prompt", make_message("a"))
+
+    with pytest.raises(RuntimeError):
+        await buffer.flush()
+    assert len(buffer) == 1
+
+    await buffer.close()
+    assert len(sink.batches) == 1
+    assert buffer.flushed_records == 1
+
+    with pytest.raises(RuntimeError):
+        await buffer.add(1, "prompt", make_message("b"))
+
+
+@pytest.mark.asyncio
+async def test_close_waits_for_inflight_flush_without_duplicates():
+    """Тест: close во время сброса дожидается его, а не отменяет - пачка не пишется дважды"""
+    started = asyncio.Event()
+    release = asyncio.Event()
+    batches: list[list] = []
+
+    async def blocked_sink(batch: list) -> None:
+        # Коммит уже выполнен, но вызов еще не вернул управление
+        batches.append(list(batch))
+        started.set()
+        await release.wait()
+
+    buffer = WriteBehindBuffer(blocked_sink, batch_size=100, flush_interval=0.01)
+    await buffer.add(1, "prompt", make_message("a"))
+    await started.wait()
+
+    closing = asyncio.create_task(buffer.close())
+    await asyncio.sleep(0.01)
+    assert not closing.done()
+
+    release.set()
+    await closing
+
+    assert [[item[2].text for item in batch] for batch in batches] == [["a"]]
+    assert buffer.flushed_records == 1
+
+
+@pytest.mark.asyncio
+async def test_poison_batch_dropped_after_retries():
+    """Тест: Пачка, которую не удается записать, отбрасывается после max_flush_retries попыток"""
+    sink = RecordingSink(fail_times=3)
+    buffer = WriteBehindBuffer(sink, batch_size=100, flush_interval=0.001, max_flush_retries=3)
+
+    await buffer.add(1, "prompt", make_message("poison"))
+    for _ in range(100):
+        if buffer.dropped_records:
+            break
+        await asyncio.sleep(0.005)
+
+    assert buffer.dropped_records == 1
+    assert len(buffer) == 0
+
+    await buffer.add(1, "prompt", make_message("next"))
+    await buffer.close()
+    assert [[item[2].text for item in batch] for batch in sink.batches] == [["next"]]